@@ -268,3 +268,97 @@ class Book:
         res += "\n"
         res += str(summary)
         return res
+
+
+class DailySummaryRecorder:
+    """Columnar record of daily Book summaries
+
+    Contract rows are only stored when they change, the daily_cid_summary frame with every universe
+    contract for every day is rebuilt on request by carrying rows forward. Names are stored once per contract.
+    """
+    CONTRACT_COLUMNS = ['position', 'val', 'exe_qty', 'exe_val', 'mark_pnl', 'realized_pnl']
+    SUMMARY_COLUMNS = ['capital', 'pos_value', 'value', 'exe_qty', 'exe_val', 'pos_cost', 'mark_pnl',
+                       'unrealized_pnl', 'fees']
+
+    def __init__(self, capacity: int = 1024):
+        self.dates: t.List[t.Any] = []
+        self.universe_sizes: t.List[int] = []
+        self.summaries: t.List[np.ndarray] = []
+
+        self.cids = np.array([], dtype=int)
+        self.names: t.List[str] = []
+        self.last_values = np.zeros((0, len(DailySummaryRecorder.CONTRACT_COLUMNS)))
+
+        # changed contract rows, the first num_rows are valid
+        self.num_rows = 0
+        self.row_days = np.zeros(capacity, dtype=np.int64)
+        self.row_contracts = np.zeros(capacity, dtype=np.int64)
+        self.row_values = np.zeros((capacity, len(DailySummaryRecorder.CONTRACT_COLUMNS)))
+
+    @staticmethod
+    def contract_values(book: Book) -> np.ndarray:
+        """Returns (contract, column) array of Book.get_contract_summary values"""
+        return np.stack([
+            book.position, book.mark_value, book.exe_qty, book.exe_value,
+            book.mark_pnl, book.mark_pnl - book.unrealized_pnl,
+        ], axis=1).astype(np.float64)
+
+    def record(self, date: t.Any, book: Book) -> pd.DataFrame:
+        """Records book state for date, returns the book summary for date"""
+        day = len(self.dates)
+        size = book.universe.size
+        self.dates.append(date)
+        self.universe_sizes.append(size)
+
+        summary = book.get_summary()
+        self.summaries.append(summary[DailySummaryRecorder.SUMMARY_COLUMNS].to_numpy()[0])
+
+        old_size = len(self.cids)
+        if size > old_size:
+            self.cids = book.universe.cids.copy()
+            self.names = self.names + book.universe.names[old_size:]
+            self.last_values = np.pad(self.last_values, ((0, size - old_size), (0, 0)))
+
+        values = DailySummaryRecorder.contract_values(book)
+        same = (values == self.last_values) | (np.isnan(values) & np.isnan(self.last_values))
+        same[old_size:] = False
+        changed = np.nonzero(~same.all(axis=1))[0]
+        self.last_values[changed] = values[changed]
+
+        end = self.num_rows + len(changed)
+        if end > len(self.row_days):
+            capacity = max(end, 2 * len(self.row_days))
+            self.row_days = np.resize(self.row_days, capacity)
+            self.row_contracts = np.resize(self.row_contracts, capacity)
+            self.row_values = np.resize(self.row_values, (capacity, self.row_values.shape[1]))
+        self.row_days[self.num_rows:end] = day
+        self.row_contracts[self.num_rows:end] = changed
+        self.row_values[self.num_rows:end] = values[changed]
+        self.num_rows = end
+
+        summary.index = pd.Index([date], name='date')
+        return summary
+
+    def daily_summary(self) -> pd.DataFrame:
+        summaries = np.array(self.summaries).reshape(len(self.dates), len(DailySummaryRecorder.SUMMARY_COLUMNS))
+        return pd.DataFrame(summaries, columns=DailySummaryRecorder.SUMMARY_COLUMNS,
+                            index=pd.Index(self.dates, name='date'))
+
+    def daily_cid_summary(self) -> pd.DataFrame:
+        """Returns book contract summaries indexed by (date, cid), same as concatenated get_contract_summary"""
+        ndays, ncontracts = len(self.dates), len(self.cids)
+        # index of last changed row for each (day, contract), carried forward over days
+        last_row = np.full((ndays, ncontracts), -1, dtype=np.int64)
+        last_row[self.row_days[:self.num_rows], self.row_contracts[:self.num_rows]] = np.arange(self.num_rows)
+        last_row = np.maximum.accumulate(last_row, axis=0)
+
+        in_universe = np.arange(ncontracts)[None, :] < np.array(self.universe_sizes, dtype=np.int64)[:, None]
+        day_idx, contract_idx = np.nonzero(in_universe)
+        values = self.row_values[last_row[day_idx, contract_idx]]
+
+        cid_summary = pd.DataFrame(values, columns=DailySummaryRecorder.CONTRACT_COLUMNS)
+        cid_summary['name'] = np.array(self.names, dtype=object)[contract_idx]
+        cid_summary.index = pd.MultiIndex.from_arrays(
+            [np.array(self.dates, dtype=object)[day_idx], self.cids[contract_idx]], names=['date', 'cid']
+        )
+        return cid_summary
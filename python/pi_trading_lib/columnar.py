@@ -0,0 +1,68 @@
+import datetime
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+
+def _encode_values(values: np.ndarray) -> t.Dict[str, np.ndarray]:
+    if values.dtype != object:
+        return {'values': values}
+    non_null = [val for val in values if val is not None and val == val]
+    if len(non_null) > 0 and all(isinstance(val, datetime.date) and not isinstance(val, datetime.datetime)
+                                 for val in non_null):
+        # same as parse_dates for csv tables
+        return {'values': pd.to_datetime(values).to_numpy()}
+    if all(isinstance(val, str) for val in non_null):
+        null = np.array([not isinstance(val, str) for val in values], dtype=bool)
+        return {'values': np.array(['' if is_null else val for val, is_null in zip(values, null)], dtype=str),
+                'null': null}
+    return {'values': values}
+
+
+def _decode_values(npz, key: str) -> np.ndarray:
+    values: np.ndarray = npz[f'{key}.values']
+    if f'{key}.null' in npz:
+        values = values.astype(object)
+        values[npz[f'{key}.null']] = np.nan
+    return values
+
+
+def write_table(path: str, df: pd.DataFrame, meta: t.Optional[t.Dict[str, np.ndarray]] = None):
+    """Writes df to an uncompressed npz file with one array per index level and column
+
+    meta arrays are written to the same file, see read_meta.
+    """
+    arrays: t.Dict[str, t.Any] = {
+        'index_names': np.array([str(name) for name in df.index.names], dtype=str),
+        'columns': np.array([str(col) for col in df.columns], dtype=str),
+    }
+    for key, values in (meta or {}).items():
+        arrays[f'meta.{key}'] = values
+    for i in range(df.index.nlevels):
+        for name, values in _encode_values(df.index.get_level_values(i).to_numpy()).items():
+            arrays[f'index{i}.{name}'] = values
+    for i in range(len(df.columns)):
+        for name, values in _encode_values(df.iloc[:, i].to_numpy()).items():
+            arrays[f'column{i}.{name}'] = values
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def read_table(path: str) -> pd.DataFrame:
+    with np.load(path, allow_pickle=True) as npz:
+        index_names = [None if name == 'None' else name for name in npz['index_names'].tolist()]
+        index_levels = [_decode_values(npz, f'index{i}') for i in range(len(index_names))]
+        if len(index_levels) == 1:
+            index = pd.Index(index_levels[0], name=index_names[0])
+        else:
+            index = pd.MultiIndex.from_arrays(index_levels, names=index_names)
+        columns = npz['columns'].tolist()
+        data = {col: _decode_values(npz, f'column{i}') for i, col in enumerate(columns)}
+    return pd.DataFrame(data, index=index, columns=columns)
+
+
+def read_meta(path: str, key: str) -> t.Optional[np.ndarray]:
+    """Returns the meta array key written with the table, or None if there is none"""
+    with np.load(path, allow_pickle=True) as npz:
+        return npz[f'meta.{key}'] if f'meta.{key}' in npz else None
@@ -1,7 +1,8 @@
 import os
 import sys
-import functools
+import datetime
 import sqlite3
+import threading
 import typing as t
 
 import pi_trading_lib.data.data_archive
@@ -10,6 +11,9 @@ import pi_trading_lib.data.data_archive
 MIGRATIONS = [
     '1_initialize.sql',
     '2_resolution.sql',
+    '3_resolution_inference.sql',
+    '4_update_state.sql',
+    '5_daily_history_date_index.sql',
 ]
 MIGRATION_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'db')
 
@@ -18,14 +22,32 @@ def to_sql_list(il: t.List[t.Any]):
     return '(' + ', '.join([str(item) for item in il]) + ')'
 
 
-@functools.lru_cache
+# sqlite connections can only be used by the thread that created them
+_thread_connections = threading.local()
+
+
 def get_contract_db():
-    db_uri = pi_trading_lib.data.data_archive.get_data_file('contract_db')
-    connection = sqlite3.connect(db_uri)
-    connection.execute('PRAGMA foreign_keys = ON')
+    """Returns contract db connection of the current thread"""
+    connection = getattr(_thread_connections, 'connection', None)
+    if connection is None:
+        db_uri = pi_trading_lib.data.data_archive.get_data_file('contract_db')
+        connection = sqlite3.connect(db_uri)
+        connection.execute('PRAGMA foreign_keys = ON')
+        _thread_connections.connection = connection
     return connection
 
 
+def get_last_update_date(name: str) -> t.Optional[datetime.date]:
+    """Returns last date processed by incremental update job name"""
+    res = get_contract_db().cursor().execute('SELECT date FROM update_state WHERE name = ?', (name,)).fetchone()
+    return datetime.date.fromisoformat(res[0]) if res is not None else None
+
+
+def set_last_update_date(name: str, date: datetime.date):
+    """Records date as processed by update job name, callers own the transaction"""
+    get_contract_db().execute('INSERT OR REPLACE INTO update_state VALUES (?, ?)', (name, date.isoformat()))
+
+
 def initialize_db():
     db = get_contract_db()
 
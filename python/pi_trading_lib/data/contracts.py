@@ -97,6 +97,9 @@ def is_binary_contract(ids: t.List[int]) -> t.Dict[int, bool]:
 
 # ========================= Updates =========================
 
+# Update functions below don't commit, callers are expected to wrap them in a transaction
+# e.g. `with contract_db.get_contract_db(): ...`
+
 @pi_trading_lib.timers.timer
 def add_contracts(contracts):
     contract_rows = [
@@ -105,8 +108,7 @@ def add_contracts(contracts):
         for contract in contracts
     ]
     db = contract_db.get_contract_db()
-    with db:
-        db.executemany('INSERT INTO contract VALUES (?, ?, ?, ?, ?, ?)', contract_rows)
+    db.executemany('INSERT INTO contract VALUES (?, ?, ?, ?, ?, ?)', contract_rows)
 
 
 @pi_trading_lib.timers.timer
@@ -130,11 +132,10 @@ def update_contract_dates(contract_ids: t.List[int], alive_date: datetime.date):
     results = contract_db.get_contract_db().cursor().execute(query).fetchall()
     begin_date_update_ids = [result[0] for result in results]
     print(f'Setting or extending begin date for {len(results)} contracts')
-    with contract_db.get_contract_db() as db:
-        db.execute(
-            f"""UPDATE contract SET begin_date = '{alive_date_str}'
-                WHERE id IN {contract_db.to_sql_list(begin_date_update_ids)}
-            """)
+    contract_db.get_contract_db().execute(
+        f"""UPDATE contract SET begin_date = '{alive_date_str}'
+            WHERE id IN {contract_db.to_sql_list(begin_date_update_ids)}
+        """)
 
     # Step 2: Extend last_update_date
     query = f"""
@@ -145,11 +146,10 @@ def update_contract_dates(contract_ids: t.List[int], alive_date: datetime.date):
     results = contract_db.get_contract_db().cursor().execute(query).fetchall()
     last_update_date_update_ids = [result[0] for result in results]
     print(f'Extending last update date for {len(results)} contracts')
-    with contract_db.get_contract_db() as db:
-        db.execute(
-            f"""UPDATE contract SET last_update_date = '{alive_date_str}'
-                WHERE id IN {contract_db.to_sql_list(last_update_date_update_ids)}
-            """)
+    contract_db.get_contract_db().execute(
+        f"""UPDATE contract SET last_update_date = '{alive_date_str}'
+            WHERE id IN {contract_db.to_sql_list(last_update_date_update_ids)}
+        """)
 
     # Step 3: Reset end date if actually alive
     query = """
@@ -159,11 +159,10 @@ def update_contract_dates(contract_ids: t.List[int], alive_date: datetime.date):
     results = contract_db.get_contract_db().cursor().execute(query).fetchall()
     end_date_update_ids = [result[0] for result in results]
     print(f'Resetting end date for {len(results)} contracts')
-    with contract_db.get_contract_db() as db:
-        db.execute(
-            f"""UPDATE contract SET end_date = NULL
-                WHERE id IN {contract_db.to_sql_list(end_date_update_ids)}
-            """)
+    contract_db.get_contract_db().execute(
+        f"""UPDATE contract SET end_date = NULL
+            WHERE id IN {contract_db.to_sql_list(end_date_update_ids)}
+        """)
 
     # Step 4: Set end date for contracts missing data.
     query = f"""
@@ -175,23 +174,25 @@ def update_contract_dates(contract_ids: t.List[int], alive_date: datetime.date):
     results = contract_db.get_contract_db().cursor().execute(query).fetchall()
     end_date_update_ids = [result[0] for result in results]
     print(f'Setting end date for {len(results)} contracts')
-    with contract_db.get_contract_db() as db:
-        db.execute(
-            f"""UPDATE contract SET end_date = last_update_date
-                WHERE id IN {contract_db.to_sql_list(end_date_update_ids)}
-            """)
+    contract_db.get_contract_db().execute(
+        f"""UPDATE contract SET end_date = last_update_date
+            WHERE id IN {contract_db.to_sql_list(end_date_update_ids)}
+        """)
 
 
 @pi_trading_lib.timers.timer
 def add_markets(markets):
     market_rows = [(market['id'], market['name']) for market in markets]
     db = contract_db.get_contract_db()
-    with db:
-        db.executemany('INSERT INTO market VALUES (?, ?)', (market_rows))
+    db.executemany('INSERT INTO market VALUES (?, ?)', (market_rows))
 
 
 @pi_trading_lib.timers.timer
-def update_contract_info(date):
+def parse_contract_info(date) -> t.Tuple[t.Dict[int, t.Dict], t.Dict[int, t.Dict]]:
+    """Returns contracts and markets seen in the raw archive for date
+
+    Only reads the raw archive, so this is safe to run in worker processes.
+    """
     daily_contracts: t.Dict[int, t.Dict] = {}
     daily_markets: t.Dict[int, t.Dict] = {}
     market_data_file = pi_trading_lib.data.data_archive.get_data_file(
@@ -216,7 +217,11 @@ def update_contract_info(date):
                         'id': market_id,
                         'name': market['name']
                     }
+    return daily_contracts, daily_markets
+
 
+@pi_trading_lib.timers.timer
+def apply_contract_info(date, daily_contracts: t.Dict[int, t.Dict], daily_markets: t.Dict[int, t.Dict]):
     db_contracts = get_contracts(list(daily_contracts.keys()))
     db_markets = get_markets(list(daily_markets.keys()))
     missing_markets = set(daily_markets.keys()) - set(db_markets.keys())
@@ -233,6 +238,12 @@ def update_contract_info(date):
     update_contract_dates(list(daily_contracts.keys()), date)
 
 
+def update_contract_info(date):
+    daily_contracts, daily_markets = parse_contract_info(date)
+    with contract_db.get_contract_db():
+        apply_contract_info(date, daily_contracts, daily_markets)
+
+
 def main():
     import pandas as pd
     import pi_trading_lib.df_annotators
@@ -0,0 +1,5 @@
+CREATE TABLE resolution_inference (
+    contract_id INTEGER PRIMARY KEY,
+    end_date TEXT NOT NULL,
+    FOREIGN KEY(contract_id) REFERENCES contract(id)
+);
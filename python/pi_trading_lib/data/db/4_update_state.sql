@@ -0,0 +1,4 @@
+CREATE TABLE update_state (
+    name TEXT PRIMARY KEY,
+    date TEXT NOT NULL
+);
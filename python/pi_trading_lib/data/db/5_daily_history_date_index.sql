@@ -0,0 +1 @@
+CREATE INDEX daily_history_type_date ON daily_history (value_type, date, contract_id, value);
@@ -1,97 +1,218 @@
 import typing as t
+import concurrent.futures
 import datetime
 import os
 import os.path
 import csv
+import http.client
 import logging
-import urllib.request
+import threading
+import time
+import urllib.parse
 import io
 import functools
 import json
+import numpy as np
 import pandas as pd  # type: ignore
 
 import pi_trading_lib
+import pi_trading_lib.columnar as columnar
 import pi_trading_lib.datetime_ext as datetime_ext
 import pi_trading_lib.fs as fs
-import pi_trading_lib.decorators
 import pi_trading_lib.states as states
+import pi_trading_lib.timers
+import pi_trading_lib.work_dir as work_dir
 import pi_trading_lib.data.data_archive as data_archive
 
 CONFIG_FILE = os.path.join(pi_trading_lib.get_package_dir(), 'config/fivethirtyeight.csv')
 START_DATE = '20200816'
 
 
-def archive_csv(location, save_location, date_col, date_format, date, name) -> None:
-    with urllib.request.urlopen(location) as f:
-        reader = csv.DictReader(io.TextIOWrapper(f, encoding='utf-8'))
+RETRIES = 3
+RETRY_BACKOFF = 1.0
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# errors of idle keep-alive connections closed by the server
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
 
-        assert reader.fieldnames is not None
-        assert date_col in reader.fieldnames
 
-        rows_written = 0
-        with fs.safe_open(save_location, 'w+', newline='') as save_f:
-            writer = csv.DictWriter(save_f, fieldnames=reader.fieldnames)
-            writer.writeheader()
-            for row in reader:
-                # 538 file may contain rows for previous dates
-                model_date = datetime.datetime.strptime(row[date_col], date_format).date()
-                if model_date == date:
-                    writer.writerow(row)
-                    rows_written += 1
-        if rows_written == 0:
-            logging.warn("No rows found for {name} for {date}".format(name=name, date=date))
-
-
-def archive_sim_2020_json(location, save_location) -> None:
-    with urllib.request.urlopen(location) as f:
-        sim_data = json.load(io.TextIOWrapper(f, encoding='utf-8'))
-        states = sim_data['states']
-        maps = sim_data['maps']
-        columns = ['winner', 'trump_ev', 'biden_ev'] + states
+class Downloader:
+    """Thread safe http(s) downloader, keeping idle keep-alive connections per host for reuse"""
+
+    def __init__(self, retries: int = RETRIES, backoff: float = RETRY_BACKOFF, timeout: float = 60.0,
+                 max_redirects: int = MAX_REDIRECTS):
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._lock = threading.Lock()
+        self._idle: t.Dict[t.Tuple[str, str], t.List[http.client.HTTPConnection]] = {}
+
+    def _checkout(self, url: urllib.parse.SplitResult,
+                  fresh: bool = False) -> t.Tuple[http.client.HTTPConnection, bool]:
+        """Returns an idle connection to the host of url, or a new one if fresh, and whether it was reused"""
+        if not fresh:
+            with self._lock:
+                idle = self._idle.get((url.scheme, url.netloc))
+                if idle:
+                    return idle.pop(), True
+        connection_cls = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        return connection_cls(url.netloc, timeout=self.timeout), False
+
+    def _checkin(self, url: urllib.parse.SplitResult, connection: http.client.HTTPConnection):
+        with self._lock:
+            self._idle.setdefault((url.scheme, url.netloc), []).append(connection)
+
+    def _request(self, location: str) -> t.Tuple[int, t.Optional[str], bytes]:
+        """Returns status, Location header and body of a single GET, retrying connection and server errors
+
+        A reused connection the server closed while idle is retried right away on a fresh connection,
+        without counting as a retry.
+        """
+        url = urllib.parse.urlsplit(location)
+        path = url.path + ('?' + url.query if url.query else '')
+        attempt = 0
+        fresh = False
+        while True:
+            connection, reused = self._checkout(url, fresh)
+            response: t.Optional[http.client.HTTPResponse] = None
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                # connection state is unknown after errors
+                connection.close()
+                if reused and response is None and isinstance(e, STALE_CONNECTION_ERRORS):
+                    logging.debug(f'Reconnecting for {location} after stale connection error: {e}')
+                    fresh = True
+                    continue
+                error: Exception = e
+            else:
+                self._checkin(url, connection)
+                if response.status < 500:
+                    return response.status, response.getheader('Location'), body
+                error = IOError(f'GET {location} returned {response.status}')
+            if attempt >= self.retries:
+                raise error
+            logging.warning(f'Retrying {location} after error: {error}')
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+            fresh = False
+
+    def get(self, location: str) -> bytes:
+        for _ in range(self.max_redirects + 1):
+            status, redirect, body = self._request(location)
+            if status == 200:
+                return body
+            if status not in REDIRECT_STATUSES or redirect is None:
+                raise IOError(f'GET {location} returned {status}')
+            # Location may be relative or on another host
+            location = urllib.parse.urljoin(location, redirect)
+        raise IOError(f'GET {location} exceeded {self.max_redirects} redirects')
+
 
+def archive_csv(data: bytes, save_locations: t.Dict[datetime.date, str], date_col: str, date_format: str,
+                name: str) -> None:
+    """Splits downloaded csv rows by date into save_locations, in a single pass"""
+    reader = csv.reader(io.StringIO(data.decode('utf-8'), newline=''))
+    fieldnames = next(reader)
+    assert date_col in fieldnames
+    date_idx = fieldnames.index(date_col)
+
+    # 538 files contain rows for all previous dates, only distinct date strings are parsed
+    parsed_dates: t.Dict[str, datetime.date] = {}
+    date_rows: t.Dict[datetime.date, t.List[t.List[str]]] = {date: [] for date in save_locations}
+    for row in reader:
+        date_str = row[date_idx]
+        if date_str not in parsed_dates:
+            parsed_dates[date_str] = datetime.datetime.strptime(date_str, date_format).date()
+        rows = date_rows.get(parsed_dates[date_str])
+        if rows is not None:
+            rows.append(row)
+
+    for date, save_location in save_locations.items():
         with fs.safe_open(save_location, 'w+', newline='') as save_f:
             writer = csv.writer(save_f)
-            writer.writerow(columns)
-            for map_data in maps:
-                writer.writerow(map_data)
+            writer.writerow(fieldnames)
+            writer.writerows(date_rows[date])
+        if len(date_rows[date]) == 0:
+            logging.warning("No rows found for {name} for {date}".format(name=name, date=date))
+
+
+def archive_sim_2020_json(data: bytes, save_location: str) -> None:
+    sim_data = json.loads(data.decode('utf-8'))
+    states = sim_data['states']
+    maps = sim_data['maps']
+    columns = ['winner', 'trump_ev', 'biden_ev'] + states
+
+    with fs.safe_open(save_location, 'w+', newline='') as save_f:
+        writer = csv.writer(save_f)
+        writer.writerow(columns)
+        writer.writerows(maps)
 
 
 # Archiving
-def archive_data(date: datetime.date) -> None:
+@functools.lru_cache()
+def _get_source_configs() -> t.List[t.Dict[str, str]]:
     with open(CONFIG_FILE, 'r') as data_config_f:
-        reader = csv.DictReader(data_config_f)
-        for row in reader:
-            name = row['name']
-            begin_date, end_date = row['begin_date'], row['end_date']
-            location = row['location']
-
-            if (
-                    (begin_date and date < datetime_ext.from_str(begin_date)) or
-                    (end_date and date > datetime_ext.from_str(end_date))
-               ):
-                logging.info("Out of date range, ignoring data source {name}".format(name=name))
-                continue
-
-            save_location = data_archive.get_data_file(name, {'date': datetime_ext.to_str(date)})
-            if os.path.exists(save_location):
-                logging.info(f"Data already exists: {save_location}")
-                continue
-
-            if location.endswith('.csv'):
-                date_col, date_format = row['date_col'], row['date_format']
-                archive_csv(location, save_location, date_col, date_format, date, name)
-            elif name == 'pres_sim_2020':
-                archive_sim_2020_json(location, save_location)
-            else:
-                assert False, f"Archiving logic not implemented for {name}"
+        return list(csv.DictReader(data_config_f))
+
+
+def _archive_source(source: t.Dict[str, str], begin_date: datetime.date, end_date: datetime.date,
+                    downloader: Downloader) -> None:
+    name, location = source['name'], source['location']
+    if source['begin_date']:
+        begin_date = max(begin_date, datetime_ext.from_str(source['begin_date']))
+    if source['end_date']:
+        end_date = min(end_date, datetime_ext.from_str(source['end_date']))
+    if begin_date > end_date:
+        logging.info("Out of date range, ignoring data source {name}".format(name=name))
+        return
+
+    if not location.endswith('.csv'):
+        # only the current sims are published, they can't be backfilled
+        begin_date = end_date
+
+    save_locations = {}
+    for date in datetime_ext.date_range(begin_date, end_date):
+        save_location = data_archive.get_data_file(name, {'date': datetime_ext.to_str(date)})
+        if os.path.exists(save_location):
+            logging.info(f"Data already exists: {save_location}")
+        else:
+            save_locations[date] = save_location
+    if len(save_locations) == 0:
+        return
+
+    data = downloader.get(location)
+    if location.endswith('.csv'):
+        archive_csv(data, save_locations, source['date_col'], source['date_format'], name)
+    elif name == 'pres_sim_2020':
+        archive_sim_2020_json(data, save_locations[end_date])
+    else:
+        assert False, f"Archiving logic not implemented for {name}"
+
+
+def archive_data_range(begin_date: datetime.date, end_date: datetime.date, workers: int = 4,
+                       sources: t.Optional[t.List[t.Dict[str, str]]] = None,
+                       downloader: t.Optional[Downloader] = None) -> None:
+    """Archives all dates from begin_date to end_date, downloading each data source once concurrently"""
+    sources = _get_source_configs() if sources is None else sources
+    downloader = Downloader() if downloader is None else downloader
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_archive_source, source, begin_date, end_date, downloader) for source in sources]
+        # raises the first download or parse error
+        for future in futures:
+            future.result()
+
+
+def archive_data(date: datetime.date) -> None:
+    archive_data_range(date, date)
 
 
 # Reading
-@functools.lru_cache()
 def _get_data_sources():
-    with open(CONFIG_FILE, 'r') as data_config_f:
-        reader = csv.DictReader(data_config_f)
-        return [row['name'] for row in reader]
+    return [row['name'] for row in _get_source_configs()]
 
 
 def get_csv(name: str, date: datetime.date) -> t.Optional[str]:
@@ -101,19 +222,79 @@ def get_csv(name: str, date: datetime.date) -> t.Optional[str]:
 
 
 def _process_pres_state_2020(df: pd.DataFrame) -> pd.DataFrame:
-    df['state'] = df.apply(lambda row: states.get_state_abbrv_pres(row['state']), axis=1)
+    df['state'] = states.get_state_abbrvs_pres(df['state'])
     return df
 
 
-@pi_trading_lib.decorators.copy
+class Store:
+    """Consolidated, date sorted table of all archived files of a 538 data source
+
+    The table is kept in the work dir per archive dir and only archive dates not consolidated before are parsed.
+    Consolidated dates are written in the table file, so concurrent processes replace the table and its dates
+    together and the last write wins.
+    """
+    DATE_COL = 'archive_date'
+
+    def __init__(self, name: str, archive_dir: str):
+        assert name in _get_data_sources()
+        self.name = name
+        store_dir = os.path.join(work_dir.get_work_dir(), 'fte_store', work_dir.strhash({'archive_dir': archive_dir}))
+        self.table_path = os.path.join(store_dir, f'{name}.npz')
+
+        self.dates: t.Set[datetime.date] = set()
+        self.df = pd.DataFrame({Store.DATE_COL: pd.Series([], dtype='datetime64[ns]')})
+        if os.path.exists(self.table_path):
+            dates = columnar.read_meta(self.table_path, 'dates')
+            if dates is not None:
+                self.dates = set(datetime_ext.from_str(date) for date in dates.tolist())
+                self.df = columnar.read_table(self.table_path)
+
+    def _read_date(self, date: datetime.date) -> pd.DataFrame:
+        df = pd.read_csv(get_csv(self.name, date))
+        if self.name == 'pres_state_2020':
+            df = _process_pres_state_2020(df)
+        df.insert(0, Store.DATE_COL, pd.Timestamp(date))
+        return df
+
+    @pi_trading_lib.timers.timer
+    def _add_dates(self, dates: t.List[datetime.date]):
+        new_dfs = [self._read_date(date) for date in dates]
+        self.df = pd.concat(([self.df] if len(self.df) > 0 else []) + new_dfs, ignore_index=True)
+        self.df = self.df.sort_values(Store.DATE_COL, kind='stable', ignore_index=True)
+
+        self.dates.update(dates)
+
+        tmp_path = f'{self.table_path}.{os.getpid()}.tmp'
+        os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+        dates_array = np.array(sorted(datetime_ext.to_str(date) for date in self.dates), dtype=str)
+        columnar.write_table(tmp_path, self.df, meta={'dates': dates_array})
+        os.replace(tmp_path, self.table_path)
+
+    def add(self, dates: t.Iterable[datetime.date]):
+        """Consolidates all given dates not in the store with a single table write"""
+        missing = sorted(set(date for date in dates if date not in self.dates))
+        if len(missing) > 0:
+            self._add_dates(missing)
+
+    def get(self, begin_date: datetime.date, end_date: datetime.date) -> pd.DataFrame:
+        """Returns rows archived in [begin_date, end_date]"""
+        self.add(datetime_ext.date_range(begin_date, end_date))
+
+        archive_dates = self.df[Store.DATE_COL].to_numpy()
+        begin, end = np.searchsorted(archive_dates, [np.datetime64(begin_date, 'D'), np.datetime64(end_date, 'D') + 1])
+        return self.df.iloc[begin:end].drop(columns=Store.DATE_COL).reset_index(drop=True)
+
+
 @functools.lru_cache()
-def get_df(name: str, begin_date: datetime.date, end_date: datetime.date) -> pd.DataFrame:
-    """Get market data dataframe, including begin_date and end_date"""
-    base_df = pd.concat(
-        [pd.read_csv(get_csv(name, date)) for date in datetime_ext.date_range(begin_date, end_date)], axis=0
-    )
+def get_store(name: str, archive_dir: str) -> Store:
+    return Store(name, archive_dir)
+
 
-    if name == 'pres_state_2020':
-        base_df = _process_pres_state_2020(base_df)
+def prepare(name: str, dates: t.Iterable[datetime.date]) -> None:
+    """Consolidate archived dates of a 538 data source up front, to avoid rewriting the store per date read"""
+    get_store(name, data_archive.get_archive_dir()).add(dates)
 
-    return base_df
+
+def get_df(name: str, begin_date: datetime.date, end_date: datetime.date) -> pd.DataFrame:
+    """Get 538 data archived from begin_date to end_date inclusive"""
+    return get_store(name, data_archive.get_archive_dir()).get(begin_date, end_date)
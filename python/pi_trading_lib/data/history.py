@@ -1,45 +1,279 @@
 """Module for writing and querying generic history items"""
 import typing as t
 import datetime
+import functools
 
+import numpy as np
+import pandas as pd
+
+from pi_trading_lib.constants import NANOS_IN_SECOND
 import pi_trading_lib.data.market_data
 import pi_trading_lib.data.contract_db as contract_db
 import pi_trading_lib.timers
 
 BBO_CHANGE_COUNT = 1  # Number of BBO updates per day
 PI_DATA_CHANGE_COUNT = 2  # Number of BBO or last trade price updates per day
+MEAN_SPREAD = 3  # Mean ask - bid over quote updates
+MAX_SPREAD = 4  # Max ask - bid over quote updates
+TIME_WEIGHTED_MID = 5  # Mid price weighted by quote lifetime until end of day
+QUOTE_UPDATE_COUNT = 6  # Number of quote updates per day, excluding the start of day snapshot
 
 
-def get_bbo_change_count(contract_ids: t.List[int], date: datetime.date) -> t.Dict[int, int]:
-    pass
+class HistoryPanel:
+    """Dense date x contract values for a set of history value types
+
+    values[value_type] is a (len(dates), len(contract_ids)) array with NaN where no history was written.
+    Panels are cached, so arrays are read-only.
+    """
+    dates: np.ndarray
+    contract_ids: np.ndarray
+    values: t.Dict[int, np.ndarray]
+
+    def __init__(self, dates: np.ndarray, contract_ids: np.ndarray, values: t.Dict[int, np.ndarray]):
+        self.dates = dates
+        self.contract_ids = contract_ids
+        self.values = values
+        for arr in [self.dates, self.contract_ids, *self.values.values()]:
+            arr.setflags(write=False)
 
+    def frame(self, value_type: int) -> pd.DataFrame:
+        """Returns date x contract_id dataframe for value_type"""
+        df = pd.DataFrame(self.values[value_type], index=pd.DatetimeIndex(self.dates, name='date'),
+                          columns=pd.Index(self.contract_ids, name='contract_id'), copy=True)
+        return df
 
+    def select(self, contract_ids: t.Sequence[int]) -> 'HistoryPanel':
+        """Returns panel restricted to contract_ids, contracts without history are all NaN"""
+        cids = np.array(contract_ids, dtype=np.int64)
+        idx = np.searchsorted(self.contract_ids, cids)
+        idx = np.minimum(idx, max(len(self.contract_ids) - 1, 0))
+        found = (self.contract_ids[idx] == cids) if len(self.contract_ids) > 0 else np.zeros(len(cids), dtype=bool)
+        values = {}
+        for value_type, arr in self.values.items():
+            selected = np.full((len(self.dates), len(cids)), np.nan)
+            selected[:, found] = arr[:, idx[found]]
+            values[value_type] = selected
+        return HistoryPanel(self.dates.copy(), cids, values)
+
+
+@functools.lru_cache(maxsize=32)
 @pi_trading_lib.timers.timer
-def update_history(date_values: t.List[t.Tuple[int, int]], date: datetime.date, value_type: int, replace=False):
+def _load_history_panel(begin_date: datetime.date, end_date: datetime.date, value_types: t.Tuple[int, ...]) -> HistoryPanel:
+    # served by the (value_type, date, contract_id, value) covering index
+    query = f'''
+    SELECT value_type, date, contract_id, value FROM daily_history
+    WHERE value_type IN {contract_db.to_sql_list(list(value_types))}
+    AND date >= ? AND date <= ?
+    '''
+    res = contract_db.get_contract_db().cursor().execute(query, (begin_date.isoformat(), end_date.isoformat())).fetchall()
+
+    dates = np.arange(np.datetime64(begin_date, 'D'), np.datetime64(end_date, 'D') + 1)
+    if len(res) == 0:
+        contract_ids = np.array([], dtype=np.int64)
+        return HistoryPanel(dates, contract_ids, {vt: np.full((len(dates), 0), np.nan) for vt in value_types})
+
+    row_types, row_dates, row_cids, row_values = (np.array(col) for col in zip(*res))
+    row_date_idx = (row_dates.astype('datetime64[D]') - dates[0]).astype(np.int64)
+    contract_ids, row_cid_idx = np.unique(row_cids.astype(np.int64), return_inverse=True)
+
+    values = {}
+    for value_type in value_types:
+        arr = np.full((len(dates), len(contract_ids)), np.nan)
+        type_rows = row_types == value_type
+        arr[row_date_idx[type_rows], row_cid_idx[type_rows]] = row_values[type_rows].astype(np.float64)
+        values[value_type] = arr
+    return HistoryPanel(dates, contract_ids, values)
+
+
+def get_history_panel(begin_date: datetime.date, end_date: datetime.date, value_types: t.Sequence[int],
+                      contract_ids: t.Optional[t.Sequence[int]] = None) -> HistoryPanel:
+    """Returns daily history for [begin_date, end_date] inclusive, loaded in one indexed range scan and cached
+
+    params:
+        contract_ids: restrict to given contracts, otherwise all contracts with history in range
+    """
+    panel = _load_history_panel(begin_date, end_date, tuple(sorted(set(value_types))))
+    if contract_ids is not None:
+        panel = panel.select(contract_ids)
+    return panel
+
+
+def get_bbo_change_count(contract_ids: t.List[int], date: datetime.date) -> t.Dict[int, int]:
+    panel = get_history_panel(date, date, [BBO_CHANGE_COUNT], contract_ids)
+    counts = panel.values[BBO_CHANGE_COUNT][0]
+    return {cid: int(count) for cid, count in zip(contract_ids, counts.tolist()) if not np.isnan(count)}
+
+
+def _insert_history(date_values: t.List[t.Tuple[int, float]], date: datetime.date, value_type: int, replace=False):
+    """Insert without committing, callers own the transaction"""
     query_args = [(contract_id, date, value, value_type) for contract_id, value in date_values]
     conflict_res = 'REPLACE' if replace else 'IGNORE'
     query = f'''INSERT OR {conflict_res} INTO daily_history (contract_id, date, value, value_type)
                 VALUES (?, ?, ?, ?)
                 '''
-    with contract_db.get_contract_db() as db:
-        db.executemany(query, query_args)
+    contract_db.get_contract_db().executemany(query, query_args)
+    _load_history_panel.cache_clear()
+
+
+@pi_trading_lib.timers.timer
+def update_history(date_values: t.List[t.Tuple[int, float]], date: datetime.date, value_type: int, replace=False):
+    with contract_db.get_contract_db():
+        _insert_history(date_values, date, value_type, replace=replace)
+
+
+class DayArrays:
+    """Market data for a day as flat arrays sorted by (contract_id, timestamp)
+
+    Built from a raw market data frame without modifying it, the frame may be a cached get_raw_data result.
+    Per-contract groups are given by starts/counts, aligned with contract_ids.
+    """
+    contract_ids: np.ndarray
+    starts: np.ndarray
+    counts: np.ndarray
+    first: np.ndarray
+    last: np.ndarray
+    cids: np.ndarray
+    timestamp: np.ndarray
+    bid_price: np.ndarray
+    ask_price: np.ndarray
+    trade_price: np.ndarray
+    day_begin: int
+    day_end: int
+
+    def __init__(self, df: pd.DataFrame):
+        cids = _column_or_level(df, 'contract_id').astype(np.int64)
+        timestamp = _column_or_level(df, 'timestamp').astype('datetime64[ns]').astype(np.int64)
+        order = np.lexsort((timestamp, cids))
+
+        self.cids = cids[order]
+        self.timestamp = timestamp[order]
+        self.bid_price = df['bid_price'].to_numpy(dtype=np.float64)[order]
+        self.ask_price = df['ask_price'].to_numpy(dtype=np.float64)[order]
+        self.trade_price = df['trade_price'].to_numpy(dtype=np.float64)[order]
+
+        size = len(self.cids)
+        self.first = np.ones(size, dtype=bool)
+        self.first[1:] = self.cids[1:] != self.cids[:-1]
+        self.last = np.ones(size, dtype=bool)
+        self.last[:-1] = self.first[1:]
+        self.starts = np.flatnonzero(self.first)
+        self.counts = np.diff(np.append(self.starts, size))
+        self.contract_ids = self.cids[self.starts]
+
+        # data files cover one UTC day
+        day_ns = np.int64(24 * 60 * 60) * NANOS_IN_SECOND
+        self.day_begin = int(self.timestamp.min()) if size > 0 else 0
+        self.day_end = int((self.day_begin // day_ns + 1) * day_ns) if size > 0 else 0
+
+    def __len__(self) -> int:
+        return len(self.cids)
+
+    def previous(self, values: np.ndarray) -> np.ndarray:
+        """Previous value for the same contract, NaN for the first update of each contract"""
+        prev = np.roll(values, 1).astype(np.float64)
+        prev[self.first] = np.nan
+        return prev
+
+    def contract_sum(self, values: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(values, self.starts) if len(self) > 0 else np.array([])  # type: ignore
+
+    def contract_max(self, values: np.ndarray) -> np.ndarray:
+        return np.maximum.reduceat(values, self.starts) if len(self) > 0 else np.array([])  # type: ignore
+
+
+def _column_or_level(df: pd.DataFrame, name: str) -> np.ndarray:
+    if name in df.columns:
+        return df[name].to_numpy()  # type: ignore
+    return df.index.get_level_values(name).to_numpy()  # type: ignore
+
+
+HistoryMetric = t.Callable[[DayArrays], np.ndarray]
+
+# value_type -> metric returning one value per contract, aligned with DayArrays.contract_ids
+HISTORY_METRICS: t.Dict[int, HistoryMetric] = {}
+
+
+def history_metric(value_type: int) -> t.Callable[[HistoryMetric], HistoryMetric]:
+    """Registers a daily history metric written to daily_history under value_type"""
+    def register(func: HistoryMetric) -> HistoryMetric:
+        assert value_type not in HISTORY_METRICS, f'duplicate history value type {value_type}'
+        HISTORY_METRICS[value_type] = func
+        return func
+    return register
+
+
+@history_metric(BBO_CHANGE_COUNT)
+def _bbo_change_count(day: DayArrays) -> np.ndarray:
+    previous_bid, previous_ask = day.previous(day.bid_price), day.previous(day.ask_price)
+    bbo_updated = ((~np.isnan(previous_bid) & (previous_bid != day.bid_price)) |
+                   (~np.isnan(previous_ask) & (previous_ask != day.ask_price)))
+    return day.contract_sum(bbo_updated.astype(np.int64))
+
+
+@history_metric(PI_DATA_CHANGE_COUNT)
+def _data_change_count(day: DayArrays) -> np.ndarray:
+    # subtract one to ignore initial data refresh
+    return day.counts - 1  # type: ignore
+
+
+@history_metric(QUOTE_UPDATE_COUNT)
+def _quote_update_count(day: DayArrays) -> np.ndarray:
+    # rows at the first timestamp of the file are the initial snapshot rather than updates
+    return day.contract_sum((day.timestamp != day.day_begin).astype(np.int64))
+
+
+@history_metric(MEAN_SPREAD)
+def _mean_spread(day: DayArrays) -> np.ndarray:
+    return day.contract_sum(day.ask_price - day.bid_price) / day.counts  # type: ignore
+
+
+@history_metric(MAX_SPREAD)
+def _max_spread(day: DayArrays) -> np.ndarray:
+    return day.contract_max(day.ask_price - day.bid_price)
+
+
+@history_metric(TIME_WEIGHTED_MID)
+def _time_weighted_mid(day: DayArrays) -> np.ndarray:
+    # each quote is weighted by how long it was live, the last quote of a contract lasts until the end of the day
+    next_timestamp = np.roll(day.timestamp, -1)
+    next_timestamp[day.last] = day.day_end
+    duration = (next_timestamp - day.timestamp).astype(np.float64)
+    mid_price = (day.bid_price + day.ask_price) / 2
+
+    total_duration = day.contract_sum(duration)
+    weighted_mid = day.contract_sum(mid_price * duration)
+    mean_mid = day.contract_sum(mid_price) / day.counts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total_duration > 0, weighted_mid / total_duration, mean_mid)  # type: ignore
+
+
+@pi_trading_lib.timers.timer
+def compute_history(df: pd.DataFrame) -> t.Dict[int, t.List[t.Tuple[int, float]]]:
+    """Returns {value_type: [(contract_id, value)]} for all registered metrics in a single pass over df
+
+    df is raw market data with timestamp and contract_id as columns or index levels, it is not modified.
+    """
+    day = DayArrays(df)
+    if len(day) == 0:
+        return {}
+
+    contract_ids = day.contract_ids.tolist()
+    return {
+        value_type: list(zip(contract_ids, metric(day).tolist()))
+        for value_type, metric in HISTORY_METRICS.items()
+    }
+
+
+def apply_history(history: t.Dict[int, t.List[t.Tuple[int, float]]], date: datetime.date, replace=False):
+    """Writes output of compute_history, callers own the transaction"""
+    for value_type, date_values in history.items():
+        _insert_history(date_values, date, value_type, replace=replace)
 
 
 @pi_trading_lib.timers.timer
-def update_bbo_change_count_history(date: datetime.date, replace=False):
+def update_daily_history(date: datetime.date, replace=False):
     df = pi_trading_lib.data.market_data.get_raw_data(date)
     if len(df) == 0:
         return
-    else:
-        df['previous_bid'] = df.groupby(level=1)['bid_price'].shift(periods=1)
-        df['previous_ask'] = df.groupby(level=1)['ask_price'].shift(periods=1)
-        df['bbo_updated'] = ((~df['previous_bid'].isnull() & (df['previous_bid'] != df['bid_price'])) |
-                             (~df['previous_ask'].isnull() & (df['previous_ask'] != df['ask_price'])))
-        bbo_change_counts = df.groupby(level=1)['bbo_updated'].sum()
-        bbo_change_counts = list(zip(bbo_change_counts.index.tolist(), bbo_change_counts.tolist()))
-        update_history(bbo_change_counts, date, BBO_CHANGE_COUNT, replace=replace)
-
-        # subtract one to ignore initial data refresh
-        data_change_counts = df.index.get_level_values('contract_id').value_counts() - 1
-        data_change_counts = list(zip(data_change_counts.index.tolist(), data_change_counts.tolist()))
-        update_history(data_change_counts, date, PI_DATA_CHANGE_COUNT, replace=replace)
+    with contract_db.get_contract_db():
+        apply_history(compute_history(df), date, replace=replace)
@@ -8,6 +8,7 @@ import pandas as pd
 import numpy as np
 
 import pi_trading_lib.data.data_archive as data_archive
+import pi_trading_lib.data.raw_feed as raw_feed
 import pi_trading_lib.datetime_ext as datetime_ext
 import pi_trading_lib.decorators
 import pi_trading_lib.data.contracts
@@ -16,6 +17,7 @@ import pi_trading_lib.timers
 # TODO: Store market data in contract based format to optimize for common use cases
 
 COLUMNS = ['timestamp', 'market_id', 'contract_id', 'bid_price', 'ask_price', 'trade_price', 'name']
+RAW_COLUMNS = COLUMNS[:-1]
 
 
 @functools.lru_cache()
@@ -36,31 +38,81 @@ def get_market_data_start() -> datetime.date:
     return begin_date
 
 
-@functools.lru_cache()
 @pi_trading_lib.timers.timer
-def get_raw_data(date: datetime.date) -> pd.DataFrame:
-    """Get raw data for date as dataframe"""
+def read_raw_csv(date: datetime.date) -> pd.DataFrame:
+    """Read market data csv for date without contract db annotations, safe to call from worker processes
+
+    Returns flat dataframe with COLUMNS except name, in file order. Empty if there is no data for date.
+    """
     market_data_file = data_archive.get_data_file('market_data_csv', {'date': datetime_ext.to_str(date)})
     if not os.path.exists(market_data_file):
         logging.warn('No raw market data for {date}'.format(date=str(date)))
+        return pd.DataFrame([], columns=RAW_COLUMNS)
+
+    logging.debug('Loading market data file %s' % market_data_file)
+    md_df = pd.read_csv(market_data_file)
+    md_df['contract_id'] = md_df['id']
+    md_df['timestamp'] = pd.to_datetime(md_df['timestamp'], unit='ms')
+    return md_df[RAW_COLUMNS]
+
+
+_live_feeds: t.Dict[datetime.date, raw_feed.DayFeed] = {}
+
+
+def follow_feed(date: datetime.date, path: t.Optional[str] = None, fmt: str = 'json') -> raw_feed.DayFeed:
+    """Serves market data of date from a raw feed file that is still being written, read incrementally
+
+    Defaults to the md_archiver json file of date. A csv file being written by md_csv_generator can be followed
+    with fmt csv.
+    """
+    if date not in _live_feeds:
+        if path is None:
+            path = data_archive.get_data_file('market_data_raw', {'date': date})
+        _live_feeds[date] = raw_feed.DayFeed(path, fmt)
+    return _live_feeds[date]
+
+
+def get_live_feed(date: datetime.date) -> t.Optional[raw_feed.DayFeed]:
+    """Feed of date refreshed with new quotes, if date is followed or is the current date of the raw feed
+
+    The market data csv of a date is only generated once the day is over, until then the raw feed is followed.
+    """
+    if date not in _live_feeds:
+        if date != raw_feed.feed_date_now():
+            return None
+        if os.path.exists(data_archive.get_data_file('market_data_csv', {'date': date})):
+            return None
+        if not os.path.exists(data_archive.get_data_file('market_data_raw', {'date': date})):
+            return None
+        follow_feed(date)
+    feed = _live_feeds[date]
+    feed.refresh()
+    return feed
+
+
+@functools.lru_cache()
+@pi_trading_lib.timers.timer
+def _get_archived_raw_data(date: datetime.date) -> pd.DataFrame:
+    md_df = read_raw_csv(date)
+    if len(md_df) == 0:
         md_df = pd.DataFrame([], columns=COLUMNS)
     else:
-        logging.debug('Loading market data file %s' % market_data_file)
-        md_df = pd.read_csv(market_data_file)
-        md_df['contract_id'] = md_df['id']
-        md_df['timestamp'] = pd.to_datetime(md_df['timestamp'], unit='ms')
         contract_name_map = pi_trading_lib.data.contracts.get_contract_names(md_df['contract_id'].unique().tolist())
-        md_df['name'] = md_df['contract_id'].map(contract_name_map)
-        md_df = md_df[COLUMNS]
+        md_df = md_df.assign(name=md_df['contract_id'].map(contract_name_map))[COLUMNS]
 
     md_df = md_df.set_index(['timestamp', 'contract_id'])
     md_df = md_df.sort_index(level='timestamp')  # Is this needed? maybe presorted
     return md_df
 
 
-@pi_trading_lib.decorators.copy
-@functools.lru_cache()
-@pi_trading_lib.timers.timer
+def get_raw_data(date: datetime.date) -> pd.DataFrame:
+    """Get raw data for date as dataframe"""
+    feed = get_live_feed(date)
+    if feed is not None:
+        return feed.raw_data()
+    return _get_archived_raw_data(date)
+
+
 def get_filtered_data(date: datetime.date, contracts: t.Optional[t.Tuple[int, ...]] = None,
                       snapshot_interval: t.Optional[datetime.timedelta] = None) -> pd.DataFrame:
     """
@@ -68,6 +120,14 @@ def get_filtered_data(date: datetime.date, contracts: t.Optional[t.Tuple[int, ..
 
     param snapshot_interval: Transform dataframe into a market data snapshot every snapshot_interval time
     """
+    if get_live_feed(date) is not None:
+        return _filter_data(date, contracts, snapshot_interval)
+    return _get_archived_filtered_data(date, contracts, snapshot_interval)
+
+
+@pi_trading_lib.timers.timer
+def _filter_data(date: datetime.date, contracts: t.Optional[t.Tuple[int, ...]],
+                 snapshot_interval: t.Optional[datetime.timedelta]) -> pd.DataFrame:
     df = get_raw_data(date)
 
     if contracts is not None:
@@ -104,6 +164,9 @@ def get_filtered_data(date: datetime.date, contracts: t.Optional[t.Tuple[int, ..
     return df
 
 
+_get_archived_filtered_data = pi_trading_lib.decorators.copy(functools.lru_cache()(_filter_data))
+
+
 def add_mid_price(df: pd.DataFrame) -> pd.DataFrame:
     df['mid_price'] = (df['bid_price'] + df['ask_price']) / 2
     return df
@@ -146,9 +209,25 @@ class MarketDataSnapshot:
         return MarketDataSnapshot(new_data)
 
 
+def get_snapshot(timestamp: t.Union[datetime.datetime, datetime.date], contracts: t.Optional[t.Tuple[int, ...]] = None) -> MarketDataSnapshot:
+    date = timestamp.date() if isinstance(timestamp, datetime.datetime) else timestamp
+    feed = get_live_feed(date)
+    if feed is None:
+        return _get_archived_snapshot(timestamp, contracts)
+
+    # not cached, the snapshot changes as quotes are read
+    time = timestamp if isinstance(timestamp, datetime.datetime) else None
+    df = feed.snapshot(time)
+    if contracts is not None:
+        df = df.reindex(list(set(contracts)))
+    df = _annotate(df)
+    return MarketDataSnapshot(df, time=time)
+
+
 @functools.lru_cache(maxsize=None)
 @pi_trading_lib.timers.timer
-def get_snapshot(timestamp: t.Union[datetime.datetime, datetime.date], contracts: t.Optional[t.Tuple[int, ...]] = None) -> MarketDataSnapshot:
+def _get_archived_snapshot(timestamp: t.Union[datetime.datetime, datetime.date],
+                           contracts: t.Optional[t.Tuple[int, ...]] = None) -> MarketDataSnapshot:
     time: t.Optional[datetime.datetime] = None
 
     if isinstance(timestamp, datetime.datetime):
@@ -165,3 +244,67 @@ def get_snapshot(timestamp: t.Union[datetime.datetime, datetime.date], contracts
         df = df.reindex(list(set(contracts)))
     df = _annotate(df)
     return MarketDataSnapshot(df, time=time)
+
+
+class IntradaySnapshots:
+    """As-of snapshots of contracts every interval through a day, each built from the previous snapshot and the
+    ticks in between
+
+    Iterating starts from the start of day snapshot, see get_snapshot, and yields (time, snapshot, ticked contract
+    ids) every interval from midnight until the last tick of the day. The snapshot at time t has the last tick
+    before t of every contract that ticked, as get_snapshot(t), and start of day values for contracts that didn't.
+    """
+    PRICE_COLUMNS = ['bid_price', 'ask_price', 'trade_price']
+
+    def __init__(self, date: datetime.date, interval: datetime.timedelta, contracts: np.ndarray):
+        assert interval >= datetime.timedelta(minutes=1)
+        self.date = date
+        self.interval = interval
+        self.contracts = np.asarray(contracts, dtype=np.int64)
+        self.index = pd.Index(self.contracts, name='contract_id')
+
+        # annotated snapshot, steps only update the rows of contracts that ticked
+        sod = get_snapshot(date).data.reindex(self.index)
+        self.data = _annotate(sod[['timestamp', 'market_id'] + IntradaySnapshots.PRICE_COLUMNS + ['name']].copy())
+        self.time_col = self.data.columns.get_loc('timestamp')
+        self.price_cols = [self.data.columns.get_loc(col) for col in IntradaySnapshots.PRICE_COLUMNS]
+        self.mid_col = self.data.columns.get_loc('mid_price')
+
+        # ticks of other contracts are dropped once, so steps only touch the ticks of contracts
+        raw = get_raw_data(date)
+        tick_contracts = self.index.get_indexer(raw.index.get_level_values('contract_id'))
+        in_contracts = tick_contracts >= 0
+        self.tick_contracts = tick_contracts[in_contracts]
+        self.tick_times = raw.index.get_level_values('timestamp').to_numpy(dtype='datetime64[ns]')[in_contracts]
+        self.tick_values = raw[IntradaySnapshots.PRICE_COLUMNS].to_numpy(dtype=np.float64)[in_contracts]
+
+    def _apply_ticks(self, begin: int, end: int) -> np.ndarray:
+        """Updates snapshot rows with ticks [begin, end), returns indices of contracts that ticked"""
+        # ticks are in time order, so the first occurence in the reversed ticks is the last tick of a contract
+        ticked, last = np.unique(self.tick_contracts[begin:end][::-1], return_index=True)
+        if len(ticked) > 0:
+            last_ticks = end - 1 - last
+            values = self.tick_values[last_ticks]
+            self.data.iloc[ticked, self.price_cols] = values
+            self.data.iloc[ticked, self.mid_col] = (values[:, 0] + values[:, 1]) / 2
+            self.data.iloc[ticked, self.time_col] = self.tick_times[last_ticks]
+        return ticked
+
+    def _snapshot(self, time: datetime.datetime) -> MarketDataSnapshot:
+        # later steps update the snapshot in place
+        return MarketDataSnapshot(self.data.copy(), time=time)
+
+    @pi_trading_lib.timers.timer
+    def _step(self, begin: int, step_time: np.datetime64) -> t.Tuple[int, np.ndarray]:
+        end = int(np.searchsorted(self.tick_times, step_time, side='left'))
+        return end, self.contracts[self._apply_ticks(begin, end)]
+
+    def __iter__(self) -> t.Iterator[t.Tuple[datetime.datetime, MarketDataSnapshot, np.ndarray]]:
+        interval = np.timedelta64(self.interval)
+        step_time = np.datetime64(self.date, 'ns') + interval
+        applied = 0
+        while applied < len(self.tick_times):
+            applied, ticked = self._step(applied, step_time)
+            time = pd.Timestamp(step_time).to_pydatetime()
+            yield time, self._snapshot(time), ticked
+            step_time += interval
@@ -0,0 +1,309 @@
+import datetime
+import json
+import os
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+import pi_trading_lib.data.contracts
+import pi_trading_lib.timers
+
+
+# Raw market data feed written by md_archiver, one json packet of market updates per line
+RAW_FEED_COLUMNS = ['timestamp', 'market_id', 'contract_id', 'bid_price', 'ask_price', 'trade_price']
+
+
+@pi_trading_lib.timers.timer
+def parse_packet(line: str) -> t.Dict[str, np.ndarray]:
+    """Returns quotes of a raw feed packet as RAW_FEED_COLUMNS arrays, timestamps are utc datetime64[ms]"""
+    market_updates = json.loads(line)['market_updates']
+    timestamps: t.Dict[str, np.datetime64] = {}
+    rows = []
+    for market in market_updates.values():
+        # markets of a packet are usually updated at the same time
+        timestamp_str = market['timestamp']
+        if timestamp_str not in timestamps:
+            timestamps[timestamp_str] = pd.Timestamp(timestamp_str).tz_convert(None).to_datetime64()
+        timestamp = timestamps[timestamp_str]
+        for contract in market['contracts']:
+            rows.append((timestamp, market['id'], contract['id'],
+                         contract['bid_price'], contract['ask_price'], contract['trade_price']))
+
+    columns: t.List[t.Sequence[t.Any]] = list(zip(*rows)) if rows else [[]] * len(RAW_FEED_COLUMNS)
+    return {
+        'timestamp': np.array(columns[0], dtype='datetime64[ms]'),
+        'market_id': np.array(columns[1], dtype=np.int64),
+        'contract_id': np.array(columns[2], dtype=np.int64),
+        'bid_price': np.array(columns[3], dtype=np.float64),
+        'ask_price': np.array(columns[4], dtype=np.float64),
+        'trade_price': np.array(columns[5], dtype=np.float64),
+    }
+
+
+@pi_trading_lib.timers.timer
+def parse_csv_lines(lines: t.List[str]) -> t.Dict[str, np.ndarray]:
+    """Returns quotes of md_csv_generator rows as RAW_FEED_COLUMNS arrays, like parse_packet"""
+    # timestamp,type,id,market_id,status,trade_price,bid_price,ask_price, with a trailing comma
+    rows = [line.split(',') for line in lines if not line.startswith('timestamp')]
+    columns: t.List[t.Sequence[t.Any]] = list(zip(*rows)) if rows else [[]] * 8
+    return {
+        'timestamp': np.array(columns[0], dtype=np.int64).astype('datetime64[ms]'),
+        'market_id': np.array(columns[3], dtype=np.int64),
+        'contract_id': np.array(columns[2], dtype=np.int64),
+        'bid_price': np.array(columns[6], dtype=np.float64),
+        'ask_price': np.array(columns[7], dtype=np.float64),
+        'trade_price': np.array(columns[5], dtype=np.float64),
+    }
+
+
+class RawFeedTail:
+    """Follows a raw feed file while it is being appended to
+
+    Every read returns the complete lines added since the previous read, at most max_lines of them. offset is
+    the byte offset of the first line not read yet, a partially written last line is read once it is complete.
+    """
+
+    def __init__(self, path: str, offset: int = 0):
+        self.path = path
+        self.offset = offset
+        self.file: t.Optional[t.BinaryIO] = None
+
+    def read(self, max_lines: t.Optional[int] = None) -> t.List[str]:
+        if self.file is None:
+            if not os.path.exists(self.path):
+                return []
+            self.file = open(self.path, 'rb')
+        self.file.seek(self.offset)
+        if max_lines is None:
+            data = self.file.read()
+            end = data.rfind(b'\n') + 1
+        else:
+            lines = []
+            for _ in range(max_lines):
+                line = self.file.readline()
+                if not line.endswith(b'\n'):
+                    break
+                lines.append(line)
+            data = b''.join(lines)
+            end = len(data)
+        self.offset += end
+        return data[:end].decode().splitlines()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def feed_date_now() -> datetime.date:
+    """Date of the raw feed file currently written by md_archiver, which uses utc dates"""
+    return datetime.datetime.utcnow().date()
+
+
+class DayBuffer:
+    """Appendable columnar buffer of quotes, arrays grow by doubling so appends cost O(new rows) amortized"""
+    DTYPES = {
+        'timestamp': 'datetime64[ms]',
+        'market_id': np.int64,
+        'contract_id': np.int64,
+        'bid_price': np.float64,
+        'ask_price': np.float64,
+        'trade_price': np.float64,
+        'contract_index': np.int64,
+    }
+
+    def __init__(self, capacity: int = 1024):
+        self.rows = 0
+        self.data = {col: np.zeros(capacity, dtype=dtype) for col, dtype in DayBuffer.DTYPES.items()}
+
+    def append(self, columns: t.Dict[str, np.ndarray]):
+        size = len(columns['contract_id'])
+        capacity = len(self.data['contract_id'])
+        if self.rows + size > capacity:
+            capacity = max(2 * capacity, self.rows + size)
+            for col, values in self.data.items():
+                self.data[col] = np.zeros(capacity, dtype=values.dtype)
+                self.data[col][:self.rows] = values[:self.rows]
+        for col in DayBuffer.DTYPES:
+            self.data[col][self.rows:self.rows + size] = columns[col]
+        self.rows += size
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        return self.data[col][:self.rows]  # type: ignore
+
+
+class DayFeed:
+    """Quotes of a day ingested incrementally from a raw feed file while it is being written
+
+    fmt is json for the md_archiver feed or csv for md_csv_generator output. Like md_csv_generator, json quotes
+    are only kept when the prices of a contract change. Every refresh that reads new lines appends a (byte offset,
+    rows) checkpoint, so consumers can ask for the rows read since the offset they last saw.
+
+    Rows are also kept in (timestamp, contract id) order, like market_data.get_raw_data. The feed is mostly written
+    in time order, so each refresh only reorders the new rows and the sorted rows at or after their earliest time.
+    """
+
+    def __init__(self, path: str, fmt: str = 'json'):
+        assert fmt in ('json', 'csv')
+        self.fmt = fmt
+        self.tail = RawFeedTail(path)
+        self.buffer = DayBuffer()
+        self.checkpoints: t.List[t.Tuple[int, int]] = [(0, 0)]
+        self.max_time = np.datetime64(0, 'ms')
+
+        self.contract_index: t.Dict[int, int] = {}
+        self.names: t.List[t.Optional[str]] = []
+        # rows of the first and last quote of every contract, by contract index
+        self.first_row = np.zeros(0, dtype=np.int64)
+        self.last_row = np.zeros(0, dtype=np.int64)
+
+        # rows in time order and their timestamps, the first sorted_rows entries are valid
+        self.order = np.zeros(0, dtype=np.int64)
+        self.sorted_times = np.zeros(0, dtype='datetime64[ms]')
+        self._raw_data: t.Optional[pd.DataFrame] = None
+        # leading rows of _raw_data that are still in order
+        self._raw_data_rows = 0
+
+    @property
+    def offset(self) -> int:
+        return self.checkpoints[-1][0]
+
+    def _ingest(self, quotes: t.Dict[str, np.ndarray], dedupe: bool):
+        cids = quotes['contract_id']
+        idx = np.array([self.contract_index.setdefault(cid, len(self.contract_index)) for cid in cids.tolist()],
+                       dtype=np.int64)
+        if len(self.contract_index) > len(self.first_row):
+            pad = len(self.contract_index) - len(self.first_row)
+            self.first_row = np.pad(self.first_row, (0, pad), constant_values=-1)
+            self.last_row = np.pad(self.last_row, (0, pad), constant_values=-1)
+
+        if dedupe:
+            # a contract is quoted at most once per packet
+            prev_rows = self.last_row[idx]
+            keep = prev_rows < 0
+            seen = ~keep
+            changed = np.zeros(seen.sum(), dtype=bool)
+            for col in ['bid_price', 'ask_price', 'trade_price']:
+                changed |= self.buffer[col][prev_rows[seen]] != quotes[col][seen]
+            keep[seen] = changed
+            quotes = {col: values[keep] for col, values in quotes.items()}
+            idx = idx[keep]
+
+        rows = self.buffer.rows + np.arange(len(idx))
+        ticked, first = np.unique(idx, return_index=True)
+        new = self.first_row[ticked] < 0
+        self.first_row[ticked[new]] = rows[first[new]]
+        ticked, last = np.unique(idx[::-1], return_index=True)
+        self.last_row[ticked] = rows[len(idx) - 1 - last]
+
+        self.buffer.append(dict(quotes, contract_index=idx))
+        if len(idx) > 0:
+            self.max_time = max(self.max_time, quotes['timestamp'].max())
+
+    @pi_trading_lib.timers.timer
+    def _sort_rows(self, begin: int):
+        """Merges rows from begin into the time order of the rows before"""
+        end = self.buffer.rows
+        if end == begin:
+            return
+        if len(self.order) < end:
+            capacity = len(self.buffer.data['contract_id'])
+            self.order = np.concatenate([self.order[:begin], np.zeros(capacity - begin, dtype=np.int64)])
+            self.sorted_times = np.concatenate([self.sorted_times[:begin],
+                                                np.zeros(capacity - begin, dtype='datetime64[ms]')])
+
+        times, cids = self.buffer['timestamp'], self.buffer['contract_id']
+        merge_begin = int(np.searchsorted(self.sorted_times[:begin], times[begin:end].min(), side='left'))
+        rows = np.concatenate([self.order[merge_begin:begin], np.arange(begin, end)])
+        rows = rows[np.lexsort((rows, cids[rows], times[rows]))]
+        self.order[merge_begin:end] = rows
+        self.sorted_times[merge_begin:end] = times[rows]
+        self._raw_data_rows = min(self._raw_data_rows, merge_begin)
+
+    @pi_trading_lib.timers.timer
+    def refresh(self, max_lines: t.Optional[int] = None) -> int:
+        """Ingests lines added to the feed file since the last refresh, at most max_lines, returns the number of new
+        rows"""
+        lines = self.tail.read(max_lines)
+        if len(lines) == 0:
+            return 0
+
+        rows = self.buffer.rows
+        if self.fmt == 'json':
+            for line in lines:
+                self._ingest(parse_packet(line), dedupe=True)
+        else:
+            self._ingest(parse_csv_lines(lines), dedupe=False)
+        self._sort_rows(rows)
+        self.checkpoints.append((self.tail.offset, self.buffer.rows))
+        return self.buffer.rows - rows
+
+    def _frame(self, rows: np.ndarray) -> pd.DataFrame:
+        """Rows as a market_data.get_raw_data frame"""
+        # contract names are looked up once per contract
+        if len(self.names) < len(self.contract_index):
+            new_cids = list(self.contract_index)[len(self.names):]
+            names = pi_trading_lib.data.contracts.get_contract_names(new_cids)
+            self.names.extend(names.get(cid) for cid in new_cids)
+
+        return pd.DataFrame({
+            'market_id': self.buffer['market_id'][rows],
+            'bid_price': self.buffer['bid_price'][rows],
+            'ask_price': self.buffer['ask_price'][rows],
+            'trade_price': self.buffer['trade_price'][rows],
+            'name': np.array(self.names, dtype=object)[self.buffer['contract_index'][rows]],
+        }, index=pd.MultiIndex.from_arrays([
+            self.buffer['timestamp'][rows].astype('datetime64[ns]'),
+            self.buffer['contract_id'][rows],
+        ], names=['timestamp', 'contract_id']))
+
+    def since(self, offset: int = 0) -> pd.DataFrame:
+        """Rows read after the checkpoint at byte offset, in file order"""
+        checkpoint_rows = dict(self.checkpoints)[offset]
+        return self._frame(np.arange(checkpoint_rows, self.buffer.rows))
+
+    def raw_data(self) -> pd.DataFrame:
+        """All rows of the day so far, as market_data.get_raw_data, only rows merged since the last call are built"""
+        rows = self.buffer.rows
+        if self._raw_data is None or self._raw_data_rows < rows:
+            new_data = self._frame(self.order[self._raw_data_rows:rows])
+            if self._raw_data is not None and self._raw_data_rows > 0:
+                new_data = pd.concat([self._raw_data.iloc[:self._raw_data_rows], new_data])
+            self._raw_data = new_data
+            self._raw_data_rows = rows
+        return self._raw_data
+
+    def contract_indices(self, cids: np.ndarray) -> np.ndarray:
+        """Contract index of each of cids, -1 for contracts without quotes"""
+        return np.array([self.contract_index.get(cid, -1) for cid in cids.tolist()], dtype=np.int64)
+
+    def market_contracts(self, contract_idx: np.ndarray) -> np.ndarray:
+        """Contract indices of all contracts in the markets of contract_idx"""
+        market_ids = self.buffer['market_id'][self.first_row]
+        return np.flatnonzero(np.isin(market_ids, market_ids[contract_idx]))
+
+    def _snapshot_frame(self, rows: np.ndarray) -> pd.DataFrame:
+        snapshot = self._frame(rows).reset_index('timestamp')
+        return snapshot[['timestamp', 'market_id', 'bid_price', 'ask_price', 'trade_price', 'name']]
+
+    def latest(self, contract_idx: np.ndarray) -> pd.DataFrame:
+        """Last quote of contracts by contract index, like snapshot"""
+        return self._snapshot_frame(self.last_row[contract_idx])
+
+    def snapshot(self, time: t.Optional[datetime.datetime] = None) -> pd.DataFrame:
+        """Last quote before time of every contract indexed by contract id, or the first quote if time is None
+
+        Snapshots after the last quote read only touch the last quote of every contract.
+        """
+        if time is None:
+            rows = self.first_row
+        elif np.datetime64(time, 'ms') > self.max_time:
+            rows = self.last_row
+        else:
+            end = np.searchsorted(self.sorted_times[:self.buffer.rows], np.datetime64(time, 'ms'), side='left')
+            before = self.order[:end]
+            ticked, last = np.unique(self.buffer['contract_index'][before][::-1], return_index=True)
+            rows = np.full(len(self.first_row), -1, dtype=np.int64)
+            rows[ticked] = before[len(before) - 1 - last]
+        return self._snapshot_frame(rows[rows >= 0])
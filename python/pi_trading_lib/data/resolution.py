@@ -1,23 +1,108 @@
 import argparse
+import os
 import typing as t
 import datetime
+import functools
+
+import numpy as np
+import pandas as pd
 
 import pi_trading_lib.decorators
 import pi_trading_lib.data.contracts
 import pi_trading_lib.data.contract_db as contract_db
+import pi_trading_lib.data.data_archive as data_archive
 import pi_trading_lib.data.market_data as market_data
 from pi_trading_lib.data.resolution_data import CONTRACT_RESOLUTIONS, UNRESOLVED_CONTRACTS, NO_CORRECT_CONTRACT_MARKETS
 
+FINAL_QUOTE_COLUMNS = ['trade_price', 'bid_price', 'ask_price']
+
+
+class ResolutionTable:
+    """In-memory copy of the resolution table, sorted by contract id for vectorized lookups"""
+    cids: np.ndarray
+    values: np.ndarray
+    end_dates: np.ndarray
+
+    def __init__(self, cids: np.ndarray, values: np.ndarray, end_dates: np.ndarray):
+        assert len(cids) == len(values) == len(end_dates)
+        order = np.argsort(cids, kind='stable')
+        self.cids = cids[order]
+        self.values = values[order]
+        self.end_dates = end_dates[order]
+
+    def lookup(self, cids: np.ndarray) -> t.Tuple[np.ndarray, np.ndarray]:
+        """Returns (resolution, contract end date) arrays aligned with cids, NaN/NaT for unresolved contracts"""
+        cids = np.asarray(cids, dtype=np.int64)
+        values = np.full(len(cids), np.nan)
+        end_dates = np.full(len(cids), np.datetime64('NaT'), dtype='datetime64[D]')
+        if len(self.cids) == 0 or len(cids) == 0:
+            return values, end_dates
+
+        idx = np.searchsorted(self.cids, cids)
+        idx = np.minimum(idx, len(self.cids) - 1)
+        found = self.cids[idx] == cids
+        values[found] = self.values[idx[found]]
+        end_dates[found] = self.end_dates[idx[found]]
+        return values, end_dates
+
+    def resolve(self, cids: np.ndarray, as_of_date: t.Optional[datetime.date] = None) -> np.ndarray:
+        """Returns array of resolutions aligned with cids, NaN for unresolved contracts
+
+        params:
+            as_of_date: ignores resolutions for contracts ending on or after given date
+        """
+        values, end_dates = self.lookup(cids)
+        if as_of_date is not None:
+            return mask_resolutions(values, end_dates, as_of_date)
+        return values
+
+    def __len__(self) -> int:
+        return len(self.cids)
+
+
+def mask_resolutions(values: np.ndarray, end_dates: np.ndarray, as_of_date: datetime.date) -> np.ndarray:
+    """Hides resolutions of contracts ending on or after as_of_date, see ResolutionTable.lookup"""
+    return np.where(end_dates < np.datetime64(as_of_date, 'D'), values, np.nan)  # type: ignore
+
 
+@functools.lru_cache()
 @pi_trading_lib.timers.timer
-def get_contract_resolution(ids: t.List[int], date: t.Optional[datetime.date] = None) -> t.Dict[int, t.Optional[float]]:
+def get_resolution_table() -> ResolutionTable:
+    """Loads the full resolution table once, see invalidate_resolution_table"""
+    query = '''
+    SELECT contract_id, value, end_date FROM resolution
+    INNER JOIN contract ON resolution.contract_id = contract.id
+    ORDER BY contract_id
+    '''
+    res = contract_db.get_contract_db().cursor().execute(query).fetchall()
+
+    # resolution is keyed on (contract_id, value), keep last value seen for a contract to match dict semantics
+    res = list({row[0]: row for row in res}.values())
+    cids = np.array([row[0] for row in res], dtype=np.int64)
+    values = np.array([row[1] for row in res], dtype=np.float64)
+    end_dates = np.array([row[2] if row[2] is not None else 'NaT' for row in res], dtype='datetime64[D]')
+    return ResolutionTable(cids, values, end_dates)
+
+
+def invalidate_resolution_table():
+    get_resolution_table.cache_clear()
+
+
+def resolve(cids: t.Union[np.ndarray, t.Sequence[int]], as_of_date: t.Optional[datetime.date] = None) -> np.ndarray:
+    """Vectorized resolution lookup, returns float array aligned with cids and NaN when unresolved"""
+    return get_resolution_table().resolve(np.asarray(cids, dtype=np.int64), as_of_date)
+
+
+@pi_trading_lib.timers.timer
+def get_contract_resolution(ids: t.Sequence[int], date: t.Optional[datetime.date] = None) -> t.Dict[int, t.Optional[float]]:
     """Gets resolution (1.0, 0.0, or None) for contract
 
     params:
         date: ignores resolutions after given date and returns None for cid
     """
-    resolution = _get_contract_resolution_db(ids, date)
-    return resolution
+    ids = list(ids)
+    values = resolve(ids, date)
+    return {cid: (None if np.isnan(value) else value) for cid, value in zip(ids, values.tolist())}
 
 
 def _get_contract_resolution_db(ids: t.List[int], date: t.Optional[datetime.date]) -> t.Dict[int, t.Optional[float]]:
@@ -39,29 +124,62 @@ def _get_contract_resolution_db(ids: t.List[int], date: t.Optional[datetime.date
     return resolution
 
 
-def _get_contract_resolution_raw(ids: t.List[int]) -> t.Dict[int, t.Optional[float]]:
-    resolution: t.Dict[int, t.Optional[float]] = {}
+def _get_final_quotes(contracts: t.Dict[int, t.Dict]) -> pd.DataFrame:
+    """Returns last quote of each contract on its end date, indexed by contract_id
 
-    contracts = pi_trading_lib.data.contracts.get_contracts(ids)
+    Contracts are grouped by end date so that each day of market data is scanned once.
+    Contracts without an end date or without data on their end date are omitted.
+    """
+    cids_by_date: t.Dict[datetime.date, t.List[int]] = {}
     for contract_id, contract in contracts.items():
         if contract['end_date'] is not None:
-            date_data = market_data.get_raw_data(contract['end_date'])
-            final_data = date_data.xs(contract_id, axis=0, level='contract_id').iloc[-1]
-            if contract_id in CONTRACT_RESOLUTIONS:
-                resolution[contract_id] = CONTRACT_RESOLUTIONS[contract_id]
-                if resolution[contract_id] is not None:
-                    continue
-
-            if (final_data['trade_price'] <= 0.03 and final_data['ask_price'] <= 0.03) or final_data['ask_price'] <= 0.01:
-                resolution[contract_id] = 0.0
-            elif (final_data['trade_price'] >= 0.97 and final_data['bid_price'] >= 0.97) or final_data['bid_price'] >= 0.99:
-                resolution[contract_id] = 1.0
-            else:
-                resolution[contract_id] = None
-        else:
-            resolution[contract_id] = None
+            cids_by_date.setdefault(contract['end_date'], []).append(contract_id)
 
-    return resolution
+    final_quotes = []
+    for end_date, cids in sorted(cids_by_date.items()):
+        date_data = market_data.get_raw_data(end_date)
+        date_data = date_data[date_data.index.get_level_values('contract_id').isin(cids)]
+        final_quotes.append(date_data.groupby(level='contract_id').tail(1).reset_index('timestamp'))
+
+    if len(final_quotes) == 0:
+        return pd.DataFrame([], columns=FINAL_QUOTE_COLUMNS, index=pd.Index([], name='contract_id', dtype=int))
+    return pd.concat(final_quotes)[FINAL_QUOTE_COLUMNS]
+
+
+def _infer_resolution(final_quotes: pd.DataFrame) -> pd.Series:
+    """Infers resolution from final quotes, NaN when prices are not conclusive"""
+    trade_price, bid_price, ask_price = final_quotes['trade_price'], final_quotes['bid_price'], final_quotes['ask_price']
+    resolved_no = ((trade_price <= 0.03) & (ask_price <= 0.03)) | (ask_price <= 0.01)
+    resolved_yes = ((trade_price >= 0.97) & (bid_price >= 0.97)) | (bid_price >= 0.99)
+    inferred = np.select([resolved_no.to_numpy(), resolved_yes.to_numpy()], [0.0, 1.0], default=np.nan)
+    return pd.Series(inferred, index=final_quotes.index, name='resolution')
+
+
+def _get_contract_resolution_raw(ids: t.List[int]) -> t.Tuple[t.Dict[int, t.Optional[float]], t.List[int]]:
+    """Returns resolutions of ids from manual tags and final quotes, and ids with inconclusive final quotes"""
+    resolution: t.Dict[int, t.Optional[float]] = {cid: None for cid in ids}
+
+    contracts = pi_trading_lib.data.contracts.get_contracts(ids)
+    ended_contracts = {cid: contract for cid, contract in contracts.items() if contract['end_date'] is not None}
+
+    # manually tagged resolutions don't need market data
+    for contract_id in list(ended_contracts):
+        if CONTRACT_RESOLUTIONS.get(contract_id) is not None:
+            resolution[contract_id] = CONTRACT_RESOLUTIONS[contract_id]
+            del ended_contracts[contract_id]
+
+    inferred = _infer_resolution(_get_final_quotes(ended_contracts))
+    inconclusive = inferred.index[inferred.isna()].tolist()
+    inferred = inferred.dropna()
+    resolution.update(zip(inferred.index.tolist(), inferred.tolist()))
+    return resolution, inconclusive
+
+
+def _get_inferred_end_dates() -> t.Dict[int, datetime.date]:
+    """Returns {contract id: end date} for contracts already inspected without finding a resolution"""
+    query = 'SELECT contract_id, end_date FROM resolution_inference'
+    res = contract_db.get_contract_db().cursor().execute(query).fetchall()
+    return {row[0]: datetime.date.fromisoformat(row[1]) for row in res}
 
 # ========================= Updates =========================
 
@@ -70,48 +188,45 @@ def audit_resolutions():
     audit_passed = True
 
     contracts = pi_trading_lib.data.contracts.get_contracts()
-    ended_contracts = [contract['id'] for contract in contracts.values() if contract['end_date'] is not None]
-    resolutions = get_contract_resolution(ended_contracts)
-    missing_resolutions = sorted(
-        [cid for cid, res in resolutions.items() if res is None and cid not in UNRESOLVED_CONTRACTS],
-        key=lambda cid: contracts[cid]['end_date']
-    )
+    contract_df = pd.DataFrame(list(contracts.values()), columns=['id', 'market_id', 'end_date']).set_index('id')
+    contract_df['resolution'] = resolve(contract_df.index.to_numpy())
+    contract_df['ended'] = ~contract_df['end_date'].isnull()
+
+    missing_df = contract_df[
+        contract_df['ended'] & contract_df['resolution'].isnull() & ~contract_df.index.isin(list(UNRESOLVED_CONTRACTS))
+    ]
+    missing_resolutions = missing_df.sort_values('end_date', kind='stable').index.tolist()
 
     if len(missing_resolutions) > 0:
         audit_passed = False
         print(f'{len(missing_resolutions)} contract missing resolutions')
         print(missing_resolutions)
         full_names = pi_trading_lib.data.contracts.get_contract_names(missing_resolutions)
-        for cid in missing_resolutions:
+        final_quotes = _get_final_quotes({cid: contracts[cid] for cid in missing_resolutions}).reindex(missing_resolutions)
+        final_quotes['recommendation'] = np.select(
+            [final_quotes['trade_price'] < 0.1, final_quotes['trade_price'] > 0.8], [0.0, 1.0], default=np.nan
+        )
+        for cid, final_data in final_quotes.iterrows():
             contract_info = contracts[cid]
-            full_names[cid]
-            date_data = market_data.get_raw_data(contract_info['end_date'])
-            final_data = date_data.xs(cid, axis=0, level='contract_id').iloc[-1]
-            if final_data['trade_price'] < 0.1:
-                recommendation = 0.0
-            elif final_data['trade_price'] > 0.8:
-                recommendation = 1.0
-            else:
-                recommendation = None
+            recommendation = None if np.isnan(final_data['recommendation']) else final_data['recommendation']
             print(f"{cid}: {recommendation},  # {contract_info['market_id']} {contract_info['end_date']} {full_names[cid]} {final_data['trade_price']} {final_data['bid_price']} {final_data['ask_price']}")
 
     markets = pi_trading_lib.data.contracts.get_markets()
-    markets_ids = list(markets.keys())
-    all_market_contracts = pi_trading_lib.data.contracts.get_market_contracts(markets_ids)
-    for market_id, market_contract_ids in all_market_contracts.items():
-        market_contracts = pi_trading_lib.data.contracts.get_contracts(market_contract_ids)
-        if any(market_contract['end_date'] is None for market_contract in market_contracts.values()):
-            continue
-
-        contract_resolutions = get_contract_resolution(market_contract_ids)
-        num_correct = len([res for _cid, res in contract_resolutions.items() if res == 1.0])
-        if num_correct > 1:
+    contract_df['open'] = ~contract_df['ended']
+    contract_df['correct'] = contract_df['resolution'] == 1.0
+    market_df = contract_df.groupby('market_id').agg(
+        num_open=('open', 'sum'), num_correct=('correct', 'sum'), num_contracts=('correct', 'size')
+    )
+    market_df = market_df[market_df['num_open'] == 0]
+
+    for market_id in market_df.index[market_df['num_correct'] > 1].tolist():
+        audit_passed = False
+        print(f'Non-unique market resolution {market_id}')
+    no_correct = (market_df['num_correct'] == 0) & (market_df['num_contracts'] >= 2)
+    for market_id in market_df.index[no_correct].tolist():
+        if market_id not in NO_CORRECT_CONTRACT_MARKETS:
             audit_passed = False
-            print(f'Non-unique market resolution {market_id}')
-        if num_correct == 0 and len(market_contracts) >= 2:
-            if market_id not in NO_CORRECT_CONTRACT_MARKETS:
-                audit_passed = False
-                print(f"{market_id},  # {markets[market_id]['name']}, 0 correct contracts")
+            print(f"{market_id},  # {markets[market_id]['name']}, 0 correct contracts")
 
     if audit_passed:
         print('Audit Passed')
@@ -122,17 +237,47 @@ def audit_resolutions():
 
 
 @pi_trading_lib.timers.timer
-def update_contract_resolutions():
+def update_contract_resolutions(force: bool = False):
+    """Infers missing resolutions from market data
+
+    Contracts whose final quote was inconclusive are skipped unless their end date changed since the last run,
+    or force is set. Contracts ending today or later, or on a date without archived market data, are left for
+    a later run.
+    """
     all_contracts = pi_trading_lib.data.contracts.get_contracts()
     db_resolutions = _get_contract_resolution_db(list(all_contracts.keys()), None)
     missing_resolutions = [cid for cid, res in db_resolutions.items() if res is None]
     print(f'{len(missing_resolutions)} contracts missing resolution')
 
-    raw_data_resolution = _get_contract_resolution_raw(missing_resolutions)
-    raw_data_resolution = [(cid, res) for cid, res in raw_data_resolution.items() if res is not None]
-    print(f'Inserting {len(raw_data_resolution)} new entries into resolution db')
+    inferred_end_dates = {} if force else _get_inferred_end_dates()
+    changed_contracts = [
+        cid for cid in missing_resolutions
+        if all_contracts[cid]['end_date'] is not None and (
+            cid in CONTRACT_RESOLUTIONS or inferred_end_dates.get(cid) != all_contracts[cid]['end_date']
+        )
+    ]
+    print(f'{len(changed_contracts)} contracts changed since last update')
+
+    today = datetime.date.today()
+    end_dates = set(all_contracts[cid]['end_date'] for cid in changed_contracts)
+    archived = {end_date: os.path.exists(data_archive.get_data_file('market_data_csv', {'date': end_date}))
+                for end_date in end_dates}
+    ready_contracts = []
+    for cid in changed_contracts:
+        end_date = all_contracts[cid]['end_date']
+        # manually tagged resolutions don't need market data
+        if end_date < today and (CONTRACT_RESOLUTIONS.get(cid) is not None or archived[end_date]):
+            ready_contracts.append(cid)
+    print(f'{len(changed_contracts) - len(ready_contracts)} contracts without final market data yet')
+
+    raw_data_resolution, inconclusive = _get_contract_resolution_raw(ready_contracts)
+    new_resolutions = [(cid, res) for cid, res in raw_data_resolution.items() if res is not None]
+    unresolved = [(cid, all_contracts[cid]['end_date'].isoformat()) for cid in inconclusive]
+    print(f'Inserting {len(new_resolutions)} new entries into resolution db')
     with contract_db.get_contract_db() as db:
-        db.executemany('INSERT INTO resolution VALUES (?, ?)', (raw_data_resolution))
+        db.executemany('INSERT INTO resolution VALUES (?, ?)', new_resolutions)
+        db.executemany('INSERT OR REPLACE INTO resolution_inference VALUES (?, ?)', unresolved)
+    invalidate_resolution_table()
 
 
 if __name__ == "__main__":
@@ -141,9 +286,10 @@ if __name__ == "__main__":
 
     audit_parser = subparsers.add_parser('audit', aliases=['a'])
     update_parser = subparsers.add_parser('update', aliases=['u'])
+    update_parser.add_argument('--force', action='store_true')
 
     args = parser.parse_args()
     if args.subparser in ['audit', 'a']:
         audit_resolutions()
     if args.subparser in ['update', 'u']:
-        update_contract_resolutions()
+        update_contract_resolutions(force=args.force)
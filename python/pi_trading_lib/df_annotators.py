@@ -14,9 +14,7 @@ def add_name(df: pd.DataFrame, cid_col: str = 'cid') -> pd.DataFrame:
 
 
 def add_resolution(df: pd.DataFrame, date: t.Optional[datetime.date] = None, cid_col: str = 'cid') -> pd.DataFrame:
-    contracts = df[cid_col].unique().tolist()
-    resolutions = resolution.get_contract_resolution(contracts, date)
-    df['resolution'] = df[cid_col].map(resolutions)
+    df['resolution'] = resolution.resolve(df[cid_col].to_numpy(), date)
     return df
 
 
@@ -32,7 +32,7 @@ class Fifo:
             entry = FifoEntry(cid, price, qty)
             cost = self.apply_fifo(entry)
             change_costs[cid] = cost
-        cost_ser = pd.Series(change_costs, name='cost')
+        cost_ser = pd.Series(change_costs, name='cost', dtype='float64')
         return cost_ser
 
     def resolve(self, cids: t.Dict[int, float]):
@@ -123,11 +123,11 @@ class Fifo:
             for entry in cid_queue:
                 cost += abs(entry.qty) * entry.price
             pos_costs[cid] = cost
-        pos_cost = pd.Series(pos_costs, name='net_cost')
+        pos_cost = pd.Series(pos_costs, name='net_cost', dtype='float64')
         return pos_cost
 
     def realized_pnl(self) -> pd.Series:
         return pd.Series(self.cid_realized_pnl, name='realized_pnl')
 
     def fees(self) -> pd.Series:
-        return pd.Series(self.cid_fees, name='fees')
+        return pd.Series(self.cid_fees, name='fees', dtype='float64')
@@ -32,8 +32,11 @@ class Fill:
         )
         self.info.update({'cid': book_info.name})
 
-    def add_sim_info(self, date: datetime.date, fill_id: int):
+    def add_sim_info(self, date: datetime.date, fill_id: int, time: t.Optional[datetime.datetime] = None):
         self.info.update({'date': datetime_ext.to_str(date), 'fill_id': fill_id})
+        if time is not None:
+            # intraday rebalances, start of day fills have no time
+            self.info['time'] = time.strftime('%H:%M:%S')
 
     def add_model_info(self, model_info: t.Dict[str, t.Any]):
         # TODO: do some safety check in columns
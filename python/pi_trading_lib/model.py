@@ -5,13 +5,109 @@ from abc import abstractmethod, ABC
 import numpy as np
 import pandas as pd
 
+from pi_trading_lib.data.market_data import MarketDataSnapshot
 import pi_trading_lib.model_config as model_config
 
 
 PIPOSITION_LIMIT_VALUE = 825 # PI position limit of 850 - some buffer room
 
 
+def scenarios_enabled(config: model_config.Config) -> bool:
+    """Scenarios are only used by the scenario objectives of the optimizer"""
+    return bool(config['optimizer-objective'] != 'linear')
+
+
+class ModelOutput:
+    """Outputs of a model for a single date, price and factor values are aligned with universe"""
+    def __init__(self, universe: np.ndarray, price: t.Optional[np.ndarray], factor: t.Optional[np.ndarray],
+                 scenarios: t.Optional[pd.DataFrame]):
+        self.universe = universe
+        self.price = price
+        self.factor = factor
+        self.scenarios = scenarios
+
+    @staticmethod
+    def from_series(universe: np.ndarray, price: t.Optional[pd.Series], factor: t.Optional[pd.Series],
+                    scenarios: t.Optional[pd.DataFrame]) -> 'ModelOutput':
+        universe = np.asarray(universe, dtype=np.int64)
+        return ModelOutput(
+            universe,
+            None if price is None else price.reindex(universe).to_numpy(dtype=np.float64),
+            None if factor is None else factor.reindex(universe).to_numpy(dtype=np.float64),
+            scenarios,
+        )
+
+    def get_price(self) -> t.Optional[pd.Series]:
+        return None if self.price is None else pd.Series(self.price, index=self.universe)
+
+    def get_factor(self) -> t.Optional[pd.Series]:
+        return None if self.factor is None else pd.Series(self.factor, index=self.universe)
+
+
+class ModelOutputs:
+    """Outputs of a model for several dates as (date, contract) arrays over the union of the daily universes
+
+    in_universe marks the model universe of each date, price and factor are NaN outside of it and for
+    dates without a price or factor, see has_price and has_factor.
+    """
+    def __init__(self, dates: t.List[datetime.date], cids: np.ndarray, in_universe: np.ndarray,
+                 price: np.ndarray, has_price: np.ndarray, factor: np.ndarray, has_factor: np.ndarray,
+                 scenarios: t.Dict[datetime.date, pd.DataFrame]):
+        assert in_universe.shape == price.shape == factor.shape == (len(dates), len(cids))
+        self.dates = dates
+        self.cids = cids
+        self.in_universe = in_universe
+        self.price = price
+        self.has_price = has_price
+        self.factor = factor
+        self.has_factor = has_factor
+        self.scenarios = scenarios
+        self.date_index = {date: idx for idx, date in enumerate(dates)}
+
+    @staticmethod
+    def from_daily(dates: t.List[datetime.date], outputs: t.List[ModelOutput]) -> 'ModelOutputs':
+        assert len(dates) == len(outputs)
+        cids = np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] + [output.universe for output in outputs]))
+        cids = cids.astype(np.int64)
+        shape = (len(dates), len(cids))
+        in_universe = np.zeros(shape, dtype=bool)
+        price, factor = np.full(shape, np.nan), np.full(shape, np.nan)
+        has_price, has_factor = np.zeros(len(dates), dtype=bool), np.zeros(len(dates), dtype=bool)
+        scenarios = {}
+        for row, output in enumerate(outputs):
+            cols = np.searchsorted(cids, output.universe)
+            in_universe[row, cols] = True
+            if output.price is not None:
+                price[row, cols] = output.price
+                has_price[row] = True
+            if output.factor is not None:
+                factor[row, cols] = output.factor
+                has_factor[row] = True
+            if output.scenarios is not None:
+                scenarios[dates[row]] = output.scenarios
+        return ModelOutputs(dates, cids, in_universe, price, has_price, factor, has_factor, scenarios)
+
+    def get(self, date: datetime.date) -> ModelOutput:
+        row = self.date_index[date]
+        cols = np.nonzero(self.in_universe[row])[0]
+        return ModelOutput(
+            self.cids[cols],
+            self.price[row, cols] if self.has_price[row] else None,
+            self.factor[row, cols] if self.has_factor[row] else None,
+            self.scenarios.get(date),
+        )
+
+    def price_df(self) -> pd.DataFrame:
+        return pd.DataFrame(self.price, index=self.dates, columns=self.cids)
+
+    def factor_df(self) -> pd.DataFrame:
+        return pd.DataFrame(self.factor, index=self.dates, columns=self.cids)
+
+
 class Model(ABC):
+    def __init__(self):
+        self._output_memo: t.Dict[t.Tuple[model_config.Config, datetime.date], ModelOutput] = {}
+
     def get_price(self, config: model_config.Config, date: datetime.date) -> t.Optional[pd.Series]:
         return None
 
@@ -21,10 +117,47 @@ class Model(ABC):
     def get_factor(self, config: model_config.Config, date: datetime.date) -> t.Optional[pd.Series]:
         return None
 
+    def get_scenarios(self, config: model_config.Config, date: datetime.date) -> t.Optional[pd.DataFrame]:
+        """Returns (sample, contract id) matrix of joint payoff samples, 1 where the contract resolves YES"""
+        return None
+
     @abstractmethod
     def get_universe(self, config: model_config.Config, date: datetime.date) -> np.ndarray:
         pass
 
+    def prepare(self, config: model_config.Config, dates: t.List[datetime.date]):
+        """Called once before outputs for dates are computed in worker processes
+
+        Models should build any state shared between dates here, since workers must not write it concurrently.
+        """
+        pass
+
+    def compute_live(self, config: model_config.Config, date: datetime.date,
+                     snapshot: MarketDataSnapshot) -> t.Optional[ModelOutput]:
+        """Returns outputs for the contracts of a live intraday snapshot
+
+        None if outputs don't depend on intraday market data, the outputs computed for date are used instead.
+        """
+        return None
+
+    def compute(self, config: model_config.Config, dates: t.List[datetime.date]) -> ModelOutputs:
+        """Returns outputs for dates, memoized per date so overlapping calls only compute new dates"""
+        missing = [date for date in dict.fromkeys(dates) if (config, date) not in self._output_memo]
+        if len(missing) > 0:
+            outputs = self._compute(config, missing)
+            for date in missing:
+                self._output_memo[(config, date)] = outputs.get(date)
+        return ModelOutputs.from_daily(dates, [self._output_memo[(config, date)] for date in dates])
+
+    def _compute(self, config: model_config.Config, dates: t.List[datetime.date]) -> ModelOutputs:
+        """Computes outputs for dates, models override this to share work between outputs or dates"""
+        outputs = []
+        for date in dates:
+            scenarios = self.get_scenarios(config, date) if scenarios_enabled(config) else None
+            outputs.append(ModelOutput.from_series(self.get_universe(config, date), self.get_price(config, date),
+                                                   self.get_factor(config, date), scenarios))
+        return ModelOutputs.from_daily(dates, outputs)
+
     @property
     @abstractmethod
     def name(self) -> str:
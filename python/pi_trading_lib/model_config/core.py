@@ -2,6 +2,7 @@
 
 config = {
     'sim-version': 1, # use for forcing sim after code updates
+    'sim-rebalance-interval': None, # minutes between intraday rebalances, None only rebalances at the start of day
 
     'capital': 10000.0,
     'use-final-res': False,
@@ -12,6 +13,18 @@ config = {
     'optimizer-std-penalty': 0.01 * 0.005, # increase required edge with position size, addition 0.01 edge per 200 shares
     'optimizer-take-edge': 0.015,
 
+    # 'linear' expected value with optimizer-std-penalty, 'kelly' expected log value or 'cvar' expected value with
+    # optimizer-cvar-penalty times the expected loss in the worst optimizer-cvar-alpha of scenarios
+    'optimizer-objective': 'linear',
+    'optimizer-scenarios': 250, # ECOS solve time grows faster than linearly, 300 contracts take ~0.2s at 250
+    'optimizer-cvar-alpha': 0.05,
+    'optimizer-cvar-penalty': 1.0,
+
+    # only solve for contracts that can trade, fixing the others at their position, and optionally check the
+    # result against solving for every contract
+    'optimizer-reduce': True,
+    'optimizer-reduce-validate': False,
+
     # risk limits
     'optimizer-max-add-order-size': 200,
 }
@@ -1,20 +1,21 @@
 import argparse
 import concurrent.futures
 import datetime
+import functools
 import logging
 import os
 import typing as t
 
-from sklearn.linear_model import LinearRegression
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
 
 from pi_trading_lib.data.resolution import NO_CORRECT_CONTRACT_MARKETS, UNRESOLVED_CONTRACTS
-from pi_trading_lib.model import Model
+from pi_trading_lib.model import Model, ModelOutput, ModelOutputs
 import pi_trading_lib.data.contracts
 import pi_trading_lib.data.market_data as market_data
+import pi_trading_lib.data.resolution as resolution
 import pi_trading_lib.datetime_ext as datetime_ext
 import pi_trading_lib.decorators
 import pi_trading_lib.df_annotators
@@ -24,6 +25,9 @@ import pi_trading_lib.model_config as model_config
 import pi_trading_lib.timers
 import pi_trading_lib.work_dir as work_dir
 
+# sample count above which calibration curve fitting is split across processes
+PARALLEL_FIT_MIN_SAMPLES = 2000000
+
 
 @pi_trading_lib.decorators.memoize()
 @pi_trading_lib.timers.timer
@@ -59,14 +63,122 @@ def sample_date(date: datetime.date, binary: bool, config: model_config.Config)
         assert False, 'only sod sample method is supported'
 
 
+class SampleStore:
+    """Append-only store of daily calibration samples for one sample config
+
+    Samples are persisted in the work dir, so each new fit date only samples the dates not seen before.
+    The dates file is appended after samples for a date are written, so samples of dates missing from it
+    were partially written and are dropped from the samples file on load.
+
+    Resolutions are looked up once for newly added samples and kept in memory, since they can change
+    when the contract db is updated.
+    """
+    COLUMNS = ['contract_id', 'market_id', 'trade_price']
+
+    def __init__(self, binary: bool, sample_config: model_config.Config):
+        self.binary = binary
+        self.sample_config = sample_config
+        self.store_dir = work_dir.get_uri('calibration_samples', sample_config)
+        series_name = 'bin' if binary else 'non_bin'
+        self.samples_path = os.path.join(self.store_dir, f'{series_name}_samples.csv')
+        self.dates_path = os.path.join(self.store_dir, f'{series_name}_dates.txt')
+
+        self.dates: t.Set[datetime.date] = set()
+        self.pending: t.List[pd.DataFrame] = []
+        self.samples = pd.DataFrame({
+            'date': pd.Series([], dtype='datetime64[ns]'),
+            'contract_id': pd.Series([], dtype=np.int64),
+            'market_id': pd.Series([], dtype=np.int64),
+            'trade_price': pd.Series([], dtype=np.float64),
+        })
+        self.resolution_table: t.Optional[resolution.ResolutionTable] = None
+        self.resolutions = np.array([])
+        self.resolution_end_dates = np.array([], dtype='datetime64[D]')
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.dates_path):
+            if os.path.exists(self.samples_path):
+                os.remove(self.samples_path)
+            return
+        with open(self.dates_path, 'r') as f:
+            self.dates = set(datetime_ext.from_str(line.rstrip()) for line in f if line.strip())
+        samples = pd.read_csv(self.samples_path, dtype={'date': str})
+        listed = pd.to_datetime(samples['date'], format=datetime_ext.STANDARD_DATE_FORMAT).dt.date.isin(self.dates)
+        if not listed.all():
+            # otherwise the rows would be counted again once the date is sampled and listed
+            logging.warning(f'Dropping {(~listed).sum()} partially written samples from {self.samples_path}')
+            tmp_path = self.samples_path + '.tmp'
+            samples[listed].to_csv(tmp_path, index=False)
+            os.replace(tmp_path, self.samples_path)
+        samples = samples[listed].copy()
+        samples['date'] = pd.to_datetime(samples['date'], format=datetime_ext.STANDARD_DATE_FORMAT)
+        self.pending.append(samples)
+
+    def _append(self, date: datetime.date):
+        date_samples = sample_date(date, self.binary, self.sample_config)[SampleStore.COLUMNS].copy()
+        date_samples.insert(0, 'date', datetime_ext.to_str(date))
+
+        with fs.safe_open(self.samples_path, 'a', newline='') as f:
+            date_samples.to_csv(f, header=f.tell() == 0, index=False)
+        with fs.safe_open(self.dates_path, 'a') as f:
+            f.write(datetime_ext.to_str(date) + '\n')
+
+        date_samples['date'] = pd.Timestamp(date)
+        self.pending.append(date_samples)
+        self.dates.add(date)
+
+    def _refresh(self):
+        """Merges newly added samples and annotates their resolution"""
+        table = resolution.get_resolution_table()
+        if table is not self.resolution_table:
+            # resolutions were reloaded, annotate all samples again
+            self.pending = [self.samples] + self.pending
+            self.samples = self.samples.iloc[:0]
+            self.resolutions = self.resolutions[:0]
+            self.resolution_end_dates = self.resolution_end_dates[:0]
+            self.resolution_table = table
+
+        pending = [df for df in self.pending if len(df) > 0]
+        self.pending = []
+        if len(pending) == 0:
+            return
+
+        new_samples = pd.concat(pending, ignore_index=True)
+        values, end_dates = table.lookup(new_samples['contract_id'].to_numpy())
+        self.samples = pd.concat([self.samples, new_samples], ignore_index=True)
+        self.resolutions = np.concatenate([self.resolutions, values])
+        self.resolution_end_dates = np.concatenate([self.resolution_end_dates, end_dates])
+
+    @pi_trading_lib.timers.timer
+    def get(self, begin_date: datetime.date, end_date: datetime.date,
+            as_of_date: t.Optional[datetime.date] = None) -> pd.DataFrame:
+        """Returns samples in [begin_date, end_date] annotated with resolutions known as of as_of_date"""
+        for date in datetime_ext.date_range(begin_date, end_date, skip_dates=market_data.missing_market_data_days()):
+            if date not in self.dates:
+                self._append(date)
+        self._refresh()
+
+        sample_dates = self.samples['date'].to_numpy().astype('datetime64[D]')
+        in_range = (sample_dates >= np.datetime64(begin_date, 'D')) & (sample_dates <= np.datetime64(end_date, 'D'))
+        resolutions = self.resolutions
+        if as_of_date is not None:
+            resolutions = resolution.mask_resolutions(resolutions, self.resolution_end_dates, as_of_date)
+
+        samples_df = self.samples.loc[in_range, SampleStore.COLUMNS].copy()
+        samples_df['resolution'] = resolutions[in_range]
+        return samples_df
+
+
+@functools.lru_cache()
+def get_sample_store(binary: bool, sample_config: model_config.Config) -> SampleStore:
+    return SampleStore(binary, sample_config)
+
+
 @pi_trading_lib.timers.timer
 def sample(begin_date: datetime.date, end_date: datetime.date, binary: bool, config: model_config.Config):
-    dfs = []
-    for date in datetime_ext.date_range(begin_date, end_date, skip_dates=market_data.missing_market_data_days()):
-        date_sample_df = sample_date(date, binary, config.component_params('calibration-model-fit-sample'))
-        dfs.append(date_sample_df)
-    all_samples_df = pd.concat(dfs)
-    all_samples_df = pi_trading_lib.df_annotators.add_resolution(all_samples_df, end_date, cid_col='contract_id')
+    sample_store = get_sample_store(binary, config.component_params('calibration-model-fit-sample'))
+    all_samples_df = sample_store.get(begin_date, end_date, as_of_date=end_date)
     all_samples_df = all_samples_df.dropna()
 
     if binary and config['calibration-model-fit-symmetric-binary']:
@@ -78,19 +190,52 @@ def sample(begin_date: datetime.date, end_date: datetime.date, binary: bool, con
     return all_samples_df
 
 
-def _fit_for_price(px: float, window_df: pd.DataFrame) -> float:
-    if len(window_df) == 0:
-        logging.debug(f'No data from price {px}')
-        return px
-
-    lin_reg = LinearRegression()
-
-    lin_model = lin_reg.fit(np.reshape(window_df['trade_price'].to_numpy(), (-1, 1)),
-                            window_df['resolution'].to_numpy(),
-                            window_df['weight'].to_numpy())
-    lin_model_estimate: float = lin_model.coef_[0] * px + lin_model.intercept_  # typing: ignore
-    lin_model_estimate = max(0.0, min(1.0, lin_model_estimate))
-    return lin_model_estimate
+def _wls_estimate(x: np.ndarray, y: np.ndarray, weight: np.ndarray) -> float:
+    """Weighted least squares line through (x, y) evaluated at x = 0
+
+    Matches LinearRegression().fit(x, y, weight), including a zero slope when x is constant.
+    """
+    sum_weight = weight.sum()
+    x_mean = weight @ x / sum_weight
+    y_mean = weight @ y / sum_weight
+    x_dev = x - x_mean
+    x_var = weight @ (x_dev * x_dev)
+    if x_var <= 0.0:
+        return float(y_mean)
+    slope = weight @ (x_dev * (y - y_mean)) / x_var
+    return float(y_mean - slope * x_mean)
+
+
+def fit_local_linear(prices: np.ndarray, trade_price: np.ndarray, resolution: np.ndarray,
+                     contract_id: np.ndarray, market_weight: t.Optional[np.ndarray],
+                     window_width: float, weight_alpha: float, local_normalize: bool) -> np.ndarray:
+    """Weighted local linear fit of resolution on trade_price, evaluated at each of prices
+
+    Sample arrays must be sorted by trade_price so each window is a contiguous slice. Samples in
+    [px - window_width, px + window_width] are weighted by exp(-weight_alpha * |trade_price - px|), rounded
+    to 3 decimals, times market_weight, or times (1 / window samples of the contract)^0.75 when local_normalize.
+    Prices without samples fall back to px. Estimates are clipped to [0, 1].
+    """
+    lowers = np.searchsorted(trade_price, prices - window_width, side='left')
+    uppers = np.searchsorted(trade_price, prices + window_width, side='right')
+
+    estimates = np.array(prices, dtype=np.float64)
+    for i, px in enumerate(prices):
+        lower, upper = lowers[i], uppers[i]
+        if lower >= upper:
+            logging.debug(f'No data from price {px}')
+            continue
+
+        window_x = trade_price[lower:upper] - px
+        weight = np.round(np.exp(-1.0 * weight_alpha * np.abs(window_x)), decimals=3)
+        if local_normalize:
+            _, inverse, counts = np.unique(contract_id[lower:upper], return_inverse=True, return_counts=True)
+            weight = weight * np.power(1 / counts[inverse], 0.75)
+        elif market_weight is not None:
+            weight = weight * market_weight[lower:upper]
+
+        estimates[i] = _wls_estimate(window_x, resolution[lower:upper], weight)
+    return np.clip(estimates, 0.0, 1.0)  # type: ignore
 
 
 @pi_trading_lib.timers.timer
@@ -114,51 +259,215 @@ def fit_model(date: datetime.date, binary: bool, config: model_config.Config) ->
     # samples at edge of window have e^{-alpha}. e^{-1} ~= 0.368
     weight_alpha = config['calibration-model-fit-sample-weight-alpha'] * 1 / window_width
 
+    sample_df = sample_df.sort_values('trade_price', kind='stable')
+    trade_price = sample_df['trade_price'].to_numpy(dtype=np.float64)
+    resolution = sample_df['resolution'].to_numpy(dtype=np.float64)
+    contract_id = sample_df['contract_id'].to_numpy()
+
+    market_weight: t.Optional[np.ndarray] = None
     if config['calibration-model-fit-market-normalize'] == 'global':
-        market_total_weight = sample_df.groupby('contract_id').size()
-        market_total_weight = market_total_weight.reindex(sample_df['contract_id'].unique()).fillna(0.001)
-        market_weight = 1 / market_total_weight
-        market_weight.name = 'market_weight'
-        market_weight_df = market_weight.to_frame()
-        sample_df = sample_df.merge(market_weight_df, left_on='contract_id', right_index=True, how="left")
-    elif config['calibration-model-fit-market-normalize'] is None:
-        sample_df['market_weight'] = 1.0
-
-    futures = []
-    with concurrent.futures.ProcessPoolExecutor(max_workers=8) as executor:
-        for i in range(1, 100):
-            px = i * 0.01
-            window_lower = px - window_width
-            window_upper = px + window_width
-            df_filter = (sample_df['trade_price'] >= window_lower) & (sample_df['trade_price'] <= window_upper)
-            window_df = sample_df[df_filter].copy()
-            window_df['dist_weight'] = np.round(np.exp(-1.0 * weight_alpha * (window_df['trade_price'] - px).abs()), decimals=3)
-
-            if config['calibration-model-fit-market-normalize'] == 'local':
-                market_total_weight = window_df.groupby('contract_id').size()
-                market_total_weight = market_total_weight.reindex(window_df['contract_id'].unique()).fillna(0.001)
-                market_weight = 1 / market_total_weight
-                market_weight = market_weight.pow(0.75)
-                market_weight.name = 'market_weight'
-                market_weight_df = market_weight.to_frame()
-                window_df = window_df.merge(market_weight_df, left_on='contract_id', right_index=True, how="left")
-
-            window_df['weight'] = window_df['dist_weight'] * window_df['market_weight']
-            future = executor.submit(_fit_for_price, px, window_df)
-            futures.append(future)
-    calibration_model = [future.result() for future in futures]
+        _, inverse, counts = np.unique(contract_id, return_inverse=True, return_counts=True)
+        market_weight = 1 / counts[inverse]
+    local_normalize = config['calibration-model-fit-market-normalize'] == 'local'
+
+    prices = cents_index * 0.01
+    fit_args = (trade_price, resolution, contract_id, market_weight, window_width, weight_alpha, local_normalize)
+    if len(sample_df) >= PARALLEL_FIT_MIN_SAMPLES:
+        # split price points across processes, each receives the sample arrays once
+        with concurrent.futures.ProcessPoolExecutor(max_workers=8) as executor:
+            futures = [executor.submit(fit_local_linear, price_chunk, *fit_args)
+                       for price_chunk in np.array_split(prices, 8)]
+        calibration_model = np.concatenate([future.result() for future in futures])
+    else:
+        calibration_model = fit_local_linear(prices, *fit_args)
 
     sample_df['trade_price_cents'] = (sample_df['trade_price'] * 100).astype(int)
     sample_density_ser = sample_df.groupby('trade_price_cents').size().reindex(cents_index).fillna(0.0)
 
+    return _calibration_frame(series_name, calibration_model, sample_density_ser.to_numpy())
+
+
+def _calibration_frame(series_name: str, calibration_model: np.ndarray, sample_density: np.ndarray) -> pd.DataFrame:
+    cents_index = np.arange(1, 100)
     model_col = f'{series_name}_model_price'
     calibration_df = pd.DataFrame(calibration_model, columns=[model_col], index=cents_index)
     calibration_df[model_col] = calibration_df[model_col].rolling(window=5, min_periods=1, center=True).mean()
-    calibration_df[f'{series_name}_sample_density'] = sample_density_ser
+    calibration_df[f'{series_name}_sample_density'] = sample_density
     calibration_df.index.name = 'price_cents'
     return calibration_df
 
 
+class OnlineCalibrationFitter:
+    """Incremental equivalent of fit_model for consecutive fit dates
+
+    Keeps distance weighted sufficient statistics for every (side, price window, contract), where side 1 holds
+    the mirrored samples for symmetric binary fits. Resolutions are constant per contract, so the statistics
+    don't depend on them and a contract's samples simply enter the fit once it is resolved as of the fit date.
+    Market normalization only rescales a contract's statistics, so each fit is a weighted sum over contracts.
+
+    Fit dates must not go backwards, otherwise the statistics are rebuilt from the fit begin date.
+    Market resampling is not supported, see fit_model.
+    """
+    GROWTH = 1024
+    SAMPLE_CHUNK = 1 << 16
+
+    def __init__(self, binary: bool, config: model_config.Config):
+        assert config['calibration-model-fit-market-resample-seed'] is None
+        self.binary = binary
+        self.series_name = 'bin' if binary else 'non_bin'
+        self.begin_date = datetime_ext.from_str(config['calibration-model-fit-begin-date'])
+        self.sample_store = get_sample_store(binary, config.component_params('calibration-model-fit-sample'))
+        self.prices = np.arange(1, 100) * 0.01
+        self.window_width = config['calibration-model-fit-window-size']
+        self.weight_alpha = config['calibration-model-fit-sample-weight-alpha'] * 1 / self.window_width
+        self.normalize = config['calibration-model-fit-market-normalize']
+        self.sides = 2 if binary and config['calibration-model-fit-symmetric-binary'] else 1
+        self._reset()
+
+    def _reset(self):
+        self.sampled_through: t.Optional[datetime.date] = None
+        self.contract_index: t.Dict[int, int] = {}
+        self.contract_ids = np.zeros(0, dtype=np.int64)
+        self.market_ids = np.zeros(0, dtype=np.int64)
+        # first sample row of each contract, to order markets like fit_model
+        self.first_rows = np.zeros(0, dtype=np.int64)
+        self.weight_sum = np.zeros((self.sides, len(self.prices), 0))
+        self.weight_x = np.zeros((self.sides, len(self.prices), 0))
+        self.weight_xx = np.zeros((self.sides, len(self.prices), 0))
+        self.window_count = np.zeros((self.sides, len(self.prices), 0))
+        self.cents_count = np.zeros((self.sides, 101, 0))
+
+    def _contract_indices(self, cids: np.ndarray, mids: np.ndarray) -> np.ndarray:
+        contract_markets = dict(zip(cids.tolist(), mids.tolist()))
+        new_cids = [cid for cid in sorted(contract_markets) if cid not in self.contract_index]
+        if len(new_cids) > 0:
+            size = len(self.contract_index)
+            self.contract_index.update({cid: size + i for i, cid in enumerate(new_cids)})
+            capacity = self.weight_sum.shape[2]
+            if len(self.contract_index) > capacity:
+                pad = ((0, 0), (0, 0), (0, max(len(self.contract_index) - capacity, OnlineCalibrationFitter.GROWTH, capacity)))
+                self.weight_sum, self.weight_x, self.weight_xx, self.window_count, self.cents_count = (
+                    np.pad(arr, pad) for arr in
+                    [self.weight_sum, self.weight_x, self.weight_xx, self.window_count, self.cents_count]
+                )
+                self.contract_ids = np.pad(self.contract_ids, (0, pad[2][1]))
+                self.market_ids = np.pad(self.market_ids, (0, pad[2][1]))
+                self.first_rows = np.pad(self.first_rows, (0, pad[2][1]), constant_values=np.iinfo(np.int64).max)
+            self.contract_ids[size:size + len(new_cids)] = new_cids
+            self.market_ids[size:size + len(new_cids)] = [contract_markets[cid] for cid in new_cids]
+        return np.array([self.contract_index[cid] for cid in cids.tolist()], dtype=np.int64)
+
+    def add_samples(self, samples: pd.DataFrame):
+        samples = samples[~samples['trade_price'].isnull()]
+        if len(samples) == 0:
+            return
+        contract_idx = self._contract_indices(samples['contract_id'].to_numpy(dtype=np.int64),
+                                              samples['market_id'].to_numpy(dtype=np.int64))
+        trade_price = samples['trade_price'].to_numpy(dtype=np.float64)
+        # sample stores keep the row labels of their sample table
+        np.minimum.at(self.first_rows, contract_idx, samples.index.to_numpy(dtype=np.int64))
+
+        # (window, sample) pairs take about 2 * window width / 0.01 entries per sample, so large sample sets are
+        # added in chunks
+        for begin in range(0, len(samples), OnlineCalibrationFitter.SAMPLE_CHUNK):
+            end = begin + OnlineCalibrationFitter.SAMPLE_CHUNK
+            self._add_samples(trade_price[begin:end], contract_idx[begin:end])
+
+    def _add_samples(self, trade_price: np.ndarray, contract_idx: np.ndarray):
+        # windows are sorted by price, so the windows containing a sample are a contiguous range
+        lower = self.prices - self.window_width
+        upper = self.prices + self.window_width
+        for side in range(self.sides):
+            x = trade_price if side == 0 else 1.0 - trade_price
+            window_begin = np.searchsorted(upper, x, side='left')
+            window_count = np.maximum(np.searchsorted(lower, x, side='right') - window_begin, 0)
+            sample_idx = np.repeat(np.arange(len(x)), window_count)
+            pair_offsets = np.arange(len(sample_idx)) - np.repeat(np.cumsum(window_count) - window_count, window_count)
+            window_idx = window_begin[sample_idx] + pair_offsets
+            window_x = x[sample_idx] - self.prices[window_idx]
+            weight = np.round(np.exp(-1.0 * self.weight_alpha * np.abs(window_x)), decimals=3)
+
+            stat_idx = np.ravel_multi_index((window_idx, contract_idx[sample_idx]), self.weight_sum.shape[1:])
+            np.add.at(self.weight_sum[side].reshape(-1), stat_idx, weight)
+            np.add.at(self.weight_x[side].reshape(-1), stat_idx, weight * window_x)
+            np.add.at(self.weight_xx[side].reshape(-1), stat_idx, weight * window_x * window_x)
+            np.add.at(self.window_count[side].reshape(-1), stat_idx, 1)
+            cents_idx = np.ravel_multi_index(((x * 100).astype(int), contract_idx), self.cents_count.shape[1:])
+            np.add.at(self.cents_count[side].reshape(-1), cents_idx, 1)
+
+    def _update(self, end_date: datetime.date):
+        if self.sampled_through is not None and end_date < self.sampled_through:
+            self._reset()
+        add_begin = self.begin_date if self.sampled_through is None else self.sampled_through + datetime.timedelta(days=1)
+        if add_begin <= end_date:
+            self.add_samples(self.sample_store.get(add_begin, end_date))
+            self.sampled_through = end_date
+
+    def contract_stats(self, date: datetime.date) -> t.Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns normalized per contract fit statistics for contracts resolved before date
+
+        returns:
+            stats: (5, window, contract) array of weight, weight * x, weight * x^2, weight * y, weight * x * y sums
+            density: (cents, contract) sample counts
+            market_ids: (contract,) market of each contract
+            first_rows: (contract,) first sample row of each contract
+        """
+        end_date = datetime_ext.prev(date)
+        self._update(end_date)
+
+        size = len(self.contract_index)
+        resolutions, end_dates = resolution.get_resolution_table().lookup(self.contract_ids[:size])
+        resolutions = resolution.mask_resolutions(resolutions, end_dates, end_date)
+        included = ~np.isnan(resolutions)
+
+        weight_sum = self.weight_sum[:, :, :size][:, :, included]
+        weight_x = self.weight_x[:, :, :size][:, :, included]
+        weight_xx = self.weight_xx[:, :, :size][:, :, included]
+        cents_count = self.cents_count[:, :, :size][:, :, included]
+        # resolution of mirrored samples is flipped
+        side_res = np.stack([resolutions[included], 1.0 - resolutions[included]])[:self.sides, None, :]
+
+        if self.normalize == 'local':
+            window_count = self.window_count[:, :, :size][:, :, included].sum(axis=0)
+            with np.errstate(divide='ignore'):
+                market_weight = np.where(window_count > 0, np.power(1 / window_count, 0.75), 0.0)[None, :, :]
+        elif self.normalize == 'global':
+            market_weight = (1 / np.maximum(cents_count.sum(axis=(0, 1)), 1))[None, None, :]
+        else:
+            market_weight = np.ones((1, 1, weight_sum.shape[2]))
+
+        stats = np.stack([
+            (market_weight * weight_sum).sum(axis=0),
+            (market_weight * weight_x).sum(axis=0),
+            (market_weight * weight_xx).sum(axis=0),
+            (market_weight * weight_sum * side_res).sum(axis=0),
+            (market_weight * weight_x * side_res).sum(axis=0),
+        ])
+        return stats, cents_count.sum(axis=0)[1:100], self.market_ids[:size][included], self.first_rows[:size][included]
+
+    def solve(self, totals: np.ndarray) -> np.ndarray:
+        """Returns clipped window estimates from (5, ..., window) statistic totals, see contract_stats"""
+        total_weight, total_x, total_xx, total_y, total_xy = totals
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_mean = total_x / total_weight
+            y_mean = total_y / total_weight
+            x_var = total_xx - total_x * x_mean
+            slope = np.where(x_var > 1e-12 * total_weight, (total_xy - total_x * y_mean) / x_var, 0.0)
+            estimates = np.where(total_weight > 0, y_mean - slope * x_mean, self.prices)
+        return np.clip(estimates, 0.0, 1.0)
+
+    def fit(self, date: datetime.date) -> pd.DataFrame:
+        """Returns calibration curve for date, same as fit_model(date, binary, config)"""
+        stats, density, _, _ = self.contract_stats(date)
+        calibration_model = self.solve(stats.sum(axis=2))
+        return _calibration_frame(self.series_name, calibration_model, density.sum(axis=1))
+
+
+@functools.lru_cache()
+def get_online_fitter(binary: bool, config: model_config.Config) -> OnlineCalibrationFitter:
+    return OnlineCalibrationFitter(binary, config)
+
+
 @pi_trading_lib.timers.timer
 def generate_parameters(date: datetime.date, config: model_config.Config) -> str:
     output_dir = os.path.join(work_dir.get_uri('calibration_model', config.component_params('calibration-model-fit'), date_1=date))
@@ -166,8 +475,13 @@ def generate_parameters(date: datetime.date, config: model_config.Config) -> str
     if os.path.exists(output_dir):
         return output_dir
 
-    binary_df = fit_model(date, True, config)
-    nonbinary_df = fit_model(date, False, config)
+    if config['calibration-model-fit-market-resample-seed'] is None:
+        fit_config = config.component_params('calibration-model-fit')
+        binary_df = get_online_fitter(True, fit_config).fit(date)
+        nonbinary_df = get_online_fitter(False, fit_config).fit(date)
+    else:
+        binary_df = fit_model(date, True, config)
+        nonbinary_df = fit_model(date, False, config)
 
     calibration_df = binary_df.join(nonbinary_df)
 
@@ -178,47 +492,108 @@ def generate_parameters(date: datetime.date, config: model_config.Config) -> str
     return output_dir
 
 
+def generate_parameter_history(begin_date: datetime.date, end_date: datetime.date,
+                               config: model_config.Config) -> t.Dict[datetime.date, str]:
+    """Generates parameters for every date in [begin_date, end_date], in one incremental pass"""
+    return {date: generate_parameters(date, config) for date in datetime_ext.date_range(begin_date, end_date)}
+
+
 def get_model_df(model_dir: str) -> pd.DataFrame:
     return pd.read_csv(os.path.join(model_dir, 'model.csv'), index_col='price_cents')
 
 
+# model prices indexed by price in cents, 0 to 100
+NAN_CURVE = np.full(101, np.nan)
+NAN_CURVE.setflags(write=False)
+
+
+@functools.lru_cache(maxsize=None)
+def get_model_curve(model_dir: str) -> t.Tuple[np.ndarray, np.ndarray]:
+    """Returns (binary, non binary) model price arrays indexed by price in cents, NaN for prices without a fit"""
+    model_df = get_model_df(model_dir)
+    curves = np.full((2, 101), np.nan)
+    curves[0, model_df.index.to_numpy()] = model_df['bin_model_price'].to_numpy()
+    curves[1, model_df.index.to_numpy()] = model_df['non_bin_model_price'].to_numpy()
+    curves.setflags(write=False)
+    return curves[0], curves[1]
+
+
+def binary_masks(cids: np.ndarray) -> t.Tuple[np.ndarray, np.ndarray]:
+    """Returns (binary, non binary) masks aligned with cids, contracts missing from the contract db are in neither"""
+    binary_contract_map = pi_trading_lib.data.contracts.is_binary_contract(np.unique(cids).tolist())
+    is_binary = np.array([binary_contract_map.get(cid) for cid in cids.tolist()], dtype=object)
+    masks = np.stack([is_binary == True, is_binary == False]).astype(bool)  # noqa
+    masks.setflags(write=False)
+    return masks[0], masks[1]
+
+
+@functools.lru_cache(maxsize=None)
+def get_binary_masks(date: datetime.date) -> t.Tuple[np.ndarray, np.ndarray]:
+    """Returns binary_masks aligned with the market data snapshot for date"""
+    return binary_masks(market_data.get_snapshot(date).data.index.get_level_values('contract_id').to_numpy())
+
+
 class CalibrationModel(Model):
     def __init__(self):
-        pass
+        super().__init__()
 
     def _get_contract_md(self, date: datetime.date) -> pd.DataFrame:
         snapshot = market_data.get_snapshot(date).data
         return snapshot
 
-    def get_price(self, config: model_config.Config, date: datetime.date) -> t.Optional[pd.Series]:
+    def _get_price(self, config: model_config.Config, date: datetime.date, md: market_data.MarketDataSnapshot,
+                   masks: t.Tuple[np.ndarray, np.ndarray]) -> t.Optional[pd.Series]:
         if date < datetime_ext.from_str(config['calibration-model-active-date']):
             return None
 
-        model = get_model_df(generate_parameters(date, config))
-        md = market_data.get_snapshot(date)
-
-        contracts = md.data.index.get_level_values('contract_id').unique().tolist()
-        binary_contract_map = pi_trading_lib.data.contracts.is_binary_contract(contracts)
+        bin_curve, non_bin_curve = get_model_curve(generate_parameters(date, config))
+        if not config['calibration-model-enable-binary']:
+            bin_curve = NAN_CURVE
+        if not config['calibration-model-enable-non-binary']:
+            non_bin_curve = NAN_CURVE
 
         # combine with trade_price?
-        df = pd.DataFrame([], index=md.data.index)
-        df['rounded_price'] = (md['mid_price'] * 100).round().astype(np.int64)
-        df['is_binary'] = md.data.index.get_level_values('contract_id').map(binary_contract_map)
+        mid_price = md['mid_price'].to_numpy(dtype=np.float64)
+        price_cents = np.where(np.isfinite(mid_price), np.round(mid_price * 100), 0).astype(np.int64)
+        binary_mask, non_binary_mask = masks
+        model_price = np.where(binary_mask, bin_curve[price_cents],
+                               np.where(non_binary_mask, non_bin_curve[price_cents], np.nan))
 
-        merged = df.merge(model, how='left', left_on='rounded_price', right_index=True)
-        merged['model_price'] = np.nan
+        return pd.Series(model_price, index=md.data.index, name='model_price')
 
-        if config['calibration-model-enable-non-binary']:
-            merged.loc[merged['is_binary'] == False, 'model_price'] = merged.loc[merged['is_binary'] == False, 'non_bin_model_price']  # noqa
-        if config['calibration-model-enable-binary']:
-            merged.loc[merged['is_binary'] == True, 'model_price'] = merged.loc[merged['is_binary'] == True, 'bin_model_price']  # noqa
-
-        return merged['model_price']
+    def get_price(self, config: model_config.Config, date: datetime.date) -> t.Optional[pd.Series]:
+        return self._get_price(config, date, market_data.get_snapshot(date), get_binary_masks(date))
 
     def get_universe(self, config: model_config.Config, date: datetime.date) -> np.ndarray:
         model_snapshot = self._get_contract_md(date)
         return model_snapshot.index.to_numpy()  # type: ignore
 
+    def _compute(self, config: model_config.Config, dates: t.List[datetime.date]) -> ModelOutputs:
+        outputs = []
+        for date in dates:
+            # universe and prices come from the same snapshot
+            md = market_data.get_snapshot(date)
+            universe = md.data.index.to_numpy()
+            outputs.append(ModelOutput.from_series(universe, self._get_price(config, date, md, get_binary_masks(date)),
+                                                   None, None))
+        return ModelOutputs.from_daily(dates, outputs)
+
+    def compute_live(self, config: model_config.Config, date: datetime.date,
+                     snapshot: market_data.MarketDataSnapshot) -> t.Optional[ModelOutput]:
+        # prices only depend on the fit of the date and the current mid price
+        price = self._get_price(config, date, snapshot, binary_masks(snapshot.universe))
+        return ModelOutput.from_series(snapshot.universe, price, None, None)
+
+    def prepare(self, config: model_config.Config, dates: t.List[datetime.date]):
+        # fits of every date read from the sample stores, which are appended to when a fit needs new sample dates
+        fit_dates = [date for date in dates if date >= datetime_ext.from_str(config['calibration-model-active-date'])]
+        if len(fit_dates) == 0:
+            return
+        begin_date = datetime_ext.from_str(config['calibration-model-fit-begin-date'])
+        sample_config = config.component_params('calibration-model-fit-sample')
+        for binary in [True, False]:
+            get_sample_store(binary, sample_config).get(begin_date, datetime_ext.prev(max(fit_dates)))
+
     @property
     def name(self) -> str:
         return 'calibration-model'
@@ -227,22 +602,42 @@ class CalibrationModel(Model):
 # ============================= Model debugging, metrics =========================
 
 
+@pi_trading_lib.timers.timer
+def bootstrap_model(date: datetime.date, config: model_config.Config, samples: int,
+                    percentiles: t.Sequence[float] = (5, 50, 95)) -> pd.DataFrame:
+    """Returns percentiles of bootstrapped calibration curves for date, indexed by price_cents
+
+    Resample i keeps the contracts of the markets drawn with seed i, like calibration-model-fit-market-resample-seed.
+    Every resample fit is a weighted sum of the same per contract statistics, so samples are loaded once
+    and all resamples are fit with a single matrix product.
+    """
+    config = config.override({'calibration-model-fit-market-resample-seed': None})
+    bands = []
+    for binary in [False, True]:
+        series_name = 'bin' if binary else 'non_bin'
+        fitter = get_online_fitter(binary, config)
+        stats, _, market_ids, first_rows = fitter.contract_stats(date)
+
+        # drawn like fit_model, from markets in order of appearance in the samples
+        mids = pd.unique(market_ids[np.argsort(first_rows, kind='stable')])
+        market_weights = np.zeros((samples, len(market_ids)))
+        for i in range(samples):
+            rng = np.random.default_rng(i)
+            market_weights[i] = np.isin(market_ids, rng.choice(mids, len(mids) // 2))
+
+        # (stat, window, resample) -> (stat, resample, window)
+        models = fitter.solve(np.matmul(stats, market_weights.T).transpose(0, 2, 1))
+        models_df = pd.DataFrame(models.T).rolling(window=5, min_periods=1, center=True).mean()
+        band = np.percentile(models_df.to_numpy(), percentiles, axis=1)
+        bands.append(pd.DataFrame(band.T, columns=[f'{series_name}_model_price_p{p:g}' for p in percentiles]))
+
+    bands_df = pd.concat(bands, axis=1)
+    bands_df.index = pd.Index(np.arange(1, 100), name='price_cents')
+    return bands_df
+
+
 def generate_confidence_intervals(config: model_config.Config, date: datetime.date, samples: int):
-    model_dfs = []
-    for i in range(samples):
-        print('taking sample ' + str(i))
-        config = config.override({'calibration-model-fit-market-resample-seed': i})
-        model_df = get_model_df(generate_parameters(date, config))
-        model_dfs.append(model_df)
-    merged = pd.concat(model_dfs)
-    merged['non_bin_model_price'] = merged['non_bin_model_price'] * 100
-    merged['bin_model_price'] = merged['bin_model_price'] * 100
-
-    conf_df = merged.groupby('price_cents').agg(
-        {'non_bin_model_price': ['min', 'median', 'max'],
-         'bin_model_price': ['min', 'median', 'max']}
-    )
-    conf_df = conf_df.stack(level=0).swaplevel().sort_index()
+    conf_df = bootstrap_model(date, config, samples, percentiles=(0, 50, 100)) * 100
     print(conf_df)
 
     price_line = pd.Series(np.arange(1, 100), index=np.arange(1, 100), name='price')
@@ -250,10 +645,11 @@ def generate_confidence_intervals(config: model_config.Config, date: datetime.da
 
     fig, ax = plt.subplots(1, 2)
 
-    sns.lineplot(data=merged, x='price_cents', y='non_bin_model_price', ax=ax[0], label='non-binary contracts')
-    sns.lineplot(data=merged, x='price_cents', y='bin_model_price', ax=ax[1], label='binary contracts')
-    sns.lineplot(data=price_line, ax=ax[0], label='perfect calibration')
-    sns.lineplot(data=price_line, ax=ax[1], label='perfect calibration')
+    for idx, series_name, label in [(0, 'non_bin', 'non-binary contracts'), (1, 'bin', 'binary contracts')]:
+        sns.lineplot(data=conf_df[f'{series_name}_model_price_p50'], ax=ax[idx], label=label)
+        ax[idx].fill_between(conf_df.index, conf_df[f'{series_name}_model_price_p0'],
+                             conf_df[f'{series_name}_model_price_p100'], alpha=0.3)
+        sns.lineplot(data=price_line, ax=ax[idx], label='perfect calibration')
 
     for idx in [0, 1]:
         ax[idx].set_xlabel('trade price')
@@ -276,6 +672,8 @@ def main():
     parser.add_argument('--conf', action='store_true')
     parser.add_argument('--conf-samples', default=10, type=int)
 
+    parser.add_argument('--history-begin', help='generate parameters for every date from history begin to date')
+
     # arguments for default command
     parser.add_argument('--save', action='store_true')
 
@@ -289,6 +687,13 @@ def main():
     config = model_config.get_config('calibration_model').component_params('calibration-model-fit')
     config = pi_trading_lib.model_config.override_config(config, args.override)
 
+    if args.history_begin:
+        model_dirs = generate_parameter_history(datetime_ext.from_str(args.history_begin), datetime_ext.from_str(args.date), config)
+        for date, model_dir in model_dirs.items():
+            print(date, model_dir)
+        pi_trading_lib.timers.report_timers()
+        return
+
     model_df = get_model_df(generate_parameters(datetime_ext.from_str(args.date), config))
     model_df['price'] = model_df.index.get_level_values(0) / 100
     model_df = model_df.reset_index(drop=True)
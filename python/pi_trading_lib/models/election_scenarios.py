@@ -0,0 +1,145 @@
+import datetime
+import functools
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+import pi_trading_lib.data.contract_groups as contract_groups
+import pi_trading_lib.data.fivethirtyeight as fte
+import pi_trading_lib.timers
+
+
+STATE_CONTRACTS = 'election_2020/states_pres.json'
+SIM_MAP_COLUMNS = ['winner', 'trump_ev', 'biden_ev']
+
+
+class Scenarios:
+    """Simulated election outcomes as a (scenario, state) int8 matrix, 1 where the democratic candidate wins"""
+    states: np.ndarray
+    outcomes: np.ndarray
+
+    def __init__(self, states: t.Sequence[str], outcomes: np.ndarray):
+        assert outcomes.ndim == 2 and outcomes.shape[1] == len(states)
+        self.states = np.array(states)
+        self.outcomes = outcomes.astype(np.int8)
+        self.state_index = {state: idx for idx, state in enumerate(self.states.tolist())}
+
+    @staticmethod
+    def from_sim_maps(sim_maps: pd.DataFrame) -> 'Scenarios':
+        """Builds scenarios from archived 538 simulated maps of state margins
+
+        The margin sign convention isn't part of the archive, it's inferred from the states where the
+        margin is positively correlated with the democratic electoral vote count.
+        """
+        states = [col for col in sim_maps.columns if col not in SIM_MAP_COLUMNS]
+        margins = sim_maps[states].to_numpy(dtype=np.float64)
+        biden_ev = sim_maps['biden_ev'].to_numpy(dtype=np.float64)
+
+        margin_dev = margins - margins.mean(axis=0)
+        covariance = (margin_dev * (biden_ev - biden_ev.mean())[:, None]).sum(axis=0)
+        dem_sign = 1.0 if np.median(covariance) >= 0 else -1.0
+        return Scenarios(states, dem_sign * margins > 0)
+
+    def __len__(self) -> int:
+        return len(self.outcomes)
+
+    def contract_payoffs(self, cids: t.Sequence[int],
+                         contract_info: t.Optional[t.Dict[int, t.Any]] = None) -> np.ndarray:
+        """Returns (scenario, contract) int8 matrix of contract payoffs, 1 if the contract resolves YES"""
+        if contract_info is None:
+            contract_info = contract_groups.get_contract_data(STATE_CONTRACTS)
+        state_idx = np.array([self.state_index[contract_info[cid][0]] for cid in cids], dtype=np.int64)
+        democratic = np.array([contract_info[cid][1] == 'democratic' for cid in cids], dtype=bool)
+        state_outcomes = self.outcomes[:, state_idx]
+        return np.where(democratic, state_outcomes, 1 - state_outcomes).astype(np.int8)
+
+
+class ScenarioRisk:
+    """Payoff distribution of contract positions over equally weighted scenarios
+
+    positions are signed YES share counts, negative for NO shares, and prices the YES price positions are valued at.
+    """
+    cids: np.ndarray
+    payoffs: np.ndarray
+
+    def __init__(self, cids: t.Sequence[int], payoffs: np.ndarray):
+        assert payoffs.ndim == 2 and payoffs.shape[1] == len(cids)
+        self.cids = np.array(cids)
+        self.payoffs = payoffs.astype(np.int8)
+        # matrix products run on float32, converted once
+        self._payoffs_f32 = self.payoffs.astype(np.float32)
+        self.win_prob = pd.Series(self._payoffs_f32.mean(axis=0, dtype=np.float64), index=self.cids)
+        self._covariance: t.Optional[pd.DataFrame] = None
+
+    @property
+    def nscenarios(self) -> int:
+        return len(self.payoffs)
+
+    @property
+    def covariance(self) -> pd.DataFrame:
+        """Covariance of contract payoffs across scenarios"""
+        if self._covariance is None:
+            win_prob = self.win_prob.to_numpy()
+            second_moment = (self._payoffs_f32.T @ self._payoffs_f32).astype(np.float64) / self.nscenarios
+            self._covariance = pd.DataFrame(second_moment - np.outer(win_prob, win_prob),
+                                            index=self.cids, columns=self.cids)
+        return self._covariance
+
+    def scenario_returns(self, prices: np.ndarray) -> np.ndarray:
+        """Returns (scenario, contract) per YES share returns when bought at prices"""
+        return self._payoffs_f32 - np.asarray(prices, dtype=np.float32)
+
+    def pnl(self, positions: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        """Returns pnl of positions in every scenario"""
+        positions = np.asarray(positions, dtype=np.float64)
+        return self._payoffs_f32 @ positions.astype(np.float32) - float(np.asarray(prices) @ positions)
+
+    def _tail(self, pnl: np.ndarray, alpha: float) -> np.ndarray:
+        """Returns indices of the worst alpha fraction of scenarios"""
+        tail_size = max(1, int(np.ceil(alpha * len(pnl))))
+        return np.argpartition(pnl, tail_size - 1)[:tail_size]
+
+    @pi_trading_lib.timers.timer
+    def distribution(self, positions: np.ndarray, prices: np.ndarray, alpha: float = 0.05) -> t.Dict[str, float]:
+        """Returns summary stats of the pnl distribution, var and cvar are losses at the alpha tail"""
+        pnl = self.pnl(positions, prices)
+        tail_pnl = pnl[self._tail(pnl, alpha)]
+        return {
+            'mean': float(pnl.mean()),
+            'std': float(pnl.std()),
+            'var': float(-tail_pnl.max()),
+            'cvar': float(-tail_pnl.mean()),
+            'prob_loss': float((pnl < 0).mean()),
+        }
+
+    @pi_trading_lib.timers.timer
+    def marginal_risk(self, positions: np.ndarray, prices: np.ndarray, alpha: float = 0.05) -> pd.DataFrame:
+        """Returns per contract contributions to pnl std and cvar, which sum to the portfolio values"""
+        positions = np.asarray(positions, dtype=np.float64)
+        prices = np.asarray(prices, dtype=np.float64)
+        pnl = self.pnl(positions, prices)
+
+        # price terms drop out of covariances with the pnl
+        pnl_dev = (pnl - pnl.mean()).astype(np.float32)
+        std = pnl.std()
+        payoff_cov = (pnl_dev @ self._payoffs_f32).astype(np.float64) / len(pnl)
+        std_contrib = positions * payoff_cov / std if std > 0 else np.zeros(len(positions))
+        tail_payoff = self._payoffs_f32[self._tail(pnl, alpha)].mean(axis=0, dtype=np.float64)
+        cvar_contrib = -positions * (tail_payoff - prices)
+        return pd.DataFrame({'std': std_contrib, 'cvar': cvar_contrib}, index=self.cids)
+
+    def exposures(self, positions: np.ndarray) -> pd.Series:
+        """Returns covariance of each contract's payoff with the portfolio payoff"""
+        return self.covariance @ np.asarray(positions, dtype=np.float64)  # type: ignore
+
+
+@functools.lru_cache()
+@pi_trading_lib.timers.timer
+def get_scenarios(date: datetime.date) -> Scenarios:
+    return Scenarios.from_sim_maps(fte.get_df('pres_sim_2020', date, date))
+
+
+def get_scenario_risk(date: datetime.date, cids: t.Sequence[int]) -> ScenarioRisk:
+    """Returns scenario risk of state contracts cids from the 538 simulated maps archived for date"""
+    return ScenarioRisk(cids, get_scenarios(date).contract_payoffs(cids))
@@ -1,4 +1,5 @@
 import datetime
+import os
 import typing as t
 import functools
 
@@ -6,12 +7,14 @@ import numpy as np
 import pandas as pd
 import scipy.stats as st
 
-from pi_trading_lib.model import Model
+from pi_trading_lib.model import Model, ModelOutput, ModelOutputs, scenarios_enabled
 import pi_trading_lib.data.contract_groups as contract_groups
+import pi_trading_lib.data.data_archive as data_archive
 import pi_trading_lib.data.fivethirtyeight as fte
 import pi_trading_lib.data.market_data as market_data
 import pi_trading_lib.datetime_ext as datetime_ext
 import pi_trading_lib.model_config as model_config
+import pi_trading_lib.models.election_scenarios as election_scenarios
 import pi_trading_lib.states as states
 
 
@@ -39,7 +42,7 @@ class NaiveModel(Model):
     """
 
     def __init__(self):
-        pass
+        super().__init__()
 
     def _get_state_contract_md(self, date: datetime.date) -> pd.DataFrame:
         state_md = market_data.get_snapshot(date, tuple(self._get_state_contract_ids())).data
@@ -111,6 +114,43 @@ class NaiveModel(Model):
         state_model = state_model.reindex(self.get_universe(config, date))
         return state_model['margin_factor']  # type: ignore
 
+    def get_scenarios(self, config: model_config.Config, date: datetime.date) -> t.Optional[pd.DataFrame]:
+        if date > datetime_ext.from_str(config['election-model-end-date']):
+            return None
+        if not self._has_sim_maps(date):
+            return None
+        cids = self.get_universe(config, date)
+        risk = election_scenarios.get_scenario_risk(date, cids.tolist())
+        return pd.DataFrame(risk.payoffs, columns=cids)
+
+    def _has_sim_maps(self, date: datetime.date) -> bool:
+        # simulated maps are only archived for the last days before the election
+        return os.path.exists(data_archive.get_data_file('pres_sim_2020', {'date': date}))
+
+    def prepare(self, config: model_config.Config, dates: t.List[datetime.date]):
+        # 538 stores are consolidated in the work dir when first read
+        model_dates = [date for date in dates if date <= datetime_ext.from_str(config['election-model-end-date'])]
+        if len(model_dates) == 0:
+            return
+        fte.prepare('pres_national_2020', model_dates)
+        fte.prepare('pres_state_2020', model_dates)
+        if scenarios_enabled(config):
+            fte.prepare('pres_sim_2020', [date for date in model_dates if self._has_sim_maps(date)])
+
+    def _compute(self, config: model_config.Config, dates: t.List[datetime.date]) -> ModelOutputs:
+        outputs = []
+        for date in dates:
+            universe = self.get_universe(config, date)
+            if len(universe) == 0:
+                outputs.append(ModelOutput.from_series(universe, None, None, None))
+                continue
+            # price and factor share the state model
+            state_model = self._get_state_contract_model(date).reindex(universe)
+            scenarios = self.get_scenarios(config, date) if scenarios_enabled(config) else None
+            outputs.append(ModelOutput.from_series(universe, state_model['winstate_chal'],
+                                                   state_model['margin_factor'], scenarios))
+        return ModelOutputs.from_daily(dates, outputs)
+
     @property
     def name(self) -> str:
         return 'election-model'
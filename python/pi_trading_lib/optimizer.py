@@ -8,19 +8,118 @@ import cvxpy.settings
 
 import pi_trading_lib.model_config as model_config
 from pi_trading_lib.data.market_data import MarketDataSnapshot
-from pi_trading_lib.model import PIPOSITION_LIMIT_VALUE
+from pi_trading_lib.model import PIPOSITION_LIMIT_VALUE, scenarios_enabled
 from pi_trading_lib.accountant import Book
+from pi_trading_lib.scenarios import ScenarioMatrix
 import pi_trading_lib.timers
 
 
+def _get_scenarios(snapshot: MarketDataSnapshot, agg_price_model: np.ndarray,
+                   scenario_models: t.Sequence[pd.DataFrame], config: model_config.Config) -> ScenarioMatrix:
+    """Samples scenarios from aggregated model prices, with model scenarios for the contracts they cover
+
+    Scenarios are reduced once the contracts to solve for are known, see ScenarioMatrix.reduce.
+    """
+    universe_index = pd.Index(snapshot.universe)
+    model_samples = []
+    for scenario_model in scenario_models:
+        contract_idx = universe_index.get_indexer(scenario_model.columns)
+        found = contract_idx >= 0
+        if found.any():
+            model_samples.append((contract_idx[found], scenario_model.to_numpy()[:, found]))
+
+    return ScenarioMatrix.sample(agg_price_model, snapshot['market_id'].to_numpy(),
+                                 int(config['optimizer-scenarios']), model_samples)
+
+
+class ReductionStats:
+    """Problem sizes before and after the pre-solve reduction, and results of validating it against full solves
+
+    Kept by the caller for a run, e.g. a sim or a live trading session.
+    """
+
+    def __init__(self):
+        self.problems = 0
+        self.contracts = 0
+        self.solved_contracts = 0
+        self.validated = 0
+        self.mismatched = 0
+
+    def record(self, contracts: int, solved_contracts: int):
+        self.problems += 1
+        self.contracts += contracts
+        self.solved_contracts += solved_contracts
+
+    def record_validation(self, mismatched: bool):
+        self.validated += 1
+        self.mismatched += int(mismatched)
+
+    @property
+    def ratio(self) -> float:
+        """Fraction of contracts sent to the solver"""
+        return self.solved_contracts / self.contracts if self.contracts > 0 else 1.0
+
+    def __str__(self) -> str:
+        return (f'optimizer reduction: solved {self.solved_contracts} of {self.contracts} contracts '
+                f'({self.ratio:.1%}) over {self.problems} problems, {self.mismatched} of {self.validated} '
+                'validated problems differ from the full solve')
+
+
+def _agg_price_model(snapshot: MarketDataSnapshot, price_models: t.List[pd.Series],
+                     price_model_weights: t.List[float]) -> np.ndarray:
+    """Weighted average of the available model prices and the mid price of every contract"""
+    prices = np.stack([pm.reindex(snapshot.universe).to_numpy(dtype=np.float64)
+                       for pm in price_models + [snapshot['mid_price']]])
+    weights = np.array(price_model_weights + [1.0])[:, np.newaxis] * ~np.isnan(prices)
+    with np.errstate(invalid='ignore'):
+        return np.nansum(prices * weights, axis=0) / weights.sum(axis=0)  # type: ignore
+
+
+def _quoted_contracts(snapshot: MarketDataSnapshot) -> np.ndarray:
+    """Mask of contracts with a bid and an ask, the others can't trade"""
+    return ~np.isnan(snapshot['bid_price'].to_numpy()) & ~np.isnan(snapshot['ask_price'].to_numpy())  # type: ignore
+
+
+@pi_trading_lib.timers.timer
+def _active_contracts(snapshot: MarketDataSnapshot, yes_prob: np.ndarray, cur_position: np.ndarray,
+                      factor_models: t.List[pd.Series], scenario_models: t.Sequence[pd.DataFrame],
+                      config: model_config.Config) -> np.ndarray:
+    """Mask of contracts that can trade, the others are optimal at their current position
+
+    Contracts without quotes can't trade. Otherwise a contract is inactive without a position, an edge beyond
+    optimizer-take-edge on either side given yes_prob, or exposure to a factor, as trading it can't increase the
+    objective. Scenario objectives value the contracts of a market together, so a market is only inactive if all
+    its contracts are and none are covered by scenario models.
+    """
+    bid_price, ask_price = snapshot['bid_price'].to_numpy(), snapshot['ask_price'].to_numpy()
+    edge = np.maximum(yes_prob - ask_price, bid_price - yes_prob) - config['optimizer-take-edge']
+    active = (cur_position != 0) | (edge > 0)
+    for fm in factor_models:
+        active |= np.nan_to_num(fm.to_numpy()) != 0
+
+    if scenarios_enabled(config):
+        for scenario_model in scenario_models:
+            active |= np.isin(snapshot.universe, scenario_model.columns)
+        market_ids = snapshot['market_id'].to_numpy()
+        active = np.isin(market_ids, market_ids[active])
+
+    return active & _quoted_contracts(snapshot)  # type: ignore
+
+
 @pi_trading_lib.timers.timer
 def optimize(book: Book, snapshot: MarketDataSnapshot, price_models: t.List[pd.Series],
              price_model_weights: t.List[float],
              return_models: t.List[pd.Series], factor_models: t.List[pd.Series],
-             config: model_config.Config) -> pd.DataFrame:
+             config: model_config.Config,
+             scenario_models: t.Sequence[pd.DataFrame] = (),
+             reduction_stats: t.Optional[ReductionStats] = None) -> pd.DataFrame:
     """Returns optimal book given market prices and models
 
+    Contracts without quotes keep their current position.
+
     snapshot: Used for market prices as well as universe to optimize over
+    scenario_models: (sample, contract) payoff samples, used by the kelly and cvar objectives
+    reduction_stats: records the sizes of the reduced problems if given
     """
 
     assert return_models is not None  # unused
@@ -37,6 +136,74 @@ def optimize(book: Book, snapshot: MarketDataSnapshot, price_models: t.List[pd.S
     if num_contracts == 0:
         return pd.DataFrame([], columns=['new_pos', 'agg_price_model', 'take_edge'])
 
+    agg_price_model = _agg_price_model(snapshot, price_models, price_model_weights)
+    cur_position = pd.Series(book.position, index=book.universe.cids).reindex(snapshot.universe).to_numpy()
+
+    # scenario objectives value contracts by their probability in the sampled scenarios, which are shared by the
+    # reduced and full problems
+    scenarios = _get_scenarios(snapshot, agg_price_model, scenario_models, config) if scenarios_enabled(config) \
+        else None
+
+    quoted = _quoted_contracts(snapshot)
+    if config['optimizer-reduce']:
+        yes_prob = agg_price_model if scenarios is None else scenarios.expected_payoffs()
+        active = _active_contracts(snapshot, yes_prob, cur_position, factor_models, scenario_models, config)
+    else:
+        active = quoted
+    if reduction_stats is not None:
+        reduction_stats.record(num_contracts, int(active.sum()))
+    logging.debug(f'solving for {active.sum()} of {num_contracts} contracts')
+
+    new_pos = cur_position.astype(np.float64)
+    solved = True
+    if active.any():
+        active_pos = _solve_contracts(active, book, snapshot, agg_price_model, factor_models, config, scenarios)
+        if active_pos is not None:
+            new_pos[active] = active_pos
+        else:
+            solved = False
+
+    if not solved and not config['optimizer-allow-unsolved']:
+        assert False
+
+    if config['optimizer-reduce-validate'] and solved and (active != quoted).any():
+        full_pos = _solve_contracts(quoted, book, snapshot, agg_price_model, factor_models, config, scenarios)
+        if full_pos is not None:
+            # solver tolerance can move positions by a rounding step
+            mismatched = snapshot.universe[quoted][np.abs(full_pos - new_pos[quoted]) >
+                                                   config['optimizer-position-size-mult']]
+            if reduction_stats is not None:
+                reduction_stats.record_validation(len(mismatched) > 0)
+            if len(mismatched) > 0:
+                logging.warning(f'reduced solve differs from full solve for {mismatched.tolist()}')
+
+    opt_res = {
+        'new_pos': new_pos,
+        'agg_price_model': agg_price_model,
+    }
+    df = pd.DataFrame(opt_res, index=snapshot.universe)
+    df['take_edge'] = config['optimizer-take-edge'] if solved else 0.0
+    return df
+
+
+def _solve_contracts(contracts: np.ndarray, book: Book, snapshot: MarketDataSnapshot, agg_price_model: np.ndarray,
+                     factor_models: t.List[pd.Series], config: model_config.Config,
+                     scenarios: t.Optional[ScenarioMatrix]) -> t.Optional[np.ndarray]:
+    """Solves for the contracts selected by a mask, with the others fixed at their position"""
+    return _solve(book, snapshot.reindex(snapshot.universe[contracts]), agg_price_model[contracts],
+                  [fm[contracts] for fm in factor_models], config,
+                  None if scenarios is None else scenarios.select(contracts))
+
+
+@pi_trading_lib.timers.timer
+def _solve(book: Book, snapshot: MarketDataSnapshot, agg_price_model: np.ndarray, factor_models: t.List[pd.Series],
+           config: model_config.Config, scenarios: t.Optional[ScenarioMatrix]) -> t.Optional[np.ndarray]:
+    """Returns optimal positions of snapshot contracts, or None if the problem couldn't be solved
+
+    scenarios: payoffs of snapshot contracts, used by the kelly and cvar objectives
+    """
+    num_contracts = len(snapshot.data)
+
     price_b, price_s = snapshot['ask_price'].to_numpy(), (1 - snapshot['bid_price']).to_numpy()
 
     # widen prices as a proxy for requiring a larger edge to trade
@@ -50,24 +217,6 @@ def optimize(book: Book, snapshot: MarketDataSnapshot, price_models: t.List[pd.S
     # bid ask on going short contracts (0.5, 0.55)
     price_bb, price_bs, price_sb, price_ss = price_b, 1 - price_s, 1 - price_b, price_s
 
-    price_models = price_models + [snapshot['mid_price']]
-    price_model_weights = price_model_weights + [1.0]
-
-    # TODO: convert this to numpy code
-    agg_prices = []
-    for cid in snapshot.universe:
-        sum_price = 0.0
-        sum_weight = 0.0
-        for idx, price_model in enumerate(price_models):
-            if not np.isnan(price_model[cid]):
-                price_model_weight = price_model_weights[idx]
-                sum_weight += price_model_weight
-                sum_price += price_model[cid] * price_model_weight
-        agg_price = sum_price / sum_weight
-        agg_prices.append(agg_price)
-
-    agg_price_model = np.array(agg_prices)
-
     # Contracts to sell or buy
     cur_position = pd.Series(book.position, index=book.universe.cids).reindex(snapshot.universe).to_numpy()
     cur_position_b = np.maximum(np.zeros(num_contracts), cur_position)
@@ -103,16 +252,41 @@ def optimize(book: Book, snapshot: MarketDataSnapshot, price_models: t.List[pd.S
         net_cost + cp.multiply(price_s, delta_ss) <= PIPOSITION_LIMIT_VALUE,
     ]
 
-    # this isn't literally the stdev, just trying to convey the idea that as the position size increases, we
-    # want the edge required to increase linearly
-    # maybe we want to do something more like kelly-betting instead of creating fake
-    # variance as if it's normal distributed?
-    stdev_return = cp.sum_squares(new_pos)
-
     # add constant for when margin_factors is empty to ensure obj_factor has type Expr
     obj_factor = -1 * cp.sum(margin_factors) + cp.expressions.constants.Constant(0)
     obj_return = agg_price_model @ new_pos_b + (1 - agg_price_model) @ new_pos_s + new_cap
-    obj_std = -1 * config['optimizer-std-penalty'] * stdev_return
+
+    objective_mode = config['optimizer-objective']
+    if objective_mode == 'linear':
+        # this isn't literally the stdev, just trying to convey the idea that as the position size increases, we
+        # want the edge required to increase linearly
+        stdev_return = cp.sum_squares(new_pos)
+        obj_std = -1 * config['optimizer-std-penalty'] * stdev_return
+    else:
+        assert scenarios is not None
+        scenarios = scenarios.reduce()
+        logging.debug(f'optimizing over {scenarios.nscenarios} scenarios')
+        # value of capital and short positions is the same in every scenario, kept as a single variable so the
+        # (scenario, contract) constraint matrix stays as sparse as the payoffs
+        resolved_value = cp.Variable()
+        constraints.append(resolved_value == cp.sum(new_pos_s) + new_cap)
+        # book value of the optimized contracts and capital once contracts resolve, for each scenario
+        scenario_value = scenarios.payoffs @ new_pos + resolved_value
+        # value of the book if nothing is traded
+        base_value = book.capital + agg_price_model @ cur_position_b + (1 - agg_price_model) @ cur_position_s
+        if objective_mode == 'kelly':
+            # scaled by base value so the objective is in dollars for small changes, like the linear objective
+            obj_return = base_value * (scenarios.weights @ cp.log(scenario_value / base_value)) + base_value
+            obj_std = cp.expressions.constants.Constant(0)
+        elif objective_mode == 'cvar':
+            alpha = config['optimizer-cvar-alpha']
+            var = cp.Variable()
+            tail_loss = cp.Variable(scenarios.nscenarios)
+            constraints += [tail_loss >= 0, tail_loss >= base_value - scenario_value - var]
+            cvar = var + (scenarios.weights @ tail_loss) / alpha
+            obj_std = -1 * config['optimizer-cvar-penalty'] * cvar
+        else:
+            assert False, f'unknown optimizer objective {objective_mode}'
 
     objective = obj_return + obj_std + obj_factor
     problem = cp.Problem(cp.Maximize(objective), constraints)
@@ -131,25 +305,9 @@ def optimize(book: Book, snapshot: MarketDataSnapshot, price_models: t.List[pd.S
         solver_error = True
 
     if solver_error:
-        if not config['optimizer-allow-unsolved']:
-            assert False
-
-        opt_res = {
-            'new_pos': cur_position,
-            'agg_price_model': agg_price_model,
-        }
-        df = pd.DataFrame(opt_res, index=snapshot.universe)
-        df['take_edge'] = 0.0
-        return df
+        return None
 
     logging.info((obj_return.value, obj_std.value, obj_factor.value))
 
     pos_mult = config['optimizer-position-size-mult']
-    rounded_new_pos = np.around(new_pos.value / pos_mult) * pos_mult
-    opt_res = {
-        'new_pos': rounded_new_pos,
-        'agg_price_model': agg_price_model,
-    }
-    df = pd.DataFrame(opt_res, index=snapshot.universe)
-    df['take_edge'] = config['optimizer-take-edge']
-    return df
+    return np.around(new_pos.value / pos_mult) * pos_mult  # type: ignore
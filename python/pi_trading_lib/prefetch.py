@@ -0,0 +1,80 @@
+import collections
+import concurrent.futures
+import logging
+import time
+import typing as t
+
+import pi_trading_lib.timers
+
+
+S = t.TypeVar('S')
+T = t.TypeVar('T')
+
+
+class Prefetcher(t.Generic[S, T]):
+    """Iterates over (item, load(item)), loading upcoming items in a background thread
+
+    At most depth items are loaded ahead of the item being processed, depth 0 loads items in the caller.
+    Loads run in a single thread, so load only needs to be safe to run alongside the caller.
+
+    Load and wait times are recorded in the timers as {name}.load and {name}.wait, the difference is the
+    load time hidden behind processing.
+    """
+
+    def __init__(self, load: t.Callable[[S], T], items: t.Iterable[S], depth: int = 1, name: str = 'prefetch'):
+        assert depth >= 0
+        self.load = load
+        self.items = items
+        self.depth = depth
+        self.name = name
+        self.load_time = 0.0
+        self.wait_time = 0.0
+
+    def _timed_load(self, item: S) -> T:
+        start = time.time()
+        value = self.load(item)
+        elapsed = time.time() - start
+        self.load_time += elapsed
+        pi_trading_lib.timers.record(f'{self.name}.load', elapsed)
+        return value
+
+    def _wait(self, future: 'concurrent.futures.Future[T]') -> T:
+        start = time.time()
+        value = future.result()
+        elapsed = time.time() - start
+        self.wait_time += elapsed
+        pi_trading_lib.timers.record(f'{self.name}.wait', elapsed)
+        return value
+
+    @property
+    def hidden_time(self) -> float:
+        """Load time that overlapped with processing in the caller"""
+        return max(0.0, self.load_time - self.wait_time) if self.depth > 0 else 0.0
+
+    def __iter__(self) -> t.Iterator[t.Tuple[S, T]]:
+        if self.depth == 0:
+            for item in self.items:
+                yield item, self._timed_load(item)
+            return
+
+        items = iter(self.items)
+        pending: t.Deque[t.Tuple[S, 'concurrent.futures.Future[T]']] = collections.deque()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        try:
+            for item in items:
+                pending.append((item, executor.submit(self._timed_load, item)))
+                if len(pending) > self.depth:
+                    break
+            while pending:
+                item, future = pending.popleft()
+                yield item, self._wait(future)
+                for next_item in items:
+                    pending.append((next_item, executor.submit(self._timed_load, next_item)))
+                    break
+        finally:
+            # loads queued for items that won't be processed are dropped
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            logging.info(f'{self.name}: loaded in {self.load_time:.3f}s, waited {self.wait_time:.3f}s, '
+                         f'hidden {self.hidden_time:.3f}s')
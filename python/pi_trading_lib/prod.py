@@ -1 +1,273 @@
 # Prod counterpart to sim.py
+
+import argparse
+import datetime
+import logging
+import os
+import time
+import typing as t
+
+import numpy as np
+import pandas as pd
+
+from pi_trading_lib.accountant import Book
+from pi_trading_lib.data.market_data import MarketDataSnapshot
+from pi_trading_lib.model import Model, ModelOutput
+from pi_trading_lib.models.calibration import CalibrationModel
+from pi_trading_lib.models.fte_election import NaiveModel
+from pi_trading_lib.sim import ModelInputs
+import pi_trading_lib.data.contracts
+import pi_trading_lib.data.data_archive as data_archive
+import pi_trading_lib.data.market_data as market_data
+import pi_trading_lib.data.raw_feed as raw_feed
+import pi_trading_lib.datetime_ext as datetime_ext
+import pi_trading_lib.fs as fs
+import pi_trading_lib.logging_ext as logging_ext
+import pi_trading_lib.model_config as model_config
+import pi_trading_lib.optimizer as optimizer
+import pi_trading_lib.timers
+import pi_trading_lib.work_dir as work_dir
+
+
+class LatencyHistogram:
+    """Counts of latencies in power of two millisecond buckets, from 0.25ms to 16s"""
+    BUCKETS_MS = 2.0 ** np.arange(-2, 15)
+
+    def __init__(self):
+        # last bucket counts latencies above the largest bucket
+        self.counts = np.zeros(len(LatencyHistogram.BUCKETS_MS) + 1, dtype=np.int64)
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    def record(self, seconds: float):
+        latency_ms = seconds * 1000
+        self.counts[np.searchsorted(LatencyHistogram.BUCKETS_MS, latency_ms)] += 1
+        self.total += latency_ms
+        self.max = max(self.max, latency_ms)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket of the q quantile in ms"""
+        if self.count == 0:
+            return np.nan
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q * self.count))
+        return float(LatencyHistogram.BUCKETS_MS[bucket]) if bucket < len(LatencyHistogram.BUCKETS_MS) else self.max
+
+    def __str__(self) -> str:
+        if self.count == 0:
+            return 'n=0'
+        return (f'n={self.count} mean={self.total / self.count:.2f}ms p50<={self.quantile(0.5):g}ms '
+                f'p99<={self.quantile(0.99):g}ms max={self.max:.2f}ms')
+
+
+class LiveTrader:
+    """Keeps the book and model outputs of a trading date, and re-optimizes as quotes are read from the day feed
+
+    Each cycle only re-optimizes contracts of markets quoted since the previous cycle, with the other positions
+    fixed. Targets are assumed to be filled at the top of book, like in the sim.
+    """
+    STAGES = ['refresh', 'update', 'model', 'optimize', 'cycle']
+
+    def __init__(self, config: model_config.Config, date: datetime.date, models: t.List[Model],
+                 feed: raw_feed.DayFeed, latency_budget: float):
+        self.config = config
+        self.date = date
+        self.models = models
+        self.feed = feed
+        self.latency_budget = latency_budget
+        self.book = Book(np.array([], dtype=int), config['capital'])
+        self.daily_outputs = [model.compute(config, [date]).get(date) for model in models]
+        self.known_contracts: t.Set[int] = set()
+        # feed rows seen by previous cycles, the feed can also be refreshed by market data reads
+        self.rows = 0
+        # positions from before a restart, applied once their contracts are quoted
+        self.restored = pd.Series([], dtype=np.float64)
+        self.latency = {stage: LatencyHistogram() for stage in LiveTrader.STAGES}
+        self.overruns = 0
+        self.reduction_stats = optimizer.ReductionStats()
+
+    def restore(self, positions: pd.Series):
+        """Sets positions traded before a restart, e.g. from read_positions of the targets file"""
+        self.restored = positions[positions != 0]
+
+    def _known(self, cids: np.ndarray) -> np.ndarray:
+        """Returns mask of cids in the contract db, contracts listed today are added to it after the date"""
+        unseen = [cid for cid in cids.tolist() if cid not in self.known_contracts]
+        if len(unseen) > 0:
+            self.known_contracts.update(pi_trading_lib.data.contracts.get_contracts(unseen))
+        return np.array([cid in self.known_contracts for cid in cids.tolist()], dtype=bool)
+
+    def _snapshot(self, contract_idx: np.ndarray) -> MarketDataSnapshot:
+        return MarketDataSnapshot(market_data.add_mid_price(self.feed.latest(contract_idx)))
+
+    def _add_contracts(self, cids: np.ndarray, snapshot: MarketDataSnapshot):
+        # contracts are never removed from the book universe intraday, so positions of other contracts are kept
+        new_cids = np.setdiff1d(cids, self.book.universe.cids)
+        if len(new_cids) > 0:
+            book_universe = np.concatenate([self.book.universe.cids, new_cids])
+            self.book.update_universe(book_universe, snapshot.reindex(book_universe))
+
+    def _apply_restored(self):
+        """Buys restored positions at the latest quotes of their contracts, once they have a bid and ask"""
+        contract_idx = self.feed.contract_indices(self.restored.index.to_numpy())
+        md = self._snapshot(contract_idx[contract_idx >= 0])
+        md = md.reindex(md.universe[~md['bid_price'].isna().to_numpy() & ~md['ask_price'].isna().to_numpy()])
+        if len(md.universe) == 0:
+            return
+        self._add_contracts(md.universe, md)
+        self.book.apply_position_change(self.restored.reindex(md.universe), md)
+        self.book.set_mark_price(md['trade_price'])
+        self.restored = self.restored.drop(md.universe)
+
+    def _model_inputs(self, snapshot: MarketDataSnapshot) -> ModelInputs:
+        outputs: t.List[ModelOutput] = []
+        for model, daily_output in zip(self.models, self.daily_outputs):
+            live_output = model.compute_live(self.config, self.date, snapshot)
+            outputs.append(daily_output if live_output is None else live_output)
+        model_universe = np.concatenate([np.zeros(0, dtype=np.int64)] + [output.universe for output in outputs])
+        universe = np.intersect1d(snapshot.universe, model_universe)
+        universe = universe[self._known(universe)]
+        return ModelInputs(self.config, self.models, outputs, universe)
+
+    @pi_trading_lib.timers.timer
+    def cycle(self, max_lines: t.Optional[int] = None) -> t.Optional[pd.Series]:
+        """Reads new feed lines, at most max_lines, and returns changed target positions
+
+        None if there were no new lines.
+        """
+        cycle_start = time.time()
+
+        offset = self.feed.offset
+        self.feed.refresh(max_lines)
+        if self.feed.offset == offset and self.feed.buffer.rows == self.rows:
+            return None
+        refresh_end = time.time()
+        self.latency['refresh'].record(refresh_end - cycle_start)
+
+        if len(self.restored) > 0:
+            self._apply_restored()
+        ticked = np.unique(self.feed.buffer['contract_index'][self.rows:])
+        self.rows = self.feed.buffer.rows
+        snapshot = self._snapshot(self.feed.market_contracts(ticked))
+        update_end = time.time()
+        self.latency['update'].record(update_end - refresh_end)
+
+        model_inputs = self._model_inputs(snapshot)
+        universe = model_inputs.universe
+        model_end = time.time()
+        self.latency['model'].record(model_end - update_end)
+
+        targets = pd.Series([], dtype=np.float64)
+        if len(universe) > 0:
+            self._add_contracts(universe, snapshot)
+            md = snapshot.reindex(universe)
+            cur_position = pd.Series(self.book.position, index=self.book.universe.cids).reindex(universe)
+            opt_result = optimizer.optimize(self.book, md, model_inputs.price_models, model_inputs.price_model_weights,
+                                            [], model_inputs.factor_models, self.config, model_inputs.scenario_models,
+                                            self.reduction_stats)
+            self.book.apply_position_change(opt_result['new_pos'], md)
+            self.book.set_mark_price(md['trade_price'])
+            targets = opt_result['new_pos'][opt_result['new_pos'] != cur_position]
+        optimize_end = time.time()
+        self.latency['optimize'].record(optimize_end - model_end)
+
+        cycle_latency = optimize_end - cycle_start
+        self.latency['cycle'].record(cycle_latency)
+        if cycle_latency > self.latency_budget:
+            self.overruns += 1
+            logging.warning(f'cycle over latency budget: {cycle_latency * 1000:.1f}ms for {len(ticked)} quoted '
+                            f'contracts, {len(universe)} contracts')
+        return targets
+
+    def report(self) -> str:
+        lines = [f'{stage:10} {self.latency[stage]}' for stage in LiveTrader.STAGES]
+        lines.append(f'over budget: {self.overruns} of {self.latency["cycle"].count} cycles')
+        lines.append(str(self.reduction_stats))
+        return '\n'.join(lines)
+
+
+def get_models(config: model_config.Config) -> t.List[Model]:
+    models: t.List[Model] = []
+    if config['election-model-enabled']:
+        models.append(NaiveModel())
+    if config['calibration-model-enabled']:
+        models.append(CalibrationModel())
+    return models
+
+
+def write_targets(path: str, timestamp: datetime.datetime, targets: pd.Series):
+    with fs.safe_open(path, 'a') as f:
+        if f.tell() == 0:
+            f.write('timestamp,contract_id,position\n')
+        for cid, position in targets.items():
+            f.write(f'{timestamp.isoformat()},{cid},{position:g}\n')
+
+
+def read_positions(path: str) -> pd.Series:
+    """Last target position of every contract in a targets file, empty if there is no file"""
+    if not os.path.exists(path):
+        return pd.Series([], dtype=np.float64)
+    targets = pd.read_csv(path)
+    return targets.groupby('contract_id')['position'].last()
+
+
+def run(trader: LiveTrader, targets_path: str, poll_interval: float, replay: bool, report_interval: float):
+    """Trades until the feed date is over, or until the end of the feed file on replay"""
+    last_report = time.time()
+    try:
+        while True:
+            # replays have every packet available at once, so packets are processed one per cycle
+            targets = trader.cycle(max_lines=1 if replay else None)
+            if targets is None:
+                if replay or raw_feed.feed_date_now() > trader.date:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            if len(targets) > 0:
+                write_targets(targets_path, datetime.datetime.utcnow(), targets)
+                logging.info(f'new targets\n{targets}')
+
+            if time.time() - last_report > report_interval:
+                logging.info(f'cycle latencies\n{trader.report()}')
+                last_report = time.time()
+    finally:
+        trader.feed.tail.close()
+        logging.info(f'cycle latencies\n{trader.report()}')
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', default='current')
+    parser.add_argument('--override', default='')
+    parser.add_argument('--date', help='feed date, defaults to the date md_archiver is writing')
+    parser.add_argument('--feed', help='raw feed file, defaults to the archive file of the feed date')
+    parser.add_argument('--targets', help='target positions output, defaults to the work dir')
+    parser.add_argument('--latency-budget-ms', type=float, default=1000.0)
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between reads of the feed file')
+    parser.add_argument('--report-interval', type=float, default=600.0, help='seconds between latency reports')
+    parser.add_argument('--replay', action='store_true', help='replay a complete feed file, a packet per cycle')
+    parser.add_argument('--debug', action='store_true')
+
+    args = parser.parse_args(argv)
+
+    logging_ext.init_logging(level=logging.DEBUG if args.debug else logging.INFO)
+
+    config = model_config.override_config(model_config.get_config(args.config), args.override)
+    date = datetime_ext.from_str(args.date) if args.date else raw_feed.feed_date_now()
+    feed_path = args.feed or data_archive.get_data_file('market_data_raw', {'date': date})
+    targets_path = args.targets or work_dir.get_uri('prod', config, date_1=date) + '.csv'
+
+    # live market data reads of the date share the feed of the trader
+    feed = raw_feed.DayFeed(feed_path) if args.replay else market_data.follow_feed(date, feed_path)
+    trader = LiveTrader(config, date, get_models(config), feed, args.latency_budget_ms / 1000)
+    # targets written before a restart are the current positions
+    trader.restore(read_positions(targets_path))
+    logging.info(f'Trading {date} from {feed_path}, writing targets to {targets_path}, '
+                 f'{len(trader.restored)} positions restored')
+    run(trader, targets_path, args.poll_interval, args.replay, args.report_interval)
+
+    pi_trading_lib.timers.report_timers()
@@ -0,0 +1,83 @@
+import typing as t
+
+import numpy as np
+import scipy.sparse
+
+import pi_trading_lib.timers
+
+
+class ScenarioMatrix:
+    """Weighted (scenario, contract) payoff matrix, 1 where the contract resolves YES in the scenario
+
+    Payoffs are kept sparse since at most one contract per market resolves YES in a scenario.
+    """
+    payoffs: scipy.sparse.csr_matrix
+    weights: np.ndarray
+
+    def __init__(self, payoffs: scipy.sparse.csr_matrix, weights: np.ndarray):
+        assert payoffs.shape[0] == len(weights)
+        self.payoffs = payoffs
+        self.weights = weights
+
+    @property
+    def nscenarios(self) -> int:
+        return self.payoffs.shape[0]  # type: ignore
+
+    @staticmethod
+    @pi_trading_lib.timers.timer
+    def sample(probs: np.ndarray, market_ids: np.ndarray, nscenarios: int,
+               model_samples: t.Sequence[t.Tuple[np.ndarray, np.ndarray]] = (),
+               seed: int = 0) -> 'ScenarioMatrix':
+        """Samples scenarios of contract resolutions
+
+        Contracts of a market are mutually exclusive, with probs normalized within the market when they
+        sum to more than 1. Otherwise no contract of the market resolves YES with the remaining probability.
+        Markets are independent, except for contracts covered by model samples.
+
+        args:
+            probs: YES probability of each contract
+            market_ids: market of each contract
+            model_samples: (contract indices, (sample, contract) payoff matrix) pairs, resampled to nscenarios
+                and used for the contracts they cover
+        """
+        rng = np.random.default_rng(seed)
+        probs = np.clip(np.nan_to_num(probs), 0.0, 1.0)
+        payoffs = np.zeros((nscenarios, len(probs)), dtype=np.int8)
+
+        covered = np.zeros(len(probs), dtype=bool)
+        for contract_idx, samples in model_samples:
+            rows = rng.integers(0, len(samples), nscenarios)
+            payoffs[:, contract_idx] = samples[rows]
+            covered[contract_idx] = True
+
+        uncovered = np.nonzero(~covered)[0]
+        market_order = uncovered[np.argsort(market_ids[uncovered], kind='stable')]
+        _, market_starts = np.unique(market_ids[market_order], return_index=True)
+        for market_contracts in np.split(market_order, market_starts[1:]):
+            market_probs = probs[market_contracts]
+            if len(market_contracts) == 1:
+                payoffs[:, market_contracts[0]] = rng.uniform(size=nscenarios) < market_probs[0]
+                continue
+            cum_probs = np.cumsum(market_probs) / max(1.0, market_probs.sum())
+            # index len(market_contracts) is the outcome where no contract resolves YES
+            winners = np.searchsorted(cum_probs, rng.uniform(size=nscenarios), side='right')
+            resolved = winners < len(market_contracts)
+            payoffs[np.nonzero(resolved)[0], market_contracts[winners[resolved]]] = 1
+
+        return ScenarioMatrix(scipy.sparse.csr_matrix(payoffs), np.full(nscenarios, 1.0 / nscenarios))
+
+    def expected_payoffs(self) -> np.ndarray:
+        """Weighted mean payoff of every contract, its YES probability in the scenarios"""
+        return self.payoffs.T @ self.weights  # type: ignore
+
+    def select(self, contracts: np.ndarray) -> 'ScenarioMatrix':
+        """Scenarios of the contracts selected by an index or mask"""
+        return ScenarioMatrix(self.payoffs[:, contracts], self.weights)
+
+    @pi_trading_lib.timers.timer
+    def reduce(self) -> 'ScenarioMatrix':
+        """Merges identical scenarios, adding up their weights"""
+        dense = self.payoffs.toarray().astype(np.int8)
+        unique, inverse = np.unique(dense, axis=0, return_inverse=True)
+        weights = np.bincount(inverse.ravel(), weights=self.weights, minlength=len(unique))
+        return ScenarioMatrix(scipy.sparse.csr_matrix(unique), weights)
@@ -4,13 +4,50 @@ import typing as t
 
 import pandas as pd
 
+import pi_trading_lib.columnar as columnar
 import pi_trading_lib.fs as fs
 
 
+# tables are stored as one npz file of columns each, csv files are still read for older results
+TABLE_FORMATS = ['npz', 'csv']
+
+CSV_READ_ARGS: t.Dict[str, t.Dict[str, t.Any]] = {
+    'book_summary': {'index_col': 0},
+    'cid_summary': {'index_col': 0},
+    'daily_summary': {'index_col': 'date', 'parse_dates': ['date']},
+    'daily_cid_summary': {'index_col': ['date', 'cid'], 'parse_dates': ['date']},
+    'fillstats': {'index_col': ['fill_id']},
+}
+
+
+class _Table:
+    """SimResult table, read from the result path on first access"""
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def __get__(self, result: 'SimResult', owner=None) -> pd.DataFrame:
+        if self.name not in result._tables:
+            assert result.path is not None
+            result._tables[self.name] = SimResult.read_table(result.path, self.name)
+        return result._tables[self.name]
+
+    def __set__(self, result: 'SimResult', df: pd.DataFrame):
+        result._tables[self.name] = df
+
+
 class SimResult:
+    TABLES = ['book_summary', 'cid_summary', 'daily_summary', 'daily_cid_summary', 'fillstats']
+
+    book_summary = _Table()
+    cid_summary = _Table()
+    daily_summary = _Table()
+    daily_cid_summary = _Table()
+    fillstats = _Table()
+
     def __init__(self, book_summary: pd.DataFrame, cid_summary: pd.DataFrame,
                  daily_summary: pd.DataFrame, daily_cid_summary: pd.DataFrame,
                  fillstats: pd.DataFrame, path: t.Optional[str] = None):
+        self._tables: t.Dict[str, pd.DataFrame] = {}
         self.book_summary = book_summary
         self.cid_summary = cid_summary
         self.daily_summary = daily_summary
@@ -20,30 +57,33 @@ class SimResult:
 
     @staticmethod
     def load(path) -> 'SimResult':
-        daily_summary = pd.read_csv(os.path.join(path, 'daily_summary.csv'), index_col='date',
-                                    parse_dates=['date'])
-        daily_sim_summary = pd.read_csv(os.path.join(path, 'daily_cid_summary.csv'), index_col=['date', 'cid'],
-                                        parse_dates=['date'])
-
-        result = SimResult(
-            pd.read_csv(os.path.join(path, 'book_summary.csv'), index_col=0),
-            pd.read_csv(os.path.join(path, 'cid_summary.csv'), index_col=0),
-            daily_summary,
-            daily_sim_summary,
-            pd.read_csv(os.path.join(path, 'fillstats.csv'), index_col=['fill_id']),
-            path=path,
-        )
+        """Returns result stored at path, tables are only read when accessed"""
+        result = SimResult.__new__(SimResult)
+        result._tables = {}
+        result.path = path
         return result
 
-    def dump(self):
+    @staticmethod
+    def read_table(path: str, table: str) -> pd.DataFrame:
+        npz_path = os.path.join(path, f'{table}.npz')
+        if os.path.exists(npz_path):
+            return columnar.read_table(npz_path)
+        return pd.read_csv(os.path.join(path, f'{table}.csv'), **CSV_READ_ARGS[table])
+
+    def dump(self, fmt: str = 'npz'):
         assert self.path is not None
+        assert fmt in TABLE_FORMATS
 
         with fs.atomic_output(self.path) as tmpdir:
-            self.book_summary.to_csv(os.path.join(tmpdir, 'book_summary.csv'), float_format='%.3f')
-            self.cid_summary.to_csv(os.path.join(tmpdir, 'cid_summary.csv'), float_format='%.3f')
-            self.daily_summary.to_csv(os.path.join(tmpdir, 'daily_summary.csv'), float_format='%.3f')
-            self.daily_cid_summary.to_csv(os.path.join(tmpdir, 'daily_cid_summary.csv'), float_format='%.3f')
-            self.fillstats.to_csv(os.path.join(tmpdir, 'fillstats.csv'), float_format='%.3f')
+            if fmt == 'npz':
+                for table in SimResult.TABLES:
+                    columnar.write_table(os.path.join(tmpdir, f'{table}.npz'), getattr(self, table))
+            else:
+                self.export_csv(tmpdir, float_format='%.3f')
+
+    def export_csv(self, output_dir: str, float_format: t.Optional[str] = None):
+        for table in SimResult.TABLES:
+            getattr(self, table).to_csv(os.path.join(output_dir, f'{table}.csv'), float_format=float_format)
 
     @property
     def score(self):
@@ -1,4 +1,5 @@
 import argparse
+import os
 import sys
 
 import matplotlib.pyplot as plt
@@ -41,6 +42,9 @@ def main():
     fill_parser.add_argument('--cid', nargs='*', default=[])
     fill_parser.add_argument('--csv', action='store_true')
 
+    export_parser = subparsers.add_parser('export', help='write result tables as csv files')
+    export_parser.add_argument('output_dir')
+
     args = parser.parse_args()
 
     sim_result = SimResult.load(args.path)
@@ -89,6 +93,9 @@ def main():
         marginal_df = pd.concat(marginals, axis=1)
         marginal_df.plot()
         plt.show()
+    elif args.subparser == 'export':
+        os.makedirs(args.output_dir, exist_ok=True)
+        sim_result.export_csv(args.output_dir)
 
 
 if __name__ == "__main__":
@@ -10,11 +10,14 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('archive_location')
     parser.add_argument('date')
+    parser.add_argument('--begin-date', help='backfill all dates from begin date to date')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent downloads')
     args = parser.parse_args()
     print(args)
 
     pi_trading_lib.logging_ext.init_logging()
     date = pi_trading_lib.datetime_ext.from_str(args.date)
+    begin_date = pi_trading_lib.datetime_ext.from_str(args.begin_date) if args.begin_date else date
     data_archive.set_archive_dir(args.archive_location)
 
-    fte.archive_data(date)
+    fte.archive_data_range(begin_date, date, workers=args.workers)
@@ -1,16 +1,66 @@
+import argparse
 import os
 
+import pandas as pd
+
+import pi_trading_lib.datetime_ext as datetime_ext
+import pi_trading_lib.model_config as model_config
+import pi_trading_lib.sim_catalog as sim_catalog
 import pi_trading_lib.work_dir as work_dir
 
 
-def main():
+def latest_sim_dir() -> str:
+    runs = sim_catalog.query_runs(limit=1)
+    if len(runs) > 0:
+        return str(runs.index[0])
+
+    # uncatalogued work dir
     sim_dir = os.path.join(work_dir.get_work_dir(), 'sim')
     date_subdirs = [os.path.join(sim_dir, d) for d in os.listdir(sim_dir)]
     sim_subdirs = []
     for ds in date_subdirs:
         sim_subdirs.extend([os.path.join(ds, d) for d in os.listdir(ds)])
-    latest_sim_dir = max(sim_subdirs, key=os.path.getmtime)
-    print(latest_sim_dir)
+    return max(sim_subdirs, key=os.path.getmtime)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='prints latest sim result dir by default')
+    subparsers = parser.add_subparsers(dest='subparser')
+
+    rank_parser = subparsers.add_parser('rank', help='list catalogued sim runs')
+    rank_parser.add_argument('--by', default='sharpe', choices=sim_catalog.RUN_COLUMNS)
+    rank_parser.add_argument('--ascending', action='store_true')
+    rank_parser.add_argument('--where', default='', help='param=value filters separated by :')
+    rank_parser.add_argument('--begin-date')
+    rank_parser.add_argument('--end-date')
+    rank_parser.add_argument('--limit', type=int, default=20)
+    rank_parser.add_argument('--params', nargs='*', default=[], help='param values to show for each run')
+
+    diff_parser = subparsers.add_parser('diff', help='compare params and stats of sim runs')
+    diff_parser.add_argument('paths', nargs='+')
+
+    args = parser.parse_args()
+
+    if args.subparser == 'rank':
+        where = {}
+        for condition in args.where.split(':'):
+            if condition:
+                param, value = condition.split('=', 1)
+                where[param] = model_config.guess_param_type(value, param)
+        runs = sim_catalog.query_runs(
+            where=where, order_by=args.by, ascending=args.ascending, limit=args.limit,
+            begin_date=datetime_ext.from_str(args.begin_date) if args.begin_date else None,
+            end_date=datetime_ext.from_str(args.end_date) if args.end_date else None,
+        )
+        if args.params and len(runs) > 0:
+            runs = runs.join(sim_catalog.get_params(runs.index.tolist()).T[args.params])
+        with pd.option_context('display.max_colwidth', None, 'display.width', None):
+            print(runs.drop(columns=['config_hash', 'created']))
+    elif args.subparser == 'diff':
+        with pd.option_context('display.max_colwidth', None, 'display.width', None):
+            print(sim_catalog.diff_runs(args.paths))
+    else:
+        print(latest_sim_dir())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,7 @@
+import sys
+
+import pi_trading_lib.prod as prod
+
+
+def main():
+    prod.main(sys.argv[1:])
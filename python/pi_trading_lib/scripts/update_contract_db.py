@@ -1,34 +1,103 @@
 import argparse
+import concurrent.futures
+import datetime
+import os
+import typing as t
 
 import pi_trading_lib.datetime_ext as datetime_ext
 import pi_trading_lib.utils
 import pi_trading_lib.data.data_archive
+import pi_trading_lib.data.contract_db as contract_db
 import pi_trading_lib.data.market_data as market_data
 import pi_trading_lib.data.contracts as contracts
 import pi_trading_lib.data.history as history
 import pi_trading_lib.timers as timers
 
 
+UPDATE_NAME = 'update_contract_db'
+
+DayUpdate = t.Tuple[t.Dict[int, t.Dict], t.Dict[int, t.Dict], t.Dict[int, t.List[t.Tuple[int, float]]]]
+
+
+def _init_worker(archive_dir: str):
+    pi_trading_lib.data.data_archive.set_archive_dir(archive_dir)
+
+
+def _process_day(date: datetime.date) -> t.Optional[DayUpdate]:
+    """Parses archive files for date. Runs in worker processes, so this must not touch the contract db"""
+    raw_file = pi_trading_lib.data.data_archive.get_data_file('market_data_raw', {'date': date})
+    if not os.path.exists(raw_file):
+        return None
+
+    daily_contracts, daily_markets = contracts.parse_contract_info(date)
+
+    day_history = history.compute_history(market_data.read_raw_csv(date))
+
+    return daily_contracts, daily_markets, day_history
+
+
+def _apply_day(date: datetime.date, day_update: DayUpdate, replace_history: bool):
+    """Writes all updates for date in a single transaction"""
+    daily_contracts, daily_markets, day_history = day_update
+    last_update_date = contract_db.get_last_update_date(UPDATE_NAME)
+    with contract_db.get_contract_db():
+        contracts.apply_contract_info(date, daily_contracts, daily_markets)
+        history.apply_history(day_history, date, replace=replace_history)
+        if last_update_date is None or date > last_update_date:
+            contract_db.set_last_update_date(UPDATE_NAME, date)
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--begin-date', default=market_data.get_market_data_start())
-    parser.add_argument('--end-date')
+    parser.add_argument('--begin-date')
+    parser.add_argument('--end-date', help='defaults to yesterday')
     parser.add_argument('--data-archive')
 
     parser.add_argument('--force-history', action='store_true')
+    parser.add_argument('--incremental', action='store_true',
+                        help='start from the day after the last processed date')
+    parser.add_argument('--workers', type=int, default=1, help='processes used to parse archive days')
 
     args = parser.parse_args()
 
-    begin_date = datetime_ext.from_str(args.begin_date)
-    end_date = datetime_ext.from_str(args.end_date)
-
     if args.data_archive:
         pi_trading_lib.data.data_archive.set_archive_dir(args.data_archive)
 
-    for date in datetime_ext.date_range(begin_date, end_date):
-        print('Running for', date)
-        contracts.update_contract_info(date)
-        history.update_bbo_change_count_history(date, replace=args.force_history)
+    begin_date = datetime_ext.from_str(args.begin_date) if args.begin_date else None
+    if args.incremental:
+        last_update_date = contract_db.get_last_update_date(UPDATE_NAME)
+        if last_update_date is not None:
+            next_date = last_update_date + datetime.timedelta(days=1)
+            begin_date = next_date if begin_date is None else max(begin_date, next_date)
+    if begin_date is None:
+        begin_date = market_data.get_market_data_start()
+    end_date = datetime_ext.from_str(args.end_date) if args.end_date else datetime_ext.prev(datetime.date.today())
+
+    dates = list(datetime_ext.date_range(begin_date, end_date))
+    print(f'Updating {len(dates)} dates from {begin_date} to {end_date}')
+
+    if args.workers > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=_init_worker,
+            initargs=(pi_trading_lib.data.data_archive.get_archive_dir(),)
+        )
+        day_updates: t.Iterable[t.Optional[DayUpdate]] = executor.map(_process_day, dates)
+    else:
+        executor = None
+        day_updates = map(_process_day, dates)
+
+    try:
+        # updates are applied in date order since contract date ranges depend on it
+        for date, day_update in zip(dates, day_updates):
+            if day_update is None:
+                print('No raw archive for', date)
+                continue
+            print('Running for', date)
+            _apply_day(date, day_update, args.force_history)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     timers.report_timers()
 
@@ -1,15 +1,31 @@
-"""Get approximation for market volumes by going off of quote updates"""
+"""Get approximation for market volumes by going off of quote updates
+
+Reads precomputed daily quote update counts from the contract db daily history, written by update_contract_db.
+"""
 import argparse
 
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 
+import pi_trading_lib.data.contracts
 import pi_trading_lib.data.data_archive
+import pi_trading_lib.data.history as history
 import pi_trading_lib.data.market_data
 import pi_trading_lib.datetime_ext as datetime_ext
 
 
+def get_activity(begin_date, end_date) -> pd.DataFrame:
+    """Returns date x contract_id quote update counts, NaN where there is no history"""
+    panel = history.get_history_panel(begin_date, end_date, [history.QUOTE_UPDATE_COUNT])
+    activity = panel.frame(history.QUOTE_UPDATE_COUNT)
+
+    missing_dates = activity.index[activity.isnull().all(axis=1)]
+    if len(missing_dates) > 0:
+        print(f'No activity history for {len(missing_dates)} dates, run update_contract_db to backfill')
+    return activity
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('begin_date')
@@ -24,43 +40,28 @@ def main():
     begin_date = datetime_ext.from_str(args.begin_date)
     end_date = datetime_ext.from_str(args.end_date)
 
+    activity = get_activity(begin_date, end_date)
+
     if args.hist:
-        date_range = list(datetime_ext.date_range(begin_date, end_date))
-        dfs = []
-        for date in date_range:
-            df = pi_trading_lib.data.market_data.get_raw_data(date)
-            if len(df) == 0:
-                continue
-            else:
-                first_ts = df.index.get_level_values('timestamp')[0]
-                quote_updates = df.loc[df.index.get_level_values('timestamp') != first_ts]
-                dfs.append(quote_updates)
-        merged_df = pd.concat(dfs, axis=0)
-
-        if args.hist == 'contract':
-            counts = merged_df.index.get_level_values('contract_id').value_counts()
-        else:
-            counts = merged_df['market_id'].value_counts()
+        counts = activity.sum(axis=0)
+        counts = counts[counts > 0]
+
+        if args.hist == 'market':
+            contracts = pi_trading_lib.data.contracts.get_contracts(counts.index.tolist())
+            market_ids = counts.index.map({cid: contract['market_id'] for cid, contract in contracts.items()})
+            counts = counts.groupby(market_ids).sum()
+
+        counts = counts.sort_values(ascending=False)
         fig = go.Figure([go.Bar(x=counts.index.to_numpy().astype(str), y=counts.to_numpy())])
         fig.show()
     else:
-        date_range = list(datetime_ext.date_range(begin_date, end_date))
-        df_lengths = []
-        df_date_range = []
-        for date in date_range:
-            if pi_trading_lib.data.market_data.incomplete_market_data(date):
-                continue
-
-            df = pi_trading_lib.data.market_data.get_raw_data(date)
-            if len(df) == 0:
-                continue
-            else:
-                first_ts = df.index.get_level_values('timestamp')[0]
-                quote_updates = np.count_nonzero(df.index.get_level_values('timestamp') != first_ts)
-                df_lengths.append(quote_updates)
-                df_date_range.append(date)
-
-        fig = go.Figure(data=go.Scatter(x=df_date_range, y=df_lengths))
+        has_data = ~activity.isnull().all(axis=1).to_numpy()
+        bad_days = np.array([
+            pi_trading_lib.data.market_data.bad_market_data(date.date()) for date in activity.index
+        ], dtype=bool)
+        daily_activity = activity.sum(axis=1)[has_data & ~bad_days]
+
+        fig = go.Figure(data=go.Scatter(x=daily_activity.index, y=daily_activity.to_numpy()))
         fig.show()
 
 
@@ -1,4 +1,6 @@
 import argparse
+import concurrent.futures
+import copy
 import datetime
 import logging
 import os
@@ -8,12 +10,15 @@ import typing as t
 import numpy as np
 import pandas as pd
 
-from pi_trading_lib.accountant import Book
+from pi_trading_lib.accountant import Book, DailySummaryRecorder
+from pi_trading_lib.data.market_data import MarketDataSnapshot
 from pi_trading_lib.fillstats import Fillstats
-from pi_trading_lib.model import Model
+from pi_trading_lib.model import Model, ModelOutput, ModelOutputs
 from pi_trading_lib.models.calibration import CalibrationModel
+from pi_trading_lib.prefetch import Prefetcher
 from pi_trading_lib.models.fte_election import NaiveModel
 from pi_trading_lib.score import SimResult
+import pi_trading_lib.data.data_archive as data_archive
 import pi_trading_lib.data.market_data as market_data
 import pi_trading_lib.data.resolution
 import pi_trading_lib.datetime_ext as datetime_ext
@@ -21,36 +26,123 @@ import pi_trading_lib.decorators
 import pi_trading_lib.logging_ext as logging_ext
 import pi_trading_lib.model_config as model_config
 import pi_trading_lib.optimizer as optimizer
+import pi_trading_lib.sim_catalog as sim_catalog
 import pi_trading_lib.timers
 import pi_trading_lib.tune as tune
 import pi_trading_lib.work_dir as work_dir
 
 
+ModelOutputCache = t.Dict[datetime.date, t.List[ModelOutput]]
+
+
+def _init_model_worker(archive_dir: str, work_dir_loc: str):
+    data_archive.set_archive_dir(archive_dir)
+    work_dir.set_work_dir(work_dir_loc)
+
+
+def _compute_model_outputs(models: t.List[Model], config: model_config.Config,
+                           dates: t.List[datetime.date]) -> t.List[ModelOutputs]:
+    return [model.compute(config, dates) for model in models]
+
+
+@pi_trading_lib.timers.timer
+def precompute_model_outputs(models: t.List[Model], config: model_config.Config,
+                             dates: t.List[datetime.date], workers: int = 1) -> ModelOutputCache:
+    """Computes outputs of models for every date, which don't depend on the book
+
+    Dates are split into contiguous chunks, one per worker process, so incremental model state like the
+    online calibration fits moves forward one date at a time within a worker.
+    """
+    for model in models:
+        model.prepare(config, dates)
+
+    if workers <= 1 or len(dates) <= 1:
+        chunks = [dates]
+        chunk_outputs = [_compute_model_outputs(models, config, dates)]
+    else:
+        chunk_bounds = np.linspace(0, len(dates), min(workers, len(dates)) + 1).astype(int)
+        chunks = [dates[begin:end] for begin, end in zip(chunk_bounds[:-1], chunk_bounds[1:])]
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=len(chunks),
+            initializer=_init_model_worker,
+            initargs=(data_archive.get_archive_dir(), work_dir.get_work_dir()),
+        ) as executor:
+            chunk_outputs = list(executor.map(_compute_model_outputs, [models] * len(chunks),
+                                              [config] * len(chunks), chunks))
+
+    model_outputs: ModelOutputCache = {}
+    for chunk, outputs in zip(chunks, chunk_outputs):
+        for date in chunk:
+            model_outputs[date] = [model_output.get(date) for model_output in outputs]
+    return model_outputs
+
+
+def load_sod_snapshot(date: datetime.date) -> MarketDataSnapshot:
+    """Loads the inputs of a sim date that don't depend on the book, ahead of the date"""
+    pi_trading_lib.data.resolution.get_resolution_table()
+    return market_data.get_snapshot(date)
+
+
 class SimState:
     def __init__(self, models: t.List[Model], book: Book, fillstats: Fillstats):
         self.models = models
         self.book = book
         self.fillstats = fillstats
+        self.reduction_stats = optimizer.ReductionStats()
+
+
+class ModelInputs:
+    """Optimizer inputs from the model outputs of a date, conformed to the daily universe"""
+    def __init__(self, config: model_config.Config, models: t.List[Model], model_outputs: t.List[ModelOutput],
+                 universe: np.ndarray):
+        self.universe = universe
+        self.price_models: t.List[pd.Series] = []
+        self.price_model_names: t.List[str] = []
+        self.price_model_weights: t.List[float] = []
+        self.factor_models: t.List[pd.Series] = []
+        self.scenario_models: t.List[pd.DataFrame] = []
+        for model, model_output in zip(models, model_outputs):
+            price_model = model_output.get_price()
+            factor_model = model_output.get_factor()
+            if model_output.scenarios is not None:
+                self.scenario_models.append(model_output.scenarios)
+            if price_model is not None:
+                self.price_models.append(price_model.reindex(universe))
+                self.price_model_names.append(model.name)
+                self.price_model_weights.append(config[f'return-weight-{model.name}'])
+            if factor_model is not None:
+                self.factor_models.append(factor_model.reindex(universe))
+
+    def reindex(self, universe: np.ndarray) -> 'ModelInputs':
+        """Model inputs conformed to universe, a subset of the daily universe"""
+        model_inputs = copy.copy(self)
+        model_inputs.universe = universe
+        model_inputs.price_models = [price_model.reindex(universe) for price_model in self.price_models]
+        model_inputs.factor_models = [factor_model.reindex(universe) for factor_model in self.factor_models]
+        return model_inputs
 
 
 @pi_trading_lib.timers.timer
 @pi_trading_lib.decorators.impure
-def optimize_date(cur_date: datetime.date, config: model_config.Config, sim_state: SimState):
+def optimize_date(cur_date: datetime.date, config: model_config.Config, sim_state: SimState,
+                  model_outputs: t.List[ModelOutput], sod_snapshot: MarketDataSnapshot) -> ModelInputs:
     models, book = sim_state.models, sim_state.book
 
-    model_universes = [model.get_universe(config, cur_date) for model in models]
+    model_universes = [model_output.universe for model_output in model_outputs]
     model_universe = np.concatenate(model_universes)
     daily_universe = np.sort(np.unique(model_universe))
 
     combined_universe = tuple(set(book.universe.tolist() + daily_universe.tolist()))
-    md_sod = market_data.get_snapshot(cur_date, combined_universe)
+    md_sod = sod_snapshot.reindex(np.array(combined_universe, dtype=int))
 
     # Take care of cids in the book universe but not the daily universe. This can occur because:
     # 1. contracts have resolved
     # 2. contract drop out of model universes
 
-    all_resolutions = pi_trading_lib.data.resolution.get_contract_resolution(combined_universe, date=cur_date)
-    resolutions = {cid: res for cid, res in all_resolutions.items() if res is not None}
+    combined_cids = np.array(combined_universe, dtype=int)
+    combined_res = pi_trading_lib.data.resolution.resolve(combined_cids, as_of_date=cur_date)
+    resolved = ~np.isnan(combined_res)
+    resolutions = dict(zip(combined_cids[resolved].tolist(), combined_res[resolved].tolist()))
     dead_contracts = set(daily_universe) & set(resolutions.keys())
     assert len(dead_contracts) == 0, f'Model universe has dead contracts{dead_contracts}'
     book.apply_resolutions(resolutions)
@@ -58,43 +150,57 @@ def optimize_date(cur_date: datetime.date, config: model_config.Config, sim_stat
 
     # After this point, we can conform everything to daily_universe
 
-    price_models = []
-    price_model_names = []
-    price_model_weights = []
-    factor_models = []
-    for model in models:
-        price_model = model.get_price(config, cur_date)
-        factor_model = model.get_factor(config, cur_date)
-        if price_model is not None:
-            price_model = price_model.reindex(daily_universe)
-            price_models.append(price_model)
-            price_model_names.append(model.name)
-            price_model_weights.append(config[f'return-weight-{model.name}'])
-        if factor_model is not None:
-            factor_model = factor_model.reindex(daily_universe)
-            factor_models.append(factor_model)
-
-    md_sod = md_sod.reindex(daily_universe)
-    opt_result = optimizer.optimize(book, md_sod, price_models, price_model_weights, [], factor_models, config)
+    model_inputs = ModelInputs(config, models, model_outputs, daily_universe)
+    rebalance(cur_date, config, sim_state, model_inputs, md_sod.reindex(daily_universe))
+    return model_inputs
+
+
+@pi_trading_lib.timers.timer
+@pi_trading_lib.decorators.impure
+def rebalance(cur_date: datetime.date, config: model_config.Config, sim_state: SimState,
+              model_inputs: ModelInputs, md: MarketDataSnapshot, step_time: t.Optional[datetime.datetime] = None):
+    """Trades the book to the optimal positions given md, a snapshot of the daily universe"""
+    book = sim_state.book
+    price_models = model_inputs.price_models
+    opt_result = optimizer.optimize(book, md, price_models, model_inputs.price_model_weights, [],
+                                    model_inputs.factor_models, config, model_inputs.scenario_models,
+                                    sim_state.reduction_stats)
     new_pos = opt_result['new_pos']
 
-    fills = book.apply_position_change(new_pos, md_sod)
+    fills = book.apply_position_change(new_pos, md)
     for fill in fills:
-        fill.add_sim_info(cur_date, sim_state.fillstats.new_id())
+        fill.add_sim_info(cur_date, sim_state.fillstats.new_id(), step_time)
         cid = fill.info['cid']
         for idx, price_model in enumerate(price_models):
-            fill.add_model_info({f'model_price_{price_model_names[idx]}': price_model.loc[cid]})
+            fill.add_model_info({f'model_price_{model_inputs.price_model_names[idx]}': price_model.loc[cid]})
         fill.add_opt_info({'agg_price_model': opt_result['agg_price_model'].loc[cid]})
         fill.add_computed_info()
 
     sim_state.fillstats.add_fills(fills)
-    book.set_mark_price(md_sod['trade_price'])
+    book.set_mark_price(md['trade_price'])
     logging.debug(f'\n{book.get_summary()}')
 
 
+@pi_trading_lib.timers.timer
+def rebalance_intraday(cur_date: datetime.date, config: model_config.Config, sim_state: SimState,
+                       model_inputs: ModelInputs):
+    """Rebalances every sim-rebalance-interval minutes after the start of day
+
+    Model outputs are daily, so like LiveTrader.cycle, steps only re-optimize contracts of markets that ticked,
+    with the other positions fixed.
+    """
+    interval = datetime.timedelta(minutes=config['sim-rebalance-interval'])
+    for step_time, snapshot, ticked in market_data.IntradaySnapshots(cur_date, interval, model_inputs.universe):
+        if len(ticked) == 0:
+            continue
+        market_ids = snapshot['market_id']
+        universe = model_inputs.universe[market_ids.isin(market_ids.loc[ticked]).to_numpy()]
+        rebalance(cur_date, config, sim_state, model_inputs.reindex(universe), snapshot.reindex(universe), step_time)
+
+
 @pi_trading_lib.timers.timer
 def daily_sim(begin_date: datetime.date, end_date: datetime.date,
-              config: model_config.Config) -> SimResult:
+              config: model_config.Config, model_workers: int = 1, prefetch_depth: int = 1) -> SimResult:
     result_uri = work_dir.get_uri('sim', config, date_1=end_date)
     if os.path.exists(result_uri):
         return SimResult.load(result_uri)
@@ -110,34 +216,30 @@ def daily_sim(begin_date: datetime.date, end_date: datetime.date,
 
     sim_state = SimState(models, book, fillstats)
 
-    book_summaries = []
-    cid_summaries = []
+    recorder = DailySummaryRecorder()
 
-    for cur_date in datetime_ext.date_range(begin_date, end_date):
-        logging.info('sim for: ' + str(cur_date))
+    sim_dates = [date for date in datetime_ext.date_range(begin_date, end_date)
+                 if not market_data.bad_market_data(date)]
+    model_outputs = precompute_model_outputs(models, config, sim_dates, workers=model_workers)
 
-        if market_data.bad_market_data(cur_date):
-            continue
-
-        optimize_date(cur_date, config, sim_state)
-        cid_summary = book.get_contract_summary()
-        cid_summary['date'] = cur_date
-        cid_summary = cid_summary.reset_index().set_index(['date', 'cid'])
+    # market data of the next dates is loaded while the current date is optimized
+    for cur_date, sod_snapshot in Prefetcher(load_sod_snapshot, sim_dates, depth=prefetch_depth, name='sim.prefetch'):
+        logging.info('sim for: ' + str(cur_date))
 
-        book_summary = book.get_summary()
-        book_summary['date'] = cur_date
-        book_summary = book_summary.reset_index(drop=True).set_index('date')
-        book_summaries.append(book_summary)
-        cid_summaries.append(cid_summary)
+        model_inputs = optimize_date(cur_date, config, sim_state, model_outputs.pop(cur_date), sod_snapshot)
+        if config['sim-rebalance-interval'] is not None:
+            rebalance_intraday(cur_date, config, sim_state, model_inputs)
+        book_summary = recorder.record(cur_date, book)
 
         logging.info(f'\n{book_summary}')
 
-    daily_summary = pd.concat(book_summaries)
-    daily_cid_summary = pd.concat(cid_summaries)
+    logging.info(sim_state.reduction_stats)
+
+    daily_summary = recorder.daily_summary()
+    daily_cid_summary = recorder.daily_cid_summary()
 
     if config['use-final-res']:
-        contract_res = pi_trading_lib.data.resolution.get_contract_resolution(book.universe.tolist())
-        final_pos_res = np.array([contract_res[cid] for cid in book.universe.tolist()])
+        final_pos_res = pi_trading_lib.data.resolution.resolve(book.universe.cids)
         res_series = pd.Series(final_pos_res, index=book.universe.cids, dtype='float64')
         book.set_mark_price(res_series)
     logging.debug(f'\n{book}')
@@ -145,6 +247,7 @@ def daily_sim(begin_date: datetime.date, end_date: datetime.date,
     result = SimResult(book.get_summary(), book.get_contract_summary(), daily_summary,
                        daily_cid_summary, fillstats.to_frame(), path=result_uri)
     result.dump()
+    sim_catalog.record_run(result, config, begin_date, end_date)
     return result
 
 
@@ -160,6 +263,8 @@ def main(argv):
     parser.add_argument('--debug', action='store_true')
     parser.add_argument('--force', nargs='*')
     parser.add_argument('--force-all', action='store_true')
+    parser.add_argument('--model-workers', type=int, default=1, help='processes used to precompute model outputs')
+    parser.add_argument('--prefetch-depth', type=int, default=1, help='dates of market data loaded ahead, 0 disables')
 
     args = parser.parse_args(argv)
 
@@ -177,7 +282,8 @@ def main(argv):
 
     def run_sim(sim_config: model_config.Config) -> SimResult:
         return daily_sim(datetime_ext.from_str(sim_config['sim-begin-date']),
-                         datetime_ext.from_str(sim_config['sim-end-date']), sim_config)
+                         datetime_ext.from_str(sim_config['sim-end-date']), sim_config,
+                         args.model_workers, args.prefetch_depth)
 
     search = []
     if args.search:
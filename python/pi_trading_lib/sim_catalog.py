@@ -0,0 +1,125 @@
+import datetime
+import functools
+import json
+import os
+import sqlite3
+import time
+import typing as t
+
+import pandas as pd
+
+from pi_trading_lib.score import SimResult
+import pi_trading_lib.model_config as model_config
+import pi_trading_lib.work_dir as work_dir
+
+
+CATALOG_FILE = 'sim_catalog.db'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sim_run (
+    path TEXT PRIMARY KEY,
+    config_hash TEXT NOT NULL,
+    begin_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    created REAL NOT NULL,
+    ndays INTEGER,
+    sharpe REAL,
+    tstat REAL,
+    pnl REAL
+);
+
+CREATE TABLE IF NOT EXISTS sim_param (
+    path TEXT NOT NULL REFERENCES sim_run(path) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (path, name)
+);
+
+CREATE INDEX IF NOT EXISTS sim_param_value ON sim_param (name, value);
+'''
+
+RUN_COLUMNS = ['path', 'config_hash', 'begin_date', 'end_date', 'created', 'ndays', 'sharpe', 'tstat', 'pnl']
+STAT_COLUMNS = ['ndays', 'sharpe', 'tstat', 'pnl']
+
+
+@functools.lru_cache()
+def _get_catalog_db(db_uri: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(db_uri)
+    connection.execute('PRAGMA foreign_keys = ON')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def get_catalog_db() -> sqlite3.Connection:
+    """Returns sqlite catalog of sim runs in the current work dir"""
+    return _get_catalog_db(os.path.join(work_dir.get_work_dir(), CATALOG_FILE))
+
+
+def to_param_value(value: model_config.ParamValue) -> str:
+    """Param values are stored as json, with numbers as floats so parsed overrides compare equal"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = float(value)
+    return json.dumps(value)
+
+
+def record_run(result: SimResult, config: model_config.Config, begin_date: datetime.date, end_date: datetime.date):
+    """Adds sim run to the catalog, replacing an earlier run at the same path, reads only the daily summary"""
+    assert result.path is not None
+    db = get_catalog_db()
+    pnl = float(result.daily_summary['mark_pnl'].iloc[-1]) if result.ndays > 0 else None
+    run_row = (result.path, work_dir.strhash(config.params), begin_date.isoformat(), end_date.isoformat(),
+               time.time(), result.ndays, float(result.sharpe), float(result.tstat), pnl)
+    param_rows = [(result.path, name, to_param_value(value)) for name, value in sorted(config.params.items())]
+    with db:
+        db.execute('DELETE FROM sim_run WHERE path = ?', (result.path,))
+        db.execute(f'INSERT INTO sim_run VALUES ({", ".join("?" * len(RUN_COLUMNS))})', run_row)
+        db.executemany('INSERT INTO sim_param VALUES (?, ?, ?)', param_rows)
+
+
+def query_runs(where: t.Optional[t.Dict[str, model_config.ParamValue]] = None,
+               paths: t.Optional[t.List[str]] = None,
+               order_by: str = 'created', ascending: bool = False, limit: t.Optional[int] = None,
+               begin_date: t.Optional[datetime.date] = None, end_date: t.Optional[datetime.date] = None) -> pd.DataFrame:
+    """Returns catalog rows of runs with matching params and sim dates, indexed by path"""
+    assert order_by in RUN_COLUMNS
+    conditions = []
+    args: t.List[t.Any] = []
+    for name, value in (where or {}).items():
+        conditions.append('path IN (SELECT path FROM sim_param WHERE name = ? AND value = ?)')
+        args.extend([name, to_param_value(value)])
+    if paths is not None:
+        conditions.append(f'path IN ({", ".join("?" * len(paths))})')
+        args.extend(paths)
+    if begin_date is not None:
+        conditions.append('begin_date = ?')
+        args.append(begin_date.isoformat())
+    if end_date is not None:
+        conditions.append('end_date = ?')
+        args.append(end_date.isoformat())
+
+    query = f'SELECT {", ".join(RUN_COLUMNS)} FROM sim_run'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += f' ORDER BY {order_by} IS NULL, {order_by} {"ASC" if ascending else "DESC"}'
+    if limit is not None:
+        query += f' LIMIT {int(limit)}'
+    return pd.read_sql_query(query, get_catalog_db(), params=args, index_col='path')
+
+
+def get_params(paths: t.List[str]) -> pd.DataFrame:
+    """Returns (param, path) frame of param values for catalogued runs"""
+    db = get_catalog_db()
+    rows = db.execute(
+        f'SELECT path, name, value FROM sim_param WHERE path IN ({", ".join("?" * len(paths))})', paths
+    ).fetchall()
+    params = pd.DataFrame(rows, columns=['path', 'name', 'value'])
+    params['value'] = params['value'].map(json.loads)
+    return params.pivot(index='name', columns='path', values='value').reindex(columns=paths)
+
+
+def diff_runs(paths: t.List[str]) -> pd.DataFrame:
+    """Returns params that differ between runs, followed by their stats"""
+    params = get_params(paths)
+    varying = params.astype(str).nunique(axis=1) > 1
+    stats = query_runs(paths=paths).reindex(paths)[STAT_COLUMNS].T
+    return pd.concat([params[varying], stats])
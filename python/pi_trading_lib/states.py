@@ -1,3 +1,6 @@
+import pandas as pd
+
+
 NAME_TO_ABBRV = {
     "alabama": "AL",
     "alaska": "AK",
@@ -71,3 +74,9 @@ def get_state_abbrv_pres(state_name):
     if state_name in EC_SPECIAL_DISTRICTS:
         return state_name
     return None
+
+
+def get_state_abbrvs_pres(state_names: pd.Series) -> pd.Series:
+    """Vectorized get_state_abbrv_pres, unknown names map to NaN"""
+    abbrvs = state_names.str.lower().map(NAME_TO_ABBRV)
+    return abbrvs.where(~state_names.isin(EC_SPECIAL_DISTRICTS), state_names)
@@ -0,0 +1,61 @@
+import datetime
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from pi_trading_lib.accountant import Book, DailySummaryRecorder
+import pi_trading_lib.data.contracts
+from pi_trading_lib.test.helpers import contract_names, make_book, make_snapshot
+
+
+class DailySummaryRecorderTest(unittest.TestCase):
+    @mock.patch.object(pi_trading_lib.data.contracts, 'get_contract_names', contract_names)
+    def test_matches_book_summaries(self):
+        rng = np.random.default_rng(0)
+        book = make_book(np.array([], dtype=int), 1000.0)
+        recorder = DailySummaryRecorder(capacity=2)
+        book_summaries, cid_summaries = [], []
+
+        universes = [[1, 2], [1, 2, 3], [2, 3, 4, 5], [2, 3, 4, 5], [1, 5]]
+        for day, universe in enumerate(universes):
+            date = datetime.date(2020, 1, 1) + datetime.timedelta(days=day)
+            book.universe.update_cids(np.array(universe))
+            size = book.universe.size
+            if day != 3:
+                # only some contracts change each day
+                changed = rng.uniform(size=size) < 0.5
+                for attr in ['position', 'mark_value', 'exe_qty', 'exe_value', 'pos_cost', 'mark_pnl',
+                             'unrealized_pnl', 'fees']:
+                    values = np.pad(getattr(book, attr, np.zeros(0)), (0, size - len(getattr(book, attr, []))))
+                    setattr(book, attr, np.where(changed, rng.normal(size=size), values))
+                book.value = book.capital + book.mark_value.sum()
+
+            book_summary = recorder.record(date, book)
+
+            cid_summary = book.get_contract_summary()
+            cid_summary['date'] = date
+            cid_summaries.append(cid_summary.reset_index().set_index(['date', 'cid']))
+            book_summaries.append(book.get_summary().set_index(pd.Index([date], name='date')))
+            pd.testing.assert_frame_equal(book_summary, book_summaries[-1])
+
+        self.assertLess(recorder.num_rows, sum(len(df) for df in cid_summaries))
+        pd.testing.assert_frame_equal(recorder.daily_summary(), pd.concat(book_summaries))
+        pd.testing.assert_frame_equal(recorder.daily_cid_summary(), pd.concat(cid_summaries))
+
+
+class BookTest(unittest.TestCase):
+    @mock.patch.object(pi_trading_lib.data.contracts, 'get_contract_names', contract_names)
+    def test_empty_book_grows(self):
+        # sims and the live trader start from an empty book, whose fifo has no costs yet
+        book = Book(np.array([], dtype=int), 1000.0)
+        cids = np.array([1, 2])
+        md = make_snapshot(cids, np.array([0.4, 0.5]), spread=0.05)
+        book.update_universe(cids, md)
+        np.testing.assert_array_equal(book.pos_cost, [0.0, 0.0])
+        self.assertEqual(book.pos_cost.dtype, np.float64)
+
+        book.apply_position_change(pd.Series([10.0, 0.0], index=cids), md)
+        np.testing.assert_allclose(book.pos_cost, [4.5, 0.0])
+        self.assertAlmostEqual(book.capital, 995.5)
@@ -0,0 +1,228 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+
+import pi_trading_lib.datetime_ext as datetime_ext
+import pi_trading_lib.data.market_data as market_data
+import pi_trading_lib.data.resolution as resolution
+import pi_trading_lib.model_config as model_config
+import pi_trading_lib.models.calibration as calibration
+import pi_trading_lib.work_dir as work_dir
+
+
+class FitLocalLinearTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        size = 3000
+        self.trade_price = np.sort(np.round(rng.uniform(0.01, 0.99, size), decimals=2))
+        self.resolution = (rng.uniform(size=size) < self.trade_price).astype(np.float64)
+        self.contract_id = rng.integers(0, 50, size)
+        self.prices = np.arange(1, 100) * 0.01
+        self.window_width = 0.1
+        self.weight_alpha = 1 / self.window_width
+
+    def _reference_fit(self, local_normalize: bool):
+        """Per price LinearRegression fit, as calibration used to compute it"""
+        estimates = []
+        for px in self.prices:
+            in_window = ((self.trade_price >= px - self.window_width) &
+                         (self.trade_price <= px + self.window_width))
+            x = self.trade_price[in_window]
+            weight = np.round(np.exp(-1.0 * self.weight_alpha * np.abs(x - px)), decimals=3)
+            if local_normalize:
+                _, inverse, counts = np.unique(self.contract_id[in_window], return_inverse=True, return_counts=True)
+                weight = weight * np.power(1 / counts[inverse], 0.75)
+            model = LinearRegression().fit(x.reshape(-1, 1), self.resolution[in_window], weight)
+            estimates.append(max(0.0, min(1.0, model.coef_[0] * px + model.intercept_)))
+        return np.array(estimates)
+
+    def test_matches_linear_regression(self):
+        for local_normalize in [False, True]:
+            estimates = calibration.fit_local_linear(
+                self.prices, self.trade_price, self.resolution, self.contract_id, None,
+                self.window_width, self.weight_alpha, local_normalize
+            )
+            np.testing.assert_allclose(estimates, self._reference_fit(local_normalize), atol=1e-9)
+
+    def test_empty_window(self):
+        estimates = calibration.fit_local_linear(
+            self.prices, np.array([0.5, 0.5]), np.array([1.0, 0.0]), np.array([1, 2]), None,
+            0.05, 20.0, False
+        )
+        self.assertAlmostEqual(estimates[0], 0.01)
+        self.assertAlmostEqual(estimates[49], 0.5)
+
+
+class FakeSampleStore:
+    def __init__(self, samples: pd.DataFrame, table: resolution.ResolutionTable):
+        self.samples = samples
+        self.table = table
+
+    def get(self, begin_date, end_date, as_of_date=None):
+        in_range = (self.samples['date'] >= begin_date) & (self.samples['date'] <= end_date)
+        samples_df = self.samples.loc[in_range, ['contract_id', 'market_id', 'trade_price']].copy()
+        samples_df['resolution'] = self.table.resolve(samples_df['contract_id'].to_numpy(), as_of_date)
+        return samples_df
+
+
+class SampleStoreTest(unittest.TestCase):
+    def test_partially_written_date(self):
+        def sample_date(date, binary, config):
+            cids = np.arange(3) + date.day * 10
+            return pd.DataFrame({'contract_id': cids, 'market_id': cids // 2, 'trade_price': [0.2, 0.5, 0.7]})
+
+        table = resolution.ResolutionTable(np.array([10]), np.array([1.0]), np.array(['2020-01-01'], dtype='datetime64[D]'))
+        config = model_config.get_config('calibration_model').component_params('calibration-model-fit-sample')
+        dates = [datetime.date(2020, 1, 1), datetime.date(2020, 1, 2)]
+        old_work_dir = work_dir._work_dir
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch.object(calibration, 'sample_date', sample_date), \
+                mock.patch.object(calibration.market_data, 'missing_market_data_days', return_value=[]), \
+                mock.patch.object(resolution, 'get_resolution_table', return_value=table):
+            work_dir.set_work_dir(tmp_dir)
+            try:
+                store = calibration.SampleStore(True, config)
+                store.get(dates[0], dates[0])
+                # crash after writing samples of the second date but before listing it
+                partial = sample_date(dates[1], True, config)
+                partial.insert(0, 'date', datetime_ext.to_str(dates[1]))
+                partial.to_csv(store.samples_path, mode='a', header=False, index=False)
+
+                self.assertEqual(len(calibration.SampleStore(True, config).get(dates[0], dates[1])), 6)
+                self.assertEqual(len(calibration.SampleStore(True, config).get(dates[0], dates[1])), 6)
+
+                # crash while writing the first date of a new store
+                os.remove(store.dates_path)
+                self.assertEqual(len(calibration.SampleStore(True, config).get(dates[0], dates[1])), 6)
+                self.assertEqual(len(calibration.SampleStore(True, config).get(dates[0], dates[1])), 6)
+            finally:
+                work_dir.set_work_dir(old_work_dir)
+
+
+class OnlineCalibrationFitterTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        size = 4000
+        begin_date = datetime.date(2020, 1, 1)
+        cids = np.arange(100, 140)
+        self.dates = [begin_date + datetime.timedelta(days=i) for i in range(10)]
+        samples = pd.DataFrame({
+            'date': rng.choice(np.array(self.dates, dtype=object), size),
+            'contract_id': rng.choice(cids, size),
+            'trade_price': np.round(rng.uniform(0.01, 0.99, size), decimals=2),
+        })
+        samples['market_id'] = samples['contract_id'] // 4
+        samples.loc[samples.index[:20], 'trade_price'] = np.nan
+        end_dates = np.array([begin_date + datetime.timedelta(days=int(i)) for i in rng.integers(0, 12, len(cids))],
+                             dtype='datetime64[D]')
+        table = resolution.ResolutionTable(cids, rng.integers(0, 2, len(cids)).astype(np.float64), end_dates)
+        self.store = FakeSampleStore(samples, table)
+        self.table = table
+        self.config = model_config.get_config('calibration_model').component_params('calibration-model-fit').override(
+            {'calibration-model-fit-begin-date': datetime_ext.to_str(begin_date)}
+        )
+
+    def test_matches_fit_model(self):
+        with mock.patch.object(calibration, 'get_sample_store', return_value=self.store), \
+                mock.patch.object(resolution, 'get_resolution_table', return_value=self.table):
+            for normalize in ['local', 'global', None]:
+                for binary in [True, False]:
+                    config = self.config.override({'calibration-model-fit-market-normalize': normalize})
+                    fitter = calibration.OnlineCalibrationFitter(binary, config)
+                    for date in self.dates[1:] + [self.dates[4]]:
+                        pd.testing.assert_frame_equal(fitter.fit(date), calibration.fit_model(date, binary, config),
+                                                      check_exact=False, check_dtype=False, atol=1e-9)
+
+    def test_chunked_samples(self):
+        with mock.patch.object(calibration, 'get_sample_store', return_value=self.store), \
+                mock.patch.object(resolution, 'get_resolution_table', return_value=self.table):
+            date = self.dates[-1]
+            expected = calibration.OnlineCalibrationFitter(True, self.config).fit(date)
+            with mock.patch.object(calibration.OnlineCalibrationFitter, 'SAMPLE_CHUNK', 7):
+                fit = calibration.OnlineCalibrationFitter(True, self.config).fit(date)
+        pd.testing.assert_frame_equal(fit, expected, check_exact=False, atol=1e-9)
+
+    def test_bootstrap_matches_resampled_fits(self):
+        config = self.config.override({'calibration-model-fit-market-normalize': 'local'})
+        date = self.dates[-1]
+        with mock.patch.object(resolution, 'get_resolution_table', return_value=self.table):
+            with mock.patch.object(calibration, 'get_sample_store', return_value=self.store):
+                calibration.get_online_fitter.cache_clear()
+                bands_df = calibration.bootstrap_model(date, config, 4, percentiles=(0, 100))
+                calibration.get_online_fitter.cache_clear()
+                # resample i is the fit with market resample seed i
+                models = []
+                for i in range(4):
+                    resample_config = config.override({'calibration-model-fit-market-resample-seed': i})
+                    models.append(calibration.fit_model(date, True, resample_config)['bin_model_price'])
+
+        models_df = pd.concat(models, axis=1)
+        np.testing.assert_allclose(bands_df['bin_model_price_p0'], models_df.min(axis=1), atol=1e-9)
+        np.testing.assert_allclose(bands_df['bin_model_price_p100'], models_df.max(axis=1), atol=1e-9)
+
+
+def _reference_price(model_df: pd.DataFrame, md: pd.DataFrame, binary_contract_map, config) -> pd.Series:
+    """Per contract model price lookup, as the calibration model used to price"""
+    prices = []
+    for cid, mid_price in md['mid_price'].items():
+        is_binary = binary_contract_map.get(cid)
+        column = 'bin_model_price' if is_binary else 'non_bin_model_price'
+        enabled = config['calibration-model-enable-binary' if is_binary else 'calibration-model-enable-non-binary']
+        price_cents = None if np.isnan(mid_price) else int(round(mid_price * 100))
+        if is_binary is None or not enabled or price_cents not in model_df.index:
+            prices.append(np.nan)
+        else:
+            prices.append(model_df.loc[price_cents, column])
+    return pd.Series(prices, index=md.index, name='model_price')
+
+
+class CalibrationModelTest(unittest.TestCase):
+    def test_matches_per_contract_prices(self):
+        date = datetime.date(2020, 12, 2)
+        cids = np.arange(10, 18)
+        bid = np.array([0.1, 0.3, np.nan, 0.55, 0.0, 0.98, 0.42, 0.7])
+        md = pd.DataFrame({'bid_price': bid, 'ask_price': bid + 0.02, 'trade_price': bid},
+                          index=pd.Index(cids, name='contract_id'))
+        md['timestamp'] = pd.Timestamp(date)
+        snapshot = market_data.MarketDataSnapshot(market_data.add_mid_price(md))
+        # 17 is missing from the contract db
+        binary_contract_map = {cid: cid % 2 == 0 for cid in cids[:-1].tolist()}
+
+        price_cents = pd.Index(np.arange(1, 100), name='price_cents')
+        model_df = pd.DataFrame({'bin_model_price': np.linspace(0.0, 1.0, 99),
+                                 'non_bin_model_price': np.linspace(0.02, 0.9, 99)}, index=price_cents)
+
+        with tempfile.TemporaryDirectory() as model_dir, \
+                mock.patch.object(calibration, 'generate_parameters', return_value=model_dir), \
+                mock.patch.object(calibration.market_data, 'get_snapshot', return_value=snapshot), \
+                mock.patch('pi_trading_lib.data.contracts.is_binary_contract',
+                           lambda ids: {cid: binary_contract_map[cid] for cid in ids if cid in binary_contract_map}):
+            model_df.to_csv(os.path.join(model_dir, 'model.csv'))
+            calibration.get_model_curve.cache_clear()
+            calibration.get_binary_masks.cache_clear()
+            try:
+                model = calibration.CalibrationModel()
+                for enable_binary, enable_non_binary in [(True, True), (False, True), (True, False)]:
+                    config = model_config.get_config('calibration_model').override({
+                        'calibration-model-enable-binary': enable_binary,
+                        'calibration-model-enable-non-binary': enable_non_binary,
+                    })
+                    expected = _reference_price(model_df, snapshot.data, binary_contract_map, config)
+                    pd.testing.assert_series_equal(model.get_price(config, date), expected, check_exact=False)
+                    live_output = model.compute_live(config, date, snapshot)
+                    np.testing.assert_allclose(live_output.get_price().to_numpy(), expected.to_numpy())
+                self.assertTrue(np.isnan(model.get_price(config, date).loc[12]))
+
+                binary_mask, non_binary_mask = calibration.get_binary_masks(date)
+                np.testing.assert_array_equal(binary_mask, [True, False, True, False, True, False, True, False])
+                np.testing.assert_array_equal(non_binary_mask, [False, True, False, True, False, True, False, False])
+                self.assertIsNone(model.get_price(config, datetime.date(2020, 11, 30)))
+            finally:
+                calibration.get_model_curve.cache_clear()
+                calibration.get_binary_masks.cache_clear()
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pi_trading_lib.models.election_scenarios import Scenarios, ScenarioRisk
+
+
+class ScenariosTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        nmaps = 5000
+        national = rng.normal(size=nmaps)
+        margins = pd.DataFrame({
+            'PA': national + rng.normal(size=nmaps),
+            'WI': national + rng.normal(size=nmaps) + 0.5,
+            'TX': national + rng.normal(size=nmaps) - 1.0,
+        })
+        # positive margins are republican wins
+        sim_maps = -margins
+        sim_maps.insert(0, 'winner', np.where(national > 0, 'Biden', 'Trump'))
+        sim_maps.insert(1, 'trump_ev', (270 - 40 * national).round())
+        sim_maps.insert(2, 'biden_ev', 538 - sim_maps['trump_ev'])
+        self.margins = margins
+        self.scenarios = Scenarios.from_sim_maps(sim_maps)
+        self.contract_info = {1: ['PA', 'democratic'], 2: ['PA', 'republican'], 3: ['WI', 'democratic'],
+                              4: ['TX', 'republican']}
+        self.cids = [1, 2, 3, 4]
+        self.risk = ScenarioRisk(self.cids, self.scenarios.contract_payoffs(self.cids, self.contract_info))
+        self.positions = np.array([10.0, 0.0, -5.0, 3.0])
+        self.prices = np.array([0.5, 0.5, 0.6, 0.2])
+
+    def test_payoffs(self):
+        payoffs = self.risk.payoffs
+        self.assertEqual(payoffs.dtype, np.int8)
+        np.testing.assert_array_equal(payoffs[:, 0], self.margins['PA'] > 0)
+        np.testing.assert_array_equal(payoffs[:, 0] + payoffs[:, 1], 1)
+        np.testing.assert_array_equal(payoffs[:, 3], self.margins['TX'] <= 0)
+
+    def test_risk(self):
+        payoffs = self.risk.payoffs.astype(np.float64)
+        pnl = (payoffs - self.prices) @ self.positions
+        np.testing.assert_allclose(self.risk.pnl(self.positions, self.prices), pnl, atol=1e-4)
+        np.testing.assert_allclose(self.risk.covariance.to_numpy(), np.cov(payoffs.T, bias=True), atol=1e-6)
+
+        distribution = self.risk.distribution(self.positions, self.prices, alpha=0.1)
+        tail = np.sort(pnl)[:500]
+        self.assertAlmostEqual(distribution['cvar'], -tail.mean(), places=3)
+        self.assertAlmostEqual(distribution['std'], pnl.std(), places=3)
+
+        marginal = self.risk.marginal_risk(self.positions, self.prices, alpha=0.1)
+        self.assertAlmostEqual(marginal['std'].sum(), pnl.std(), places=3)
+        self.assertAlmostEqual(marginal['cvar'].sum(), distribution['cvar'], places=3)
+        self.assertEqual(marginal.loc[2, 'std'], 0.0)
@@ -0,0 +1,206 @@
+import datetime
+import http.server
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+import pi_trading_lib.data.data_archive as data_archive
+import pi_trading_lib.data.fivethirtyeight as fte
+import pi_trading_lib.work_dir as work_dir
+
+
+NATIONAL_CSV = (
+    'modeldate,candidate_inc,ecwin_inc\r\n'
+    '8/17/2020,Trump,0.3\r\n'
+    '8/16/2020,Trump,0.31\r\n'
+    '"8/16/2020","Trump, D.",0.32\r\n'
+)
+SIM_JSON = {'states': ['AK', 'AL'], 'maps': [['Biden', 200, 338, -5.0, 3.1], ['Trump', 290, 248, -1.0, 2.0]]}
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    requests: list = []
+    fail_next = 0
+    close_idle = False
+
+    def do_GET(self):
+        _Handler.requests.append((self.path, self.client_address))
+        headers = {}
+        if _Handler.fail_next > 0:
+            _Handler.fail_next -= 1
+            body, status = b'unavailable', 503
+        elif self.path == '/moved.csv':
+            # redirects to another host name of the same server
+            body, status = b'', 302
+            headers['Location'] = f'http://localhost:{self.server.server_address[1]}/national.csv'
+        elif self.path == '/loop.csv':
+            body, status = b'', 301
+            headers['Location'] = '/loop.csv'
+        elif self.path == '/national.csv':
+            body, status = NATIONAL_CSV.encode(), 200
+        elif self.path == '/sims.json':
+            body, status = json.dumps(SIM_JSON).encode(), 200
+        else:
+            body, status = b'not found', 404
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if _Handler.close_idle:
+            # closes the connection after responding, without telling the client
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        _Handler.requests = []
+        _Handler.fail_next = 0
+        _Handler.close_idle = False
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.archive_dir = data_archive._archive_dir
+        data_archive.set_archive_dir(self.tmpdir.name)
+        data_archive._get_data_archives.cache_clear()
+        self.sources = [
+            {'name': 'pres_national_2020', 'begin_date': '20200815', 'end_date': '20201102',
+             'location': f'{self.url}/national.csv', 'date_col': 'modeldate', 'date_format': '%m/%d/%Y'},
+            {'name': 'pres_sim_2020', 'begin_date': '20201025', 'end_date': '20201102',
+             'location': f'{self.url}/sims.json', 'date_col': '', 'date_format': ''},
+        ]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+        data_archive.set_archive_dir(self.archive_dir)
+        data_archive._get_data_archives.cache_clear()
+
+    def _read(self, name, date):
+        return pd.read_csv(data_archive.get_data_file(name, {'date': date}))
+
+    def test_backfill(self):
+        _Handler.fail_next = 1
+        downloader = fte.Downloader(backoff=0.0)
+        fte.archive_data_range(datetime.date(2020, 8, 14), datetime.date(2020, 8, 18), sources=self.sources[:1],
+                               downloader=downloader)
+
+        # one retried download for all dates
+        self.assertEqual([path for path, _ in _Handler.requests], ['/national.csv', '/national.csv'])
+        self.assertFalse(os.path.exists(data_archive.get_data_file('pres_national_2020', {'date': '20200814'})))
+        self.assertEqual(self._read('pres_national_2020', '20200816')['candidate_inc'].tolist(), ['Trump', 'Trump, D.'])
+        self.assertEqual(self._read('pres_national_2020', '20200817')['ecwin_inc'].tolist(), [0.3])
+        self.assertEqual(len(self._read('pres_national_2020', '20200818')), 0)
+
+        # existing dates are not downloaded again, connections are reused
+        fte.archive_data_range(datetime.date(2020, 8, 16), datetime.date(2020, 8, 17), sources=self.sources[:1],
+                               downloader=downloader)
+        self.assertEqual(len(_Handler.requests), 2)
+        fte.archive_data_range(datetime.date(2020, 8, 19), datetime.date(2020, 8, 19), sources=self.sources[:1],
+                               downloader=downloader, workers=1)
+        self.assertEqual(_Handler.requests[1][1], _Handler.requests[2][1])
+
+    def test_sims_only_archived_for_end_date(self):
+        fte.archive_data_range(datetime.date(2020, 10, 20), datetime.date(2020, 10, 27), sources=self.sources)
+        self.assertFalse(os.path.exists(data_archive.get_data_file('pres_sim_2020', {'date': '20201026'})))
+        sims = self._read('pres_sim_2020', '20201027')
+        self.assertEqual(sims.columns.tolist(), ['winner', 'trump_ev', 'biden_ev', 'AK', 'AL'])
+        self.assertEqual(len(sims), 2)
+
+    def test_client_error_not_retried(self):
+        sources = [dict(self.sources[0], location=f'{self.url}/missing.csv')]
+        with self.assertRaises(IOError):
+            fte.archive_data_range(datetime.date(2020, 8, 16), datetime.date(2020, 8, 16), sources=sources)
+        self.assertEqual(len(_Handler.requests), 1)
+
+    def test_redirect(self):
+        sources = [dict(self.sources[0], location=f'{self.url}/moved.csv')]
+        fte.archive_data_range(datetime.date(2020, 8, 17), datetime.date(2020, 8, 17), sources=sources)
+        self.assertEqual([path for path, _ in _Handler.requests], ['/moved.csv', '/national.csv'])
+        self.assertEqual(self._read('pres_national_2020', '20200817')['ecwin_inc'].tolist(), [0.3])
+
+        sources = [dict(self.sources[0], location=f'{self.url}/loop.csv')]
+        with self.assertRaises(IOError):
+            fte.archive_data_range(datetime.date(2020, 8, 18), datetime.date(2020, 8, 18), sources=sources)
+        self.assertEqual(len(_Handler.requests), 2 + fte.MAX_REDIRECTS + 1)
+
+    def test_stale_connection(self):
+        _Handler.close_idle = True
+        downloader = fte.Downloader(retries=0)
+        with mock.patch.object(fte.time, 'sleep') as sleep:
+            for _ in range(3):
+                self.assertEqual(downloader.get(f'{self.url}/national.csv'), NATIONAL_CSV.encode())
+        # closed idle connections are replaced without counting as retries or backing off
+        self.assertEqual(len(_Handler.requests), 3)
+        self.assertEqual(len(set(client for _, client in _Handler.requests)), 3)
+        sleep.assert_not_called()
+
+
+class StoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.archive_dir = data_archive._archive_dir
+        self.work_dir = work_dir._work_dir
+        work_dir.set_work_dir(os.path.join(self.tmpdir.name, 'work'))
+        fte.get_store.cache_clear()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        data_archive.set_archive_dir(self.archive_dir)
+        data_archive._get_data_archives.cache_clear()
+        work_dir.set_work_dir(self.work_dir)
+        fte.get_store.cache_clear()
+
+    def _archive(self, name, ecwin):
+        data_archive.set_archive_dir(os.path.join(self.tmpdir.name, name))
+        data_archive._get_data_archives.cache_clear()
+        dates = [datetime.date(2020, 8, 16), datetime.date(2020, 8, 17), datetime.date(2020, 8, 18)]
+        for date in dates:
+            path = data_archive.get_data_file('pres_national_2020', {'date': date})
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pd.DataFrame({'modeldate': [date.isoformat()], 'ecwin_inc': [ecwin]}).to_csv(path, index=False)
+        return dates
+
+    def test_prepare_batches_dates(self):
+        dates = self._archive('archive_1', 0.3)
+        with mock.patch.object(fte.Store, '_add_dates', autospec=True, side_effect=fte.Store._add_dates) as add_dates:
+            fte.prepare('pres_national_2020', dates)
+            for date in dates:
+                self.assertEqual(fte.get_df('pres_national_2020', date, date)['ecwin_inc'].tolist(), [0.3])
+            self.assertEqual(add_dates.call_count, 1)
+
+        # stores are kept per archive dir
+        self._archive('archive_2', 0.4)
+        self.assertEqual(fte.get_df('pres_national_2020', dates[0], dates[-1])['ecwin_inc'].tolist(), [0.4] * 3)
+        fte.get_store.cache_clear()
+        self._archive('archive_1', 0.3)
+        self.assertEqual(fte.get_df('pres_national_2020', dates[0], dates[-1])['ecwin_inc'].tolist(), [0.3] * 3)
+
+    def test_concurrent_stores(self):
+        dates = self._archive('archive_1', 0.3)
+        archive_dir = data_archive.get_archive_dir()
+        # stores of two processes consolidating different dates
+        store_1 = fte.Store('pres_national_2020', archive_dir)
+        store_2 = fte.Store('pres_national_2020', archive_dir)
+        store_1.add(dates[:2])
+        store_2.add(dates[2:])
+
+        # the last write replaces the table with its dates, so no dates are listed without their rows
+        store = fte.Store('pres_national_2020', archive_dir)
+        self.assertEqual(store.dates, {dates[2]})
+        self.assertEqual(store.df[fte.Store.DATE_COL].dt.date.tolist(), [dates[2]])
+        self.assertEqual(store.get(dates[0], dates[-1])['ecwin_inc'].tolist(), [0.3] * 3)
+        self.assertEqual(fte.Store('pres_national_2020', archive_dir).dates, set(dates))
@@ -0,0 +1,98 @@
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+import typing as t
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from pi_trading_lib.accountant import Book, Universe
+from pi_trading_lib.data.market_data import MarketDataSnapshot, add_mid_price
+import pi_trading_lib.data.contract_db as contract_db
+import pi_trading_lib.data.data_archive as data_archive
+import pi_trading_lib.data.history as history
+import pi_trading_lib.data.market_data as market_data
+import pi_trading_lib.data.resolution as resolution
+
+
+def contract_names(cids) -> t.Dict[int, str]:
+    return {cid: f'contract {cid}' for cid in cids}
+
+
+def make_book(cids: np.ndarray, capital: float, position: t.Optional[np.ndarray] = None,
+              pos_cost: t.Optional[np.ndarray] = None) -> Book:
+    """Book holding position in cids, without a fifo or contract db lookups"""
+    with mock.patch('pi_trading_lib.data.contracts.get_contract_names', contract_names):
+        book = Book.__new__(Book)
+        book.universe = Universe(cids)
+    book.capital = capital
+    book.position = np.zeros(len(cids)) if position is None else position
+    book.pos_cost = np.zeros(len(cids)) if pos_cost is None else pos_cost
+    return book
+
+
+def make_snapshot(cids: np.ndarray, bid: np.ndarray, market_ids: t.Optional[np.ndarray] = None,
+                  spread: float = 0.02) -> MarketDataSnapshot:
+    """Snapshot quoting bid and bid + spread, trading at bid, each contract its own market by default"""
+    md = pd.DataFrame({
+        'market_id': cids if market_ids is None else market_ids,
+        'bid_price': bid,
+        'ask_price': bid + spread,
+        'trade_price': bid,
+    }, index=pd.Index(cids, name='contract_id'))
+    md['timestamp'] = pd.Timestamp('2020-01-01')
+    return MarketDataSnapshot(add_mid_price(md))
+
+
+def _reset_contract_db():
+    """Closes the contract db connection and drops caches of its contents"""
+    connection = getattr(contract_db._thread_connections, 'connection', None)
+    if connection is not None:
+        connection.close()
+    contract_db._thread_connections.connection = None
+    data_archive._get_data_archives.cache_clear()
+    market_data._get_archived_raw_data.cache_clear()
+    history._load_history_panel.cache_clear()
+    resolution.invalidate_resolution_table()
+
+
+@contextlib.contextmanager
+def temp_archive() -> t.Iterator[str]:
+    """Makes a temporary dir with an empty contract db the data archive, yields the archive dir"""
+    archive_dir = data_archive._archive_dir
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _reset_contract_db()
+        data_archive.set_archive_dir(tmp_dir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                contract_db.initialize_db()
+            yield tmp_dir
+        finally:
+            _reset_contract_db()
+            data_archive._archive_dir = archive_dir
+
+
+def add_contracts(contracts: t.Dict[int, t.Tuple[int, t.Optional[datetime.date]]]):
+    """Adds {contract id: (market id, end date)} to the contract db, with a market per market id"""
+    with contract_db.get_contract_db() as db:
+        market_ids = sorted(set(market_id for market_id, _ in contracts.values()))
+        db.executemany('INSERT OR IGNORE INTO market VALUES (?, ?)', [(mid, f'market {mid}') for mid in market_ids])
+        db.executemany('INSERT INTO contract VALUES (?, ?, ?, ?, ?, ?)', [
+            (cid, f'contract {cid}', market_id, '2020-08-01', '2020-08-01',
+             None if end_date is None else end_date.isoformat())
+            for cid, (market_id, end_date) in contracts.items()
+        ])
+
+
+def write_market_data(date: datetime.date, quotes: pd.DataFrame):
+    """Archives quotes, with contract_id, market_id and price columns, as the market data csv of date"""
+    path = data_archive.get_data_file('market_data_csv', {'date': date})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    csv_df = quotes.rename(columns={'contract_id': 'id'})
+    # one quote per second from midnight
+    timestamps = pd.Timestamp(date) + pd.to_timedelta(np.arange(len(quotes)), unit='s')
+    csv_df.insert(0, 'timestamp', timestamps.to_numpy(dtype='datetime64[ms]').astype(np.int64))
+    csv_df.to_csv(path, index=False)
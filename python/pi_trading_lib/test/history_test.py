@@ -0,0 +1,77 @@
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import pi_trading_lib.data.history as history
+from pi_trading_lib.test.helpers import add_contracts, temp_archive
+
+
+class ComputeHistoryTest(unittest.TestCase):
+    def setUp(self):
+        timestamps = pd.to_datetime([0, 60 * 1000, 60 * 1000, 120 * 1000], unit='ms')
+        self.df = pd.DataFrame({
+            'timestamp': timestamps,
+            'contract_id': [1, 1, 2, 1],
+            'market_id': [10, 10, 10, 10],
+            'bid_price': [0.40, 0.40, 0.10, 0.42],
+            'ask_price': [0.50, 0.50, 0.20, 0.44],
+            'trade_price': [0.45, 0.46, 0.15, 0.43],
+        }).set_index(['timestamp', 'contract_id'])
+
+    def test_counts(self):
+        res = history.compute_history(self.df)
+        self.assertEqual(dict(res[history.BBO_CHANGE_COUNT]), {1: 1, 2: 0})
+        self.assertEqual(dict(res[history.PI_DATA_CHANGE_COUNT]), {1: 2, 2: 0})
+        self.assertEqual(dict(res[history.QUOTE_UPDATE_COUNT]), {1: 2, 2: 1})
+
+    def test_spread(self):
+        res = history.compute_history(self.df)
+        self.assertAlmostEqual(dict(res[history.MEAN_SPREAD])[1], (0.1 + 0.1 + 0.02) / 3)
+        self.assertAlmostEqual(dict(res[history.MAX_SPREAD])[1], 0.1)
+
+    def test_does_not_modify_input(self):
+        columns = self.df.columns.tolist()
+        history.compute_history(self.df)
+        self.assertEqual(self.df.columns.tolist(), columns)
+
+    def test_empty(self):
+        self.assertEqual(history.compute_history(self.df.iloc[:0]), {})
+
+
+class HistoryPanelTest(unittest.TestCase):
+    def test_range_scan(self):
+        dates = [datetime.date(2020, 9, 1) + datetime.timedelta(days=i) for i in range(4)]
+        with temp_archive():
+            add_contracts({cid: (1, None) for cid in [1, 2, 3]})
+            rows = {(1, 0): 5.0, (2, 0): 7.0, (1, 2): 6.0, (3, 3): 1.0}
+            for (cid, day), value in rows.items():
+                history.update_history([(cid, value)], dates[day], history.BBO_CHANGE_COUNT)
+                history.update_history([(cid, value / 10)], dates[day], history.MEAN_SPREAD)
+
+            # all contracts with history in range, dates without history are NaN
+            panel = history.get_history_panel(dates[0], dates[2], [history.MEAN_SPREAD, history.BBO_CHANGE_COUNT])
+            np.testing.assert_array_equal(panel.contract_ids, [1, 2])
+            expected = pd.DataFrame([[5.0, 7.0], [np.nan, np.nan], [6.0, np.nan]],
+                                    index=pd.DatetimeIndex(dates[:3], name='date'),
+                                    columns=pd.Index([1, 2], name='contract_id'))
+            pd.testing.assert_frame_equal(panel.frame(history.BBO_CHANGE_COUNT), expected, check_index_type=False)
+            pd.testing.assert_frame_equal(panel.frame(history.MEAN_SPREAD), expected / 10, check_index_type=False)
+            with self.assertRaises(ValueError):
+                panel.values[history.MEAN_SPREAD][0, 0] = 0.0
+
+            # contracts without history in range are NaN
+            selected = history.get_history_panel(dates[0], dates[2], [history.BBO_CHANGE_COUNT], [3, 1, 99])
+            np.testing.assert_array_equal(selected.values[history.BBO_CHANGE_COUNT],
+                                          [[np.nan, 5.0, np.nan], [np.nan, np.nan, np.nan], [np.nan, 6.0, np.nan]])
+            self.assertEqual(history.get_bbo_change_count([1, 2, 3], dates[0]), {1: 5, 2: 7})
+            self.assertEqual(len(history.get_history_panel(dates[1], dates[1], [history.MAX_SPREAD]).contract_ids), 0)
+
+            # panels are cached until history is written
+            panel = history.get_history_panel(dates[0], dates[3], [history.BBO_CHANGE_COUNT])
+            self.assertIs(history.get_history_panel(dates[0], dates[3], [history.BBO_CHANGE_COUNT]), panel)
+            history.update_history([(2, 8.0)], dates[3], history.BBO_CHANGE_COUNT)
+            history.update_history([(1, 9.0)], dates[0], history.BBO_CHANGE_COUNT, replace=True)
+            counts = history.get_history_panel(dates[0], dates[3], [history.BBO_CHANGE_COUNT], [1, 2])
+            np.testing.assert_array_equal(counts.values[history.BBO_CHANGE_COUNT][[0, 3]], [[9.0, 7.0], [np.nan, 8.0]])
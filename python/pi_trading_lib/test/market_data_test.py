@@ -0,0 +1,147 @@
+import datetime
+import os
+import tempfile
+import typing as t
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import pi_trading_lib.data.market_data as market_data
+import pi_trading_lib.data.raw_feed as raw_feed
+
+
+def _raw_data(date: datetime.date, ticks: int = 500, contracts: int = 20) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    timestamps = pd.Timestamp(date) + pd.to_timedelta(np.sort(rng.integers(0, 24 * 3600, ticks)), unit='s')
+    cids = rng.integers(0, contracts, ticks)
+    bid = rng.integers(1, 90, ticks) / 100
+    df = pd.DataFrame({
+        'timestamp': timestamps,
+        'contract_id': cids,
+        'market_id': cids // 4,
+        'bid_price': bid,
+        'ask_price': bid + 0.02,
+        'trade_price': bid + 0.01,
+        'name': [f'contract {cid}' for cid in cids],
+    })
+    return df.set_index(['timestamp', 'contract_id'])
+
+
+class IntradaySnapshotsTest(unittest.TestCase):
+    def test_matches_as_of_snapshots(self):
+        date = datetime.date(2000, 1, 1)
+        raw = _raw_data(date)
+        with mock.patch.object(market_data, 'get_raw_data', lambda _: raw):
+            market_data._get_archived_snapshot.cache_clear()
+            contracts = np.arange(-1, 15)
+            sod = market_data.get_snapshot(date).data.reindex(contracts)
+            snapshots = []
+            for time, snapshot, ticked in market_data.IntradaySnapshots(date, datetime.timedelta(minutes=30), contracts):
+                expected = market_data.get_snapshot(time).data
+                ticked_before = expected.index[expected.index.isin(contracts)]
+                pd.testing.assert_frame_equal(snapshot.data.loc[ticked_before, expected.columns],
+                                              expected.loc[ticked_before], check_dtype=False)
+                # contracts without ticks before time keep start of day values
+                not_ticked = snapshot.data.index.difference(ticked_before)
+                pd.testing.assert_frame_equal(snapshot.data.loc[not_ticked, expected.columns],
+                                              sod.loc[not_ticked, expected.columns], check_dtype=False)
+                self.assertTrue(set(ticked) <= set(ticked_before))
+                snapshots.append((time, snapshot))
+
+            # snapshots are not changed by later steps
+            for time, snapshot in snapshots[:3]:
+                expected = market_data.get_snapshot(time).data
+                ticked_before = expected.index[expected.index.isin(contracts)]
+                pd.testing.assert_frame_equal(snapshot.data.loc[ticked_before, expected.columns],
+                                              expected.loc[ticked_before], check_dtype=False)
+            market_data._get_archived_snapshot.cache_clear()
+        self.assertEqual(len(snapshots), 48)
+
+
+def _csv_lines(raw: pd.DataFrame) -> t.List[str]:
+    df = raw.reset_index()
+    timestamps = df['timestamp'].to_numpy(dtype='datetime64[ms]').astype(np.int64)
+    return ['timestamp,type,id,market_id,status,trade_price,bid_price,ask_price,\n'] + [
+        f'{ts},piquote,{row.contract_id},{row.market_id},OPEN,{row.trade_price},{row.bid_price},{row.ask_price},\n'
+        for ts, row in zip(timestamps, df.itertuples())
+    ]
+
+
+class DayFeedTest(unittest.TestCase):
+    def test_follows_growing_file(self):
+        date = datetime.date(2000, 1, 1)
+        raw = _raw_data(date)
+        lines = _csv_lines(raw)
+        names = mock.patch('pi_trading_lib.data.contracts.get_contract_names',
+                           lambda cids: {cid: f'contract {cid}' for cid in cids})
+        with tempfile.TemporaryDirectory() as tmp_dir, names:
+            path = os.path.join(tmp_dir, 'md.csv')
+            feed = raw_feed.DayFeed(path, 'csv')
+            with open(path, 'w') as f:
+                f.writelines(lines[:200])
+                f.write(lines[200][:5])
+            self.assertEqual(feed.refresh(), 199)
+            checkpoint = feed.offset
+            with open(path, 'a') as f:
+                f.write(lines[200][5:])
+                f.writelines(lines[201:])
+            self.assertEqual(feed.refresh(), len(raw) - 199)
+
+            pd.testing.assert_frame_equal(feed.raw_data(), raw, check_dtype=False, check_index_type=False)
+            self.assertEqual(len(feed.since(checkpoint)), len(raw) - 199)
+
+            with mock.patch.object(market_data, 'get_raw_data', lambda _: raw):
+                market_data._get_archived_snapshot.cache_clear()
+                for time in [None, datetime.datetime(2000, 1, 1, 12), datetime.datetime(2000, 1, 2)]:
+                    expected = market_data._get_archived_snapshot(time or date).data.drop(columns='mid_price')
+                    snapshot = feed.snapshot(time).loc[expected.index]
+                    pd.testing.assert_frame_equal(snapshot, expected, check_dtype=False, check_index_type=False)
+                market_data._get_archived_snapshot.cache_clear()
+            feed.tail.close()
+
+    def test_late_rows(self):
+        date = datetime.date(2000, 1, 1)
+        raw = _raw_data(date)
+        header, lines = _csv_lines(raw)[:1], _csv_lines(raw)[1:]
+        names = mock.patch('pi_trading_lib.data.contracts.get_contract_names',
+                           lambda cids: {cid: f'contract {cid}' for cid in cids})
+        with tempfile.TemporaryDirectory() as tmp_dir, names:
+            path = os.path.join(tmp_dir, 'md.csv')
+            feed = raw_feed.DayFeed(path, 'csv')
+            # the second read has rows older than the end of the first
+            with open(path, 'w') as f:
+                f.writelines(header + lines[:150] + lines[200:250])
+            feed.refresh()
+            pd.testing.assert_frame_equal(feed.raw_data(), raw.iloc[list(range(150)) + list(range(200, 250))],
+                                          check_dtype=False, check_index_type=False)
+            with open(path, 'a') as f:
+                f.writelines(lines[150:200] + lines[250:])
+            feed.refresh()
+            pd.testing.assert_frame_equal(feed.raw_data(), raw, check_dtype=False, check_index_type=False)
+
+            with mock.patch.object(market_data, 'get_raw_data', lambda _: raw):
+                market_data._get_archived_snapshot.cache_clear()
+                for hour in [6, 12, 18]:
+                    time = datetime.datetime(2000, 1, 1, hour)
+                    expected = market_data._get_archived_snapshot(time).data.drop(columns='mid_price')
+                    snapshot = feed.snapshot(time).loc[expected.index]
+                    pd.testing.assert_frame_equal(snapshot, expected, check_dtype=False, check_index_type=False)
+                market_data._get_archived_snapshot.cache_clear()
+            feed.tail.close()
+
+    def test_json_keeps_changed_quotes(self):
+        feed = raw_feed.DayFeed('')
+        quotes = {'timestamp': np.array(['2000-01-01T00:00'] * 2, dtype='datetime64[ms]'),
+                  'market_id': np.array([1, 1]), 'contract_id': np.array([10, 11]),
+                  'bid_price': np.array([0.1, 0.5]), 'ask_price': np.array([0.2, 0.6]),
+                  'trade_price': np.array([0.1, 0.5])}
+        feed._ingest(quotes, dedupe=True)
+        feed._ingest(dict(quotes, bid_price=np.array([0.1, 0.55])), dedupe=True)
+        np.testing.assert_array_equal(feed.buffer['contract_id'], [10, 11, 11])
+        np.testing.assert_array_equal(feed.last_row, [0, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
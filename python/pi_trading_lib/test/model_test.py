@@ -0,0 +1,51 @@
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pi_trading_lib.model import Model
+import pi_trading_lib.model_config as model_config
+
+
+class CountingModel(Model):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def get_universe(self, config, date):
+        self.calls += 1
+        return np.array([date.day + 1, 1])
+
+    def get_price(self, config, date):
+        return pd.Series([0.5, date.day / 100], index=[1, date.day + 1])
+
+    @property
+    def name(self):
+        return 'counting-model'
+
+
+class ModelOutputsTest(unittest.TestCase):
+    def test_compute(self):
+        config = model_config.get_config('current')
+        model = CountingModel()
+        dates = [datetime.date(2020, 1, 1), datetime.date(2020, 1, 2)]
+        outputs = model.compute(config, dates)
+
+        np.testing.assert_array_equal(outputs.cids, [1, 2, 3])
+        np.testing.assert_array_equal(outputs.in_universe, [[True, True, False], [True, False, True]])
+        np.testing.assert_array_equal(outputs.price, [[0.5, 0.01, np.nan], [0.5, np.nan, 0.02]])
+        self.assertFalse(outputs.has_factor.any())
+
+        day = outputs.get(dates[1])
+        np.testing.assert_array_equal(day.universe, [1, 3])
+        self.assertIsNone(day.factor)
+
+        # only the new date is computed
+        outputs = model.compute(config, dates[1:] + [datetime.date(2020, 1, 3)])
+        self.assertEqual(model.calls, 3)
+        np.testing.assert_array_equal(outputs.price_df().loc[datetime.date(2020, 1, 3)], [0.5, np.nan, 0.03])
+
+
+if __name__ == '__main__':
+    unittest.main()
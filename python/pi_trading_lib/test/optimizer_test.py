@@ -0,0 +1,128 @@
+import typing as t
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import pi_trading_lib.model_config as model_config
+import pi_trading_lib.optimizer as optimizer
+from pi_trading_lib.test.helpers import make_book, make_snapshot
+
+
+def _problem(size: int, missing_quotes: int = 0):
+    rng = np.random.default_rng(0)
+    cids = np.arange(size)
+    position = np.where(rng.uniform(size=size) < 0.05, 50, 0)
+    book = make_book(cids, 5000.0, position, position * 0.5)
+
+    bid = rng.integers(1, 90, size) / 100
+    bid[:missing_quotes] = np.nan
+    price_model = pd.Series(bid + 0.01 + rng.normal(0, 0.02, size), index=cids)
+    return book, make_snapshot(cids, bid, cids // 4), price_model
+
+
+class ReductionTest(unittest.TestCase):
+    def test_matches_full_solve(self):
+        book, md, price_model = _problem(200)
+        for objective in ['linear', 'cvar']:
+            overrides = {'optimizer-objective': objective, 'optimizer-scenarios': 100}
+            config = model_config.get_config('current').override(overrides)
+            results = {}
+            for reduce in [False, True]:
+                results[reduce] = optimizer.optimize(book, md, [price_model], [1.0], [], [],
+                                                     config.override({'optimizer-reduce': reduce}))['new_pos']
+            # solver tolerance can move positions by a rounding step
+            np.testing.assert_allclose(results[True], results[False], atol=10)
+
+    def test_validate(self):
+        book, md, price_model = _problem(200, missing_quotes=3)
+        config = model_config.get_config('current').override({'optimizer-reduce-validate': True})
+        stats = optimizer.ReductionStats()
+        optimizer.optimize(book, md, [price_model], [1.0], [], [], config, reduction_stats=stats)
+        self.assertEqual((stats.validated, stats.mismatched), (1, 0))
+
+    def test_inactive_contracts(self):
+        book, md, price_model = _problem(200, missing_quotes=3)
+        config = model_config.get_config('current')
+        agg_price_model = optimizer._agg_price_model(md, [price_model], [1.0])
+        active = optimizer._active_contracts(md, agg_price_model, book.position, [], [], config)
+
+        edge = np.maximum(agg_price_model - md['ask_price'], md['bid_price'] - agg_price_model)
+        expected = ((book.position != 0) | (edge > config['optimizer-take-edge'])) & ~np.isnan(md['bid_price'])
+        np.testing.assert_array_equal(active, expected)
+        self.assertLess(active.sum(), 100)
+
+        # contracts without quotes keep their position instead of failing the solve, with or without the reduction
+        stats = optimizer.ReductionStats()
+        for reduce in [True, False]:
+            result = optimizer.optimize(book, md, [price_model], [1.0], [], [],
+                                        config.override({'optimizer-reduce': reduce}), reduction_stats=stats)
+            np.testing.assert_array_equal(result['new_pos'].iloc[:3], book.position[:3])
+            self.assertTrue((result['take_edge'] > 0).all())
+        np.testing.assert_array_equal(result['new_pos'][~active], book.position[~active])
+        self.assertEqual((stats.problems, stats.contracts, stats.solved_contracts), (2, 400, active.sum() + 197))
+
+
+def _contracts(bids: t.List[float], probs: t.List[float], capital: float):
+    """Book without positions in independent contracts, each its own market"""
+    cids = np.arange(len(bids))
+    return make_book(cids, capital), make_snapshot(cids, np.array(bids)), pd.Series(probs, index=cids)
+
+
+class ScenarioObjectiveTest(unittest.TestCase):
+    def setUp(self):
+        # independent contracts merge into few scenarios, so many can be sampled for accurate probabilities
+        self.config = model_config.get_config('current').override({
+            'optimizer-max-add-order-size': 10000,
+            'optimizer-scenarios': 20000,
+        })
+
+    def test_no_trade_without_edge(self):
+        book, md, _ = _contracts([0.2, 0.5, 0.8], [0.21, 0.51, 0.81], 1000.0)
+        for objective in ['kelly', 'cvar']:
+            # solve for every contract, the reduction would skip contracts without edge
+            config = self.config.override({'optimizer-objective': objective, 'optimizer-reduce': False})
+            result = optimizer.optimize(book, md, [md['mid_price']], [1.0], [], [], config)
+            np.testing.assert_array_equal(result['new_pos'], 0)
+
+    def test_kelly_sizing(self):
+        book, md, price_model = _contracts([0.48], [0.7], 1000.0)
+        config = self.config.override({'optimizer-objective': 'kelly'})
+        agg_price_model = optimizer._agg_price_model(md, [price_model], [1.0])
+        prob = optimizer._get_scenarios(md, agg_price_model, [], config).expected_payoffs()[0]
+
+        # kelly stakes (p - c) / (1 - c) of capital at cost c, well within the position limit
+        cost = md['ask_price'].iloc[0] + config['optimizer-take-edge']
+        kelly_pos = (prob - cost) / (1 - cost) * book.capital / cost
+        new_pos = optimizer.optimize(book, md, [price_model], [1.0], [], [], config)['new_pos'].iloc[0]
+        self.assertAlmostEqual(new_pos, kelly_pos, delta=0.05 * kelly_pos)
+
+        # doubling capital doubles the kelly position
+        book.capital *= 2
+        new_pos_2 = optimizer.optimize(book, md, [price_model], [1.0], [], [], config)['new_pos'].iloc[0]
+        self.assertAlmostEqual(new_pos_2, 2 * kelly_pos, delta=0.1 * kelly_pos)
+
+    def test_cvar_shrinks_tail(self):
+        book, md, price_model = _contracts([0.3, 0.5, 0.6], [0.45, 0.65, 0.75], 5000.0)
+        config = self.config.override({'optimizer-objective': 'cvar'})
+        agg_price_model = optimizer._agg_price_model(md, [price_model], [1.0])
+        payoffs = optimizer._get_scenarios(md, agg_price_model, [], config).payoffs.toarray()
+
+        def tail_loss(new_pos):
+            # mean loss of the worst optimizer-cvar-alpha of scenarios against the cost at the ask
+            value = payoffs @ new_pos - md['ask_price'].to_numpy() @ new_pos
+            worst = np.sort(value)[:int(len(value) * config['optimizer-cvar-alpha'])]
+            return -worst.mean()
+
+        positions = []
+        for penalty in [0.0, 0.1]:
+            positions.append(optimizer.optimize(book, md, [price_model], [1.0], [], [],
+                                                config.override({'optimizer-cvar-penalty': penalty}))['new_pos'])
+        # still trades the edge, with smaller positions and tail loss
+        self.assertGreater(positions[1].sum(), 0)
+        self.assertTrue((positions[1] <= positions[0]).all())
+        self.assertLess(tail_loss(positions[1].to_numpy()), 0.75 * tail_loss(positions[0].to_numpy()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import threading
+import time
+import unittest
+
+from pi_trading_lib.prefetch import Prefetcher
+
+
+class PrefetcherTest(unittest.TestCase):
+    def test_loads_ahead(self):
+        for depth in [0, 1, 3]:
+            loaded = []
+            lock = threading.Lock()
+
+            def load(item):
+                time.sleep(0.01)
+                with lock:
+                    loaded.append(item)
+                return item * 2
+
+            results = []
+            for item, value in Prefetcher(load, range(6), depth=depth):
+                time.sleep(0.02)
+                # loads never run more than depth items ahead
+                with lock:
+                    self.assertLessEqual(max(loaded), item + depth)
+                results.append((item, value))
+
+            self.assertEqual(results, [(item, item * 2) for item in range(6)])
+            self.assertEqual(loaded, list(range(6)))
+
+    def test_hides_load_time(self):
+        prefetcher = Prefetcher(lambda item: time.sleep(0.02), range(5), depth=1)
+        for _ in prefetcher:
+            time.sleep(0.03)
+        self.assertGreater(prefetcher.hidden_time, 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import datetime
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from pi_trading_lib.data.raw_feed import DayFeed, RawFeedTail, parse_packet
+from pi_trading_lib.model import Model
+from pi_trading_lib.prod import LatencyHistogram, LiveTrader, read_positions, run
+import pi_trading_lib.model_config as model_config
+
+
+def packet(timestamp, market_id, quotes):
+    contracts = [{'id': cid, 'name': str(cid), 'status': 'Open', 'bid_price': bid, 'ask_price': ask,
+                  'trade_price': trade} for cid, (bid, ask, trade) in quotes.items()]
+    market = {'id': market_id, 'name': str(market_id), 'status': 'Open', 'timestamp': timestamp,
+              'contracts': contracts}
+    return json.dumps({'market_updates': {str(market_id): market}})
+
+
+class StubModel(Model):
+    def get_universe(self, config, date):
+        return np.array([10, 11, 20])
+
+    def get_price(self, config, date):
+        return pd.Series([0.6, 0.46, 0.3], index=[10, 11, 20])
+
+    @property
+    def name(self):
+        return 'election-model'
+
+
+class LiveTradingTest(unittest.TestCase):
+    def test_tail_partial_lines(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'feed.json')
+            tail = RawFeedTail(path)
+            self.assertEqual(tail.read(), [])
+
+            first = packet('2020-11-03T14:00:00.123Z', 1, {10: (0.4, 0.5, 0.45)})
+            second = packet('2020-11-03T14:00:01Z', 1, {10: (0.41, 0.5, 0.45)})
+            with open(path, 'w') as f:
+                f.write(first + '\n' + second[:10])
+            self.assertEqual(tail.read(), [first])
+            with open(path, 'a') as f:
+                f.write(second[10:] + '\n')
+            self.assertEqual(tail.read(max_lines=1), [second])
+            self.assertEqual(tail.read(), [])
+            tail.close()
+
+            quotes = parse_packet(first)
+            self.assertEqual(quotes['timestamp'][0], np.datetime64('2020-11-03T14:00:00.123'))
+            np.testing.assert_array_equal(quotes['contract_id'], [10])
+
+    @mock.patch('pi_trading_lib.data.contracts.get_contracts', lambda cids: {cid: {} for cid in cids})
+    @mock.patch('pi_trading_lib.data.contracts.get_contract_names', lambda cids: {cid: '' for cid in cids})
+    def test_replay(self):
+        packets = [
+            packet('2020-11-03T14:00:00Z', 1, {10: (0.4, 0.42, 0.41), 11: (0.45, 0.47, 0.46)}),
+            packet('2020-11-03T14:00:01Z', 2, {20: (0.29, 0.31, 0.3)}),
+            # unchanged quotes are dropped by the feed
+            packet('2020-11-03T14:00:02Z', 2, {20: (0.29, 0.31, 0.3)}),
+            packet('2020-11-03T14:00:03Z', 1, {10: (0.7, 0.72, 0.71), 11: (0.45, 0.47, 0.46)}),
+        ]
+        # optimal positions are reached in a single cycle
+        config = model_config.get_config('current').override({'optimizer-max-add-order-size': 10000})
+        date = datetime.date(2020, 11, 3)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            feed_path = os.path.join(tmp_dir, 'feed.json')
+            targets_path = os.path.join(tmp_dir, 'targets.csv')
+            with open(feed_path, 'w') as f:
+                f.writelines(line + '\n' for line in packets)
+
+            trader = LiveTrader(config, date, [StubModel()], DayFeed(feed_path), 1000.0)
+            targets = [trader.cycle(max_lines=1) for _ in packets]
+            self.assertIsNone(trader.cycle(max_lines=1))
+            trader.feed.tail.close()
+
+            # buys the underpriced contract, then sells it once its bid is above the model
+            self.assertEqual(targets[0].index.tolist(), [10])
+            self.assertGreater(targets[0][10], 0)
+            self.assertEqual([len(cycle_targets) for cycle_targets in targets[1:3]], [0, 0])
+            self.assertLess(targets[3][10], 0)
+            self.assertEqual(trader.latency['cycle'].count, 4)
+
+            # a restart continues from the targets written so far
+            trader = LiveTrader(config, date, [StubModel()], DayFeed(feed_path), 1000.0)
+            run(trader, targets_path, 0.0, True, 1e9)
+            restarted = LiveTrader(config, date, [StubModel()], DayFeed(feed_path), 1000.0)
+            restarted.restore(read_positions(targets_path))
+            self.assertEqual(restarted.restored.to_dict(), {10: targets[3][10]})
+            self.assertEqual(len(restarted.cycle()), 0)
+            self.assertEqual(len(restarted.restored), 0)
+            np.testing.assert_array_equal(restarted.book.position, trader.book.position)
+            restarted.feed.tail.close()
+
+    def test_histogram(self):
+        hist = LatencyHistogram()
+        for latency in [0.001] * 99 + [1.0]:
+            hist.record(latency)
+        self.assertEqual(hist.quantile(0.5), 1.0)
+        self.assertEqual(hist.quantile(1.0), 1024.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import datetime
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import pi_trading_lib.data.contract_db as contract_db
+import pi_trading_lib.data.resolution as resolution
+from pi_trading_lib.test.helpers import add_contracts, temp_archive, write_market_data
+
+
+def _quotes(cids, bids, asks, trades) -> pd.DataFrame:
+    return pd.DataFrame({'contract_id': cids, 'market_id': 1, 'bid_price': bids, 'ask_price': asks,
+                         'trade_price': trades})
+
+
+class ResolveTest(unittest.TestCase):
+    def test_matches_db_lookup(self):
+        end_dates = [datetime.date(2020, 9, 1) + datetime.timedelta(days=i) for i in range(4)]
+        with temp_archive(), mock.patch('builtins.print'):
+            add_contracts({cid: (cid // 4, end_dates[cid % 4]) for cid in range(1, 12)})
+            with contract_db.get_contract_db() as db:
+                db.executemany('INSERT INTO resolution VALUES (?, ?)', [(cid, float(cid % 2)) for cid in range(1, 8)])
+            # manual resolutions are added by the update
+            with mock.patch.dict(resolution.CONTRACT_RESOLUTIONS, {9: 1.0, 10: 0.0}, clear=True):
+                resolution.update_contract_resolutions()
+
+            # 12 and 13 are unknown contracts
+            cids = np.array([13, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 1])
+            for as_of_date in [None] + [end_date + datetime.timedelta(days=offset)
+                                        for end_date in end_dates for offset in [-1, 0, 1]]:
+                expected = resolution._get_contract_resolution_db(cids.tolist(), as_of_date)
+                values = resolution.resolve(cids, as_of_date)
+                self.assertEqual({cid: None if np.isnan(value) else value for cid, value in zip(cids, values)},
+                                 expected)
+                self.assertEqual(resolution.get_contract_resolution(cids, as_of_date), expected)
+            self.assertEqual(resolution.get_contract_resolution([9, 10, 11]), {9: 1.0, 10: 0.0, 11: None})
+
+
+class UpdateContractResolutionsTest(unittest.TestCase):
+    def _inference(self):
+        res = contract_db.get_contract_db().execute('SELECT contract_id, end_date FROM resolution_inference').fetchall()
+        return dict(res)
+
+    def _update(self, force=False):
+        with mock.patch('builtins.print'), \
+                mock.patch.object(resolution, '_get_final_quotes', side_effect=resolution._get_final_quotes) as quotes:
+            resolution.update_contract_resolutions(force=force)
+        return sorted(cid for call in quotes.call_args_list for cid in call.args[0])
+
+    def test_update(self):
+        day_1, day_2 = datetime.date(2020, 9, 1), datetime.date(2020, 9, 2)
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        with temp_archive(), mock.patch.dict(resolution.CONTRACT_RESOLUTIONS, {6: 0.0}, clear=True):
+            add_contracts({1: (1, day_1), 2: (1, day_1), 3: (1, day_2), 4: (1, tomorrow), 5: (1, day_1),
+                           6: (1, day_2), 7: (1, None)})
+            # 1 resolved yes, 2 inconclusive, 5 not quoted
+            write_market_data(day_1, _quotes([1, 2, 1], [0.5, 0.5, 0.99], [0.6, 0.6, 1.0], [0.5, 0.5, 0.99]))
+
+            self.assertEqual(self._update(), [1, 2, 5])
+            self.assertEqual(resolution.get_contract_resolution(range(1, 8)),
+                             {1: 1.0, 2: None, 3: None, 4: None, 5: None, 6: 0.0, 7: None})
+            # contracts without final quotes or archived market data are retried
+            self.assertEqual(self._inference(), {2: '2020-09-01'})
+
+            write_market_data(day_2, _quotes([3], [0.0], [0.01], [0.01]))
+            self.assertEqual(self._update(), [3, 5])
+            self.assertEqual(resolution.resolve([3])[0], 0.0)
+            self.assertEqual(self._inference(), {2: '2020-09-01'})
+
+            # inconclusive contracts are inspected again once their end date changes, or when forced
+            self.assertEqual(self._update(force=True), [2, 5])
+            with contract_db.get_contract_db() as db:
+                db.execute("UPDATE contract SET end_date = '2020-09-02' WHERE id = 2")
+            self.assertEqual(self._update(), [2, 5])
+            # not quoted on its new end date
+            self.assertEqual(self._inference(), {2: '2020-09-01'})
+            self.assertEqual(self._update(), [2, 5])
@@ -0,0 +1,31 @@
+import unittest
+
+import numpy as np
+
+from pi_trading_lib.scenarios import ScenarioMatrix
+
+
+class ScenarioMatrixTest(unittest.TestCase):
+    def test_sample(self):
+        probs = np.array([0.5, 0.3, 0.2, 0.4, 0.4, 0.9, 0.0, 0.0])
+        market_ids = np.array([1, 1, 1, 2, 2, 3, 4, 4])
+        model_payoffs = np.array([[1, 0], [0, 1]])
+        scenarios = ScenarioMatrix.sample(probs, market_ids, 20000, [(np.array([6, 7]), model_payoffs)])
+        payoffs = scenarios.payoffs.toarray()
+
+        # market 1 always has a single winner, market 2 leaves 20% of scenarios without one
+        np.testing.assert_array_equal(payoffs[:, :3].sum(axis=1), 1)
+        self.assertLessEqual(payoffs[:, 3:5].sum(axis=1).max(), 1)
+        np.testing.assert_allclose(payoffs[:, :6].mean(axis=0), probs[:6], atol=0.02)
+        # model samples replace the sampled probs of the contracts they cover
+        np.testing.assert_array_equal(payoffs[:, 6] + payoffs[:, 7], 1)
+
+        reduced = scenarios.reduce()
+        # 3 outcomes of market 1 and 2, 2 of market 3 and the model samples
+        self.assertEqual(reduced.nscenarios, 3 * 3 * 2 * 2)
+        self.assertAlmostEqual(reduced.weights.sum(), 1.0)
+        np.testing.assert_allclose(reduced.weights @ reduced.payoffs.toarray(), payoffs.mean(axis=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pi_trading_lib.score import SimResult
+
+
+class SimResultTest(unittest.TestCase):
+    def setUp(self):
+        dates = [datetime.date(2020, 1, 1) + datetime.timedelta(days=i) for i in range(3)]
+        daily_summary = pd.DataFrame({'mark_pnl': [0.0, 1.0 / 3, 2.5], 'capital': [100.0, 99.0, 98.0]},
+                                     index=pd.Index(dates, name='date'))
+        daily_cid_summary = pd.DataFrame(
+            {'position': [1.0, 2.0, 3.0], 'name': ['a', None, 'c']},
+            index=pd.MultiIndex.from_arrays([dates, [10, 11, 10]], names=['date', 'cid'])
+        )
+        cid_summary = pd.DataFrame({'position': [1.0, 2.0], 'name': ['a', 'b']}, index=pd.Index([10, 11], name='cid'))
+        fillstats = pd.DataFrame({'cid': [10], 'date': ['20200101'], 'qty': [1.5]}, index=pd.Index([1], name='fill_id'))
+        book_summary = pd.DataFrame({'capital': [98.0], 'mark_pnl': [2.5]})
+        self.result = SimResult(book_summary, cid_summary, daily_summary, daily_cid_summary, fillstats)
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for fmt in ['npz', 'csv']:
+                self.result.path = os.path.join(tmpdir, fmt)
+                self.result.dump(fmt)
+                loaded = SimResult.load(self.result.path)
+
+                self.assertEqual(loaded.ndays, 3)
+                self.assertEqual(loaded.daily_summary.index.dtype.kind, 'M')
+                if fmt == 'npz':
+                    # full precision, lazily loaded
+                    self.assertEqual(loaded.daily_summary['mark_pnl'].iloc[1], 1.0 / 3)
+                    self.assertEqual(list(loaded._tables), ['daily_summary'])
+                    self.assertEqual(loaded.fillstats.loc[1, 'date'], '20200101')
+                self.assertTrue(np.isnan(loaded.daily_cid_summary.xs(11, level='cid')['name'].iloc[0]))
+                self.assertEqual(loaded.cid_summary.loc[11, 'name'], 'b')
+                self.assertEqual(loaded.book_summary.index.tolist(), [0])
@@ -0,0 +1,79 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from pi_trading_lib.score import SimResult
+import pi_trading_lib.model_config as model_config
+import pi_trading_lib.sim as sim
+import pi_trading_lib.sim_catalog as sim_catalog
+import pi_trading_lib.work_dir as work_dir
+
+
+def _result(path: str, daily_pnl) -> SimResult:
+    """Result with only a daily summary, marked with the cumulative daily_pnl"""
+    daily_summary = pd.DataFrame({'mark_pnl': np.cumsum(daily_pnl)},
+                                 index=pd.Index(pd.date_range('2020-09-01', periods=len(daily_pnl)), name='date'))
+    empty = pd.DataFrame()
+    return SimResult(empty, empty, daily_summary, empty, empty, path=path)
+
+
+class SimCatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.work_dir = work_dir._work_dir
+        work_dir.set_work_dir(self.tmpdir.name)
+        self.begin_date, self.end_date = datetime.date(2020, 9, 1), datetime.date(2020, 9, 5)
+        self.config = model_config.get_config('current')
+
+    def tearDown(self):
+        sim_catalog.get_catalog_db().close()
+        sim_catalog._get_catalog_db.cache_clear()
+        work_dir.set_work_dir(self.work_dir)
+        self.tmpdir.cleanup()
+
+    def test_record_and_query(self):
+        runs = {
+            'sim/a': (self.config.override({'capital': 1000}), [0.0, 1.0, 2.0, 1.0, 3.0]),
+            'sim/b': (self.config.override({'capital': 2000}), [0.0, 1.0, -1.0, 1.0, -1.0]),
+            'sim/c': (self.config.override({'capital': 2000, 'optimizer-take-edge': 0.05}), [0.0, 2.0, 2.1, 1.9, 2.0]),
+        }
+        for path, (config, daily_pnl) in runs.items():
+            sim_catalog.record_run(_result(path, daily_pnl), config, self.begin_date, self.end_date)
+        # recording a path again replaces the run
+        sim_catalog.record_run(_result('sim/b', [0.0, 1.0, -1.0, 1.0, -2.0]), runs['sim/b'][0],
+                               self.begin_date, self.end_date)
+
+        all_runs = sim_catalog.query_runs()
+        self.assertEqual(sorted(all_runs.index), ['sim/a', 'sim/b', 'sim/c'])
+        self.assertEqual(all_runs.loc['sim/b', 'pnl'], -1.0)
+        self.assertEqual(all_runs.loc['sim/a', 'ndays'], 5)
+        self.assertAlmostEqual(all_runs.loc['sim/a', 'sharpe'], _result('sim/a', runs['sim/a'][1]).sharpe)
+
+        # int and float param values match
+        self.assertEqual(sorted(sim_catalog.query_runs(where={'capital': 2000.0}).index), ['sim/b', 'sim/c'])
+        self.assertEqual(sim_catalog.query_runs(where={'capital': 2000, 'optimizer-take-edge': 0.05}).index.tolist(),
+                         ['sim/c'])
+        self.assertEqual(len(sim_catalog.query_runs(end_date=datetime.date(2020, 9, 6))), 0)
+
+        ranked = sim_catalog.query_runs(order_by='sharpe', limit=2, begin_date=self.begin_date)
+        self.assertEqual(ranked.index.tolist(), ['sim/c', 'sim/a'])
+        self.assertEqual(sim_catalog.query_runs(order_by='pnl', ascending=True).index.tolist(),
+                         ['sim/b', 'sim/a', 'sim/c'])
+
+        diff = sim_catalog.diff_runs(['sim/a', 'sim/c'])
+        self.assertEqual(diff.index.tolist(), ['capital', 'optimizer-take-edge'] + sim_catalog.STAT_COLUMNS)
+        self.assertEqual(diff.loc['capital'].tolist(), [1000, 2000])
+        self.assertEqual(diff.loc['pnl'].tolist(), [7.0, 8.0])
+
+    def test_cached_run_not_recorded(self):
+        result_uri = work_dir.get_uri('sim', self.config, date_1=self.end_date)
+        os.makedirs(result_uri)
+        with mock.patch.object(sim_catalog, 'record_run') as record_run:
+            result = sim.daily_sim(self.begin_date, self.end_date, self.config)
+        self.assertEqual(result.path, result_uri)
+        record_run.assert_not_called()
@@ -0,0 +1,86 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from pi_trading_lib.model import Model
+import pi_trading_lib.data.data_archive as data_archive
+import pi_trading_lib.model_config as model_config
+import pi_trading_lib.sim as sim
+import pi_trading_lib.work_dir as work_dir
+
+
+class PreparedModel(Model):
+    """Prices from state written by prepare, logs the dates computed by each process to the work dir"""
+    def prepare(self, config, dates):
+        prices = pd.Series(np.arange(len(dates)) / 100, index=[date.isoformat() for date in dates])
+        prices.to_csv(os.path.join(work_dir.get_work_dir(), 'prepared.csv'))
+
+    def _prepared(self, date):
+        prices = pd.read_csv(os.path.join(work_dir.get_work_dir(), 'prepared.csv'), index_col=0).iloc[:, 0]
+        return prices.loc[date.isoformat()]
+
+    def _compute(self, config, dates):
+        with open(os.path.join(work_dir.get_work_dir(), f'computed_{os.getpid()}.txt'), 'a') as f:
+            f.write(''.join(date.isoformat() + '\n' for date in dates))
+        return super()._compute(config, dates)
+
+    def get_universe(self, config, date):
+        return np.arange(date.day % 3, 5)
+
+    def get_price(self, config, date):
+        universe = self.get_universe(config, date)
+        return pd.Series(self._prepared(date) + universe / 10, index=universe)
+
+    def get_factor(self, config, date):
+        return None if date.day % 2 else pd.Series(1.0, index=self.get_universe(config, date))
+
+    @property
+    def name(self):
+        return 'prepared-model'
+
+
+class PrecomputeModelOutputsTest(unittest.TestCase):
+    def test_workers_match_serial(self):
+        config = model_config.get_config('current')
+        dates = [datetime.date(2020, 9, 1) + datetime.timedelta(days=i) for i in range(7)]
+        old_archive_dir, old_work_dir = data_archive._archive_dir, work_dir._work_dir
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_archive.set_archive_dir(tmp_dir)
+            work_dir.set_work_dir(tmp_dir)
+            try:
+                outputs = sim.precompute_model_outputs([PreparedModel(), PreparedModel()], config, dates, workers=3)
+                logs = [name for name in os.listdir(tmp_dir) if name.startswith('computed_')]
+                chunks = []
+                for name in logs:
+                    with open(os.path.join(tmp_dir, name)) as f:
+                        chunks.append([datetime.date.fromisoformat(line.rstrip()) for line in f])
+                    os.remove(os.path.join(tmp_dir, name))
+
+                serial_model = PreparedModel()
+                serial_model.prepare(config, dates)
+                expected = serial_model.compute(config, dates)
+            finally:
+                data_archive._archive_dir = old_archive_dir
+                work_dir.set_work_dir(old_work_dir)
+
+        # each worker computes a contiguous chunk of dates once per model, both models log the chunk
+        self.assertEqual(len(chunks), 3)
+        for chunk in chunks:
+            self.assertEqual(chunk[:len(chunk) // 2], chunk[len(chunk) // 2:])
+            self.assertEqual(chunk[:len(chunk) // 2], dates[dates.index(chunk[0]):][:len(chunk) // 2])
+        self.assertEqual(sorted(date for chunk in chunks for date in chunk[:len(chunk) // 2]), dates)
+
+        self.assertEqual(list(outputs), dates)
+        for date in dates:
+            expected_output = expected.get(date)
+            for output in outputs[date]:
+                np.testing.assert_array_equal(output.universe, expected_output.universe)
+                np.testing.assert_array_equal(output.price, expected_output.price)
+                if expected_output.factor is None:
+                    self.assertIsNone(output.factor)
+                else:
+                    np.testing.assert_array_equal(output.factor, expected_output.factor)
@@ -0,0 +1,89 @@
+import datetime
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+import pi_trading_lib.data.contract_db as contract_db
+import pi_trading_lib.data.data_archive as data_archive
+import pi_trading_lib.data.history as history
+import pi_trading_lib.datetime_ext as datetime_ext
+import pi_trading_lib.scripts.update_contract_db as update_contract_db
+from pi_trading_lib.test.helpers import temp_archive, write_market_data
+
+DATES = [datetime.date(2020, 9, 1), datetime.date(2020, 9, 2), datetime.date(2020, 9, 3)]
+# contract 11 ends on the second date, 12 is listed on it
+DATE_CONTRACTS = [[10, 11], [10, 11, 12], [10, 12]]
+
+
+def _archive_dates():
+    for date, cids in zip(DATES, DATE_CONTRACTS):
+        raw_path = data_archive.get_data_file('market_data_raw', {'date': date})
+        os.makedirs(os.path.dirname(raw_path), exist_ok=True)
+        with open(raw_path, 'w') as f:
+            contracts = [{'id': cid, 'name': f'contract {cid}'} for cid in cids]
+            f.write(json.dumps({'market_updates': {'1': {'id': 1, 'name': 'market 1', 'contracts': contracts}}}) + '\n')
+        quotes = pd.DataFrame({'contract_id': cids * 2, 'market_id': 1, 'bid_price': 0.4, 'ask_price': 0.45,
+                               'trade_price': 0.4})
+        quotes.loc[len(cids):, 'bid_price'] = 0.42
+        write_market_data(date, quotes)
+
+
+def _run(*args):
+    argv = ['update_contract_db', '--data-archive', data_archive.get_archive_dir()] + list(args)
+    with mock.patch.object(sys, 'argv', argv), mock.patch('builtins.print'), \
+            mock.patch.object(update_contract_db.timers, 'report_timers'):
+        update_contract_db.main()
+
+
+def _tables():
+    db = contract_db.get_contract_db()
+    return {table: sorted(db.execute(f'SELECT * FROM {table}').fetchall())
+            for table in ['market', 'contract', 'daily_history', 'update_state']}
+
+
+class UpdateContractDbTest(unittest.TestCase):
+    def test_incremental(self):
+        with temp_archive():
+            _archive_dates()
+            with mock.patch.object(update_contract_db, '_process_day',
+                                   side_effect=update_contract_db._process_day) as process_day:
+                _run('--begin-date', datetime_ext.to_str(DATES[0]), '--end-date', datetime_ext.to_str(DATES[1]))
+                self.assertEqual(contract_db.get_last_update_date(update_contract_db.UPDATE_NAME), DATES[1])
+
+                # resumes from the day after the last processed date
+                _run('--incremental', '--begin-date', datetime_ext.to_str(DATES[0]),
+                     '--end-date', datetime_ext.to_str(DATES[2]))
+                self.assertEqual([call.args[0] for call in process_day.call_args_list], DATES)
+            self.assertEqual(contract_db.get_last_update_date(update_contract_db.UPDATE_NAME), DATES[2])
+            serial = _tables()
+
+        contracts = {row[0]: row for row in serial['contract']}
+        self.assertEqual(contracts[11][5], '2020-09-02')
+        self.assertEqual((contracts[12][3], contracts[12][5]), ('2020-09-02', None))
+        self.assertEqual(len(serial['daily_history']), 7 * len(history.HISTORY_METRICS))
+
+        with temp_archive():
+            _archive_dates()
+            _run('--begin-date', datetime_ext.to_str(DATES[0]), '--end-date', datetime_ext.to_str(DATES[2]),
+                 '--workers', '2')
+            self.assertEqual(_tables(), serial)
+
+    def test_failed_day(self):
+        with temp_archive():
+            _archive_dates()
+            _run('--begin-date', datetime_ext.to_str(DATES[0]), '--end-date', datetime_ext.to_str(DATES[0]))
+            before = _tables()
+
+            # contract updates of the day are rolled back with its history, so the day is processed again
+            with mock.patch.object(history, 'apply_history', side_effect=IOError('disk full')):
+                with self.assertRaises(IOError):
+                    _run('--incremental', '--end-date', datetime_ext.to_str(DATES[2]))
+            self.assertEqual(_tables(), before)
+
+            _run('--incremental', '--end-date', datetime_ext.to_str(DATES[2]))
+            self.assertEqual(contract_db.get_last_update_date(update_contract_db.UPDATE_NAME), DATES[2])
+            self.assertEqual(len(_tables()['contract']), 3)
@@ -1,56 +1,62 @@
+import threading
 import time
 import typing as t
 
 
-_owned_time_stack: t.List[float] = []
-_last_event: float = time.time()
+class _ThreadState(threading.local):
+    """Owned time bookkeeping, kept per thread so timed functions can also run in background threads"""
+
+    def __init__(self):
+        self.owned_time_stack: t.List[float] = []
+        self.last_event: float = time.time()
+
+
+_thread_state = _ThreadState()
 
 
 class FunctionTimer:
-    """Not thread-safe function timer"""
+    """Function timer, time is owned by the innermost timed function running in the same thread"""
 
     def __init__(self):
         self.sum_ = 0.0
         self.owned_sum = 0.0
         self.count = 0
-        self.owned_time_stack: t.List[float] = []
-        self.last_event: float = time.time()
+        self.thread_state = _ThreadState()
+        self.lock = threading.Lock()
 
     def start(self):
-        global _last_event
-
         start_time = time.time()
-        if len(_owned_time_stack):
-            _owned_time_stack[-1] += start_time - _last_event
-        if len(self.owned_time_stack):
-            self.owned_time_stack[-1] += start_time - self.last_event
+        if len(_thread_state.owned_time_stack):
+            _thread_state.owned_time_stack[-1] += start_time - _thread_state.last_event
+        if len(self.thread_state.owned_time_stack):
+            self.thread_state.owned_time_stack[-1] += start_time - self.thread_state.last_event
 
-        _owned_time_stack.append(0.0)
-        self.owned_time_stack.append(0.0)
-        _last_event = start_time
-        self.last_event = start_time
+        _thread_state.owned_time_stack.append(0.0)
+        self.thread_state.owned_time_stack.append(0.0)
+        _thread_state.last_event = start_time
+        self.thread_state.last_event = start_time
 
     def stop(self):
-        global _last_event
-        assert len(self.owned_time_stack) > 0
-        assert len(_owned_time_stack) > 0
+        assert len(self.thread_state.owned_time_stack) > 0
+        assert len(_thread_state.owned_time_stack) > 0
 
         end_time = time.time()
-        _owned_time_stack[-1] += end_time - _last_event
-        self.owned_time_stack[-1] += end_time - self.last_event
+        _thread_state.owned_time_stack[-1] += end_time - _thread_state.last_event
+        self.thread_state.owned_time_stack[-1] += end_time - self.thread_state.last_event
 
-        overall_owned_time = _owned_time_stack.pop()
-        func_owned_time = self.owned_time_stack.pop()
+        overall_owned_time = _thread_state.owned_time_stack.pop()
+        func_owned_time = self.thread_state.owned_time_stack.pop()
 
         self.sample(func_owned_time, overall_owned_time)
 
-        _last_event = end_time
-        self.last_event = end_time
+        _thread_state.last_event = end_time
+        self.thread_state.last_event = end_time
 
     def sample(self, val, owned_val):
-        self.sum_ += val
-        self.owned_sum += owned_val
-        self.count += 1
+        with self.lock:
+            self.sum_ += val
+            self.owned_sum += owned_val
+            self.count += 1
 
     def report(self):
         if self.count == 0:
@@ -85,6 +91,13 @@ def timer(func: t.Callable[..., T]) -> t.Callable[..., T]:
     return decorated_func
 
 
+def record(name: str, elapsed: float):
+    """Adds a sample of elapsed seconds to timer name, for time that isn't spent in a single function call"""
+    if name not in _function_timers:
+        _function_timers[name] = FunctionTimer()
+    _function_timers[name].sample(elapsed, elapsed)
+
+
 def report_timers():
     def print_format(name, sum_, avg, owned_sum, count):
         print(f'{name:50.50} {sum_:10} {avg:10} {owned_sum:10} {count:<6}')